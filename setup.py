@@ -8,7 +8,7 @@ setup(
     author='Pedro Boechat',
     author_email='pboechat@gmail.com',
     package_dir={'': 'src'},
-    py_modules=['text2jira'],
+    py_modules=['text2jira', 'text2jira_gui', 'text2jira_service', 'text2jira_storage'],
     install_requires = [
         "certifi==2017.4.17",
         "chardet==3.0.4",
@@ -1,125 +1,1452 @@
 import argparse
+import difflib
+import glob
+import hashlib
+import json
+import os
+import random
 import re
-import sqlite3
-import tkinter as tk
-import tkinter.ttk as ttk
-import traceback
-from tkinter.filedialog import askopenfilename
-from tkinter.messagebox import showinfo, showerror
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from types import SimpleNamespace
 
-from jira import JIRA
+from text2jira_storage import get_connection, transaction
 
 MAX_RESULTS = 100000
+# page size of paged REST resources (the server caps most of them at 50)
+PAGE_SIZE = 50
+METADATA_CACHE_TTL = 24 * 60 * 60
+# default value of jira.bulk.create.max.issues.per.request on the server
+BULK_CREATE_MAX_ISSUES = 50
+# lookups in flight while resolving what a run depends on
+PREFLIGHT_MAX_LOOKUPS = 8
+# most issues the agile REST API accepts in a request moving issues to an epic or a sprint
+ATTACH_MAX_ISSUES = 50
+ENGINES = ('sync', 'async')
+# chunks of a plan parsed in parallel per process, to even out the load of the processes
+PARSE_CHUNKS_PER_PROCESS = 4
+# characters read at a time by the fast parser of a stream
+PARSE_BLOCK_SIZE = 1 << 20
+# run: parse and create; compile: parse and resolve into a payload file; replay: create the issues of a payload file
+COMMANDS = ('run', 'compile', 'replay', 'serve')
+PAYLOAD_FORMAT = 'text2jira-payload'
+PAYLOAD_VERSION = 1
+# what to do with a task whose summary matches an issue of the project
+DEDUPE_MODES = ('skip', 'link')
+# issues asked for per page of summaries (the server caps it, at 1000 by default)
+SUMMARY_INDEX_PAGE_SIZE = 1000
+# answers of a busy server that didn't process the request, retried by the rate governor whatever the method
+RETRYABLE_STATUS_CODES = (429, 503)
+# answers of a gateway, which may have passed the request on: only retried for idempotent methods (and so are
+# connection errors)
+IDEMPOTENT_RETRYABLE_STATUS_CODES = (502, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+MAX_RETRIES = 6
+# seconds of the first backoff of a retried request, doubled on every retry up to BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.0
+# requests per second the rate governor never goes below
+MIN_RATE = 1.0
+# fraction of its rate the rate governor gains every second the server doesn't throttle
+RATE_GROWTH = 0.1
+# seconds the rate learned from a server is kept for the next runs
+RATE_STATE_TTL = 60 * 60
+
+_PROJECT_KEY_MATCHER = re.compile(r'^[A-Z][A-Z0-9_]+$')
+_ASSIGNEE_MATCHER = re.compile(r"""(.*)\[([a-zA-z0-9]+)\]$""")
+# code and rest of every task, sub-task and description line, matched over a whole buffer
+_LINE_MATCHER = re.compile(r'^[^\S\n]*([-+*])(.*)$', re.MULTILINE)
+
+
+def _count_issues(issue_dicts):
+    return sum(1 + _count_issues(issue_dict['sub_issues']) for issue_dict in issue_dicts)
+
+
+def _format_failures(failures, action='create'):
+    lines = ['failed to {} {} issue(s):'.format(action, len(failures))]
+    for issue_dict, _, error in failures:
+        if isinstance(error, dict):
+            error = '; '.join('{}: {}'.format(field, message) for field, message in error.items())
+        line = 'line {}: \'{}\': {}'.format(issue_dict.get('line', '?'), issue_dict['summary'], error)
+        skipped = _count_issues(issue_dict['sub_issues'])
+        if skipped:
+            line += ' ({} sub-task(s) skipped)'.format(skipped)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+class _CreationPlan:
+    """Order in which the issues of a run are sent to the server, as batches of ``(issue_dict, parent_key)`` pairs.
+
+    Batches are independent of each other, except that a sub-task is only sent once the key of its parent is known.
+    Full batches of sub-tasks go first, then new batches of tasks, then whatever sub-tasks are left.
+    ``issue_dicts`` may be a lazy stream: ``pull_task_batch()`` reads the next batch of tasks ahead of time.
+    ``sub_issues`` seeds the plan with ``(sub_issue_dict, parent_key)`` pairs whose parents already exist.
+    ``existing_key(issue_dict, parent_key)`` returns the key of an issue that doesn't need to be created (tasks are
+    asked in stream order), and ``on_created(created)`` is called with the ``(issue_dict, parent_key, key)`` of the
+    issues of every created batch.
+    ``progress(done, failures)`` is called as batches complete, with the ``(issue_dict, parent_key, key)`` of the issues
+    created (or reused) and the failures since the last call. Once ``cancel_event`` is set, there is no next batch.
+    Without ``keep_results``, the tasks and the keys of the issues aren't kept once done (``progress`` is the only
+    report of the created issues), so that a stream runs in a flat memory.
+    """
+
+    def __init__(self, issue_dicts, bulk_size, *, sub_issues=(), existing_key=None, on_created=None, progress=None,
+                 cancel_event=None, keep_results=True):
+        # only the keys of the created issues are kept, not the resources the server returned
+        self.created_keys = {}
+        self._keep_results = keep_results
+        self.failures = []
+        self.top_level_issue_dicts = []
+        self._tasks = iter(issue_dicts)
+        self._bulk_size = bulk_size
+        self._sub_issue_queue = deque(sub_issues)
+        self._next_task_batch = None
+        self._reused = []
+        self._existing_key = existing_key
+        self._on_created = on_created
+        self._progress = progress
+        self._cancel_event = cancel_event
+
+    def _cancelled(self):
+        return self._cancel_event is not None and self._cancel_event.is_set()
+
+    def _reuse(self, issue_dict, parent_key, key):
+        if self._keep_results:
+            self.created_keys[id(issue_dict)] = key
+        self._reused.append((issue_dict, parent_key, key))
+        self._enqueue_sub_issues(issue_dict, key)
+
+    def _pop_sub_issues(self, count):
+        return [self._sub_issue_queue.popleft() for _ in range(count)]
+
+    def _enqueue_sub_issues(self, issue_dict, key):
+        for sub_issue_dict in issue_dict['sub_issues']:
+            sub_issue_key = self._existing_key(sub_issue_dict, key) if self._existing_key is not None else None
+            if sub_issue_key is None:
+                self._sub_issue_queue.append((sub_issue_dict, key))
+            else:
+                self._reuse(sub_issue_dict, key, sub_issue_key)
 
+    def pull_task_batch(self):
+        if self._next_task_batch is not None or self._cancelled():
+            return
+        self._next_task_batch = []
+        while len(self._next_task_batch) < self._bulk_size:
+            issue_dict = next(self._tasks, None)
+            if issue_dict is None:
+                break
+            if self._keep_results:
+                self.top_level_issue_dicts.append(issue_dict)
+            key = self._existing_key(issue_dict, None) if self._existing_key is not None else None
+            if key is None:
+                self._next_task_batch.append((issue_dict, None))
+            else:
+                self._reuse(issue_dict, None, key)
 
-def create_issues_in_jira(*, issue_dicts, server_url, basic_auth, project_name, board_name, assignee_key, components,
-                          epic_link, max_results):
-    jira = JIRA(server=server_url, basic_auth=basic_auth)
-
-    def get_board(board_name):
-        for board in jira.boards():
-            if board.name == board_name:
-                return board
+    def next_batch(self):
+        """The next batch to send, or ``None`` when nothing can be sent until a batch in flight completes."""
+        if self._cancelled():
+            return None
+        if len(self._sub_issue_queue) >= self._bulk_size:
+            return self._pop_sub_issues(self._bulk_size)
+        self.pull_task_batch()
+        if self._next_task_batch:
+            batch, self._next_task_batch = self._next_task_batch, None
+            return batch
+        if self._sub_issue_queue:
+            return self._pop_sub_issues(len(self._sub_issue_queue))
         return None
 
-    def get_project(project_name):
-        for project in jira.projects():
-            if project.name == project_name:
-                return project
+    def complete(self, batch, results):
+        """Record the results of a batch, one per issue (see ``JIRA.create_issues``)."""
+        assert len(results) == len(batch)
+        created = []
+        failures = []
+        for (issue_dict, parent_key), result in zip(batch, results):
+            if result['status'] != 'Success':
+                failures.append((issue_dict, parent_key, result['error']))
+                continue
+            key = result['issue'].key
+            if self._keep_results:
+                self.created_keys[id(issue_dict)] = key
+            created.append((issue_dict, parent_key, key))
+            self._enqueue_sub_issues(issue_dict, key)
+        self.failures.extend(failures)
+        if self._on_created is not None and created:
+            self._on_created(created)
+        self.report_progress(created, failures)
+
+    def report_progress(self, created=(), failures=()):
+        if self._progress is not None and (self._reused or created or failures):
+            self._progress(self._reused + list(created), list(failures))
+        del self._reused[:]
+
+
+def _create_batch(jira, issue_fields, batch):
+    return jira.create_issues([issue_fields(issue_dict, parent_key) for issue_dict, parent_key in batch],
+                              prefetch=False)
+
+
+def _creation_loop(plan, submit, workers):
+    """Send the batches of ``plan`` with up to ``workers`` of them in flight, completing them as they're done.
+
+    The loop of both engines: ``submit(batch)`` returns a future of the results of a batch, and the loop yields the
+    futures in flight to be sent back the ones that are done. After a cancellation, the batches in flight are still
+    awaited. So are they when a batch raises: no new batch is sent, the ones in flight are completed (their issues
+    journaled) and the first error is raised.
+    """
+    error = None
+    in_flight = {}
+    while True:
+        while error is None and len(in_flight) < workers:
+            batch = plan.next_batch()
+            if batch is None:
+                break
+            in_flight[submit(batch)] = batch
+        if not in_flight:
+            break
+        if error is None:
+            plan.pull_task_batch()
+        done = yield in_flight
+        for future in done:
+            batch = in_flight.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            plan.complete(batch, results)
+    plan.report_progress()
+    if error is not None:
+        raise error
+
+
+def _schedule_issue_creation(*, jira, issue_dicts, issue_fields, bulk_size, workers, **plan_options):
+    """Create issues in bulk batches (see ``_CreationPlan`` and ``_creation_loop``) on a pool of ``workers`` threads.
+
+    Returns ``(created_keys, failures, top_level_issue_dicts)``. The hooks of the plan are called on the calling
+    thread.
+    """
+    plan = _CreationPlan(issue_dicts, bulk_size, **plan_options)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        loop = _creation_loop(plan, lambda batch: executor.submit(_create_batch, jira, issue_fields, batch), workers)
+        try:
+            in_flight = next(loop)
+            while True:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight = loop.send(done)
+        except StopIteration:
+            pass
+    return plan.created_keys, plan.failures, plan.top_level_issue_dicts
+
+
+async def _schedule_issue_creation_async(call, *, jira, issue_dicts, issue_fields, bulk_size, workers,
+                                         **plan_options):
+    """``_schedule_issue_creation`` as a coroutine, with every batch sent through ``call`` (see ``_run_async``)."""
+    import asyncio
+    plan = _CreationPlan(issue_dicts, bulk_size, **plan_options)
+    loop = _creation_loop(plan, lambda batch: asyncio.ensure_future(call(_create_batch, jira, issue_fields, batch)),
+                          workers)
+    try:
+        in_flight = next(loop)
+        while True:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            in_flight = loop.send(done)
+    except StopIteration:
+        pass
+    return plan.created_keys, plan.failures, plan.top_level_issue_dicts
+
+
+def _run_async(limit, coroutine_function, *args, **kwargs):
+    """Run ``coroutine_function(call, *args, **kwargs)`` on an event loop and return its result.
+
+    ``call(func, *args)`` is awaited to run a blocking jira call on a thread of its own, with at most ``limit`` calls
+    in flight at a time.
+    """
+    # asyncio is only imported once a run talks to a server (every run's preflight, and the async engine)
+    import asyncio
+
+    async def _main():
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(limit)
+
+        async def call(func, *call_args):
+            async with semaphore:
+                return await loop.run_in_executor(executor, func, *call_args)
+
+        return await coroutine_function(call, *args, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=limit) as executor:
+        return asyncio.run(_main())
+
+
+def _parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (a delay in seconds or an HTTP date), ``None`` when there's none."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
         return None
 
-    project = get_project(project_name)
-    if not project:
-        raise Exception('project not found: \'{}\''.format(board_name))
 
-    board = get_board(board_name)
-    if not board:
-        raise Exception('board not found: \'{}\''.format(board_name))
+class RateGovernor:
+    """Client-side rate limit of the requests sent to a server, adapted to the throttling of the server.
+
+    Requests take tokens from a bucket refilled at ``rate`` requests per second. The rate is unlimited until the server
+    first answers 429: it's then set to half of the rate requests were sent at over the last second and, from there,
+    halved on every 429 and raised by ``RATE_GROWTH`` of itself per second while requests succeed. A Retry-After
+    header (of any retried answer) pauses all the requests for that long. Requests answered with one of
+    ``RETRYABLE_STATUS_CODES`` (and, when idempotent, requests answered with one of
+    ``IDEMPOTENT_RETRYABLE_STATUS_CODES`` or failing to connect) are retried up to ``MAX_RETRIES`` times, after the
+    Retry-After delay or a jittered exponential backoff.
+    There's one governor per server in a process (see ``for_server``), so concurrent runs share its budget. With
+    ``shared``, the rate and the pauses are also shared through text2jira.db with other processes and the next runs.
+    """
+
+    _governors = {}
+    _governors_lock = threading.Lock()
+
+    def __init__(self, server_url, *, shared=True, sync_interval=1.0):
+        self._server_url = server_url
+        self._shared = shared
+        self._sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._rate = None
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._slowed_down_at = 0.0
+        self._sent_at = deque()
+        self._synced_at = 0.0
+        self._state_version = 0.0
+        if shared:
+            self._sync_shared_state(time.monotonic())
 
-    component_ids = None
-    if components is not None:
-        component_objs = jira.project_components(project)
+    @classmethod
+    def for_server(cls, server_url):
+        """The governor of ``server_url`` shared by the runs of this process."""
+        with cls._governors_lock:
+            if server_url not in cls._governors:
+                cls._governors[server_url] = cls(server_url)
+            return cls._governors[server_url]
+
+    @property
+    def rate(self):
+        """Requests per second currently allowed, ``None`` when unlimited."""
+        return self._rate
+
+    def _sync_shared_state(self, now):
+        # adopts the pauses and the lower rates saved by others since the last sync (called with the lock held)
+        self._synced_at = now
+        row = get_connection().execute('SELECT rate, paused_until, updated_at FROM rate_governor WHERE server_url = ?',
+                                       (self._server_url,)).fetchone()
+        if row is None:
+            return
+        rate, paused_until, updated_at = row
+        if updated_at <= self._state_version or updated_at < time.time() - RATE_STATE_TTL:
+            return
+        self._state_version = updated_at
+        self._paused_until = max(self._paused_until, now + paused_until - time.time())
+        if self._rate is None or rate < self._rate:
+            self._rate = rate
+            self._tokens = min(self._tokens, 1.0)
+
+    def _save_shared_state(self, now):
+        self._state_version = time.time()
+        get_connection().execute('''INSERT OR REPLACE INTO rate_governor (server_url, rate, paused_until, updated_at)
+                                    VALUES (?, ?, ?, ?)''',
+                                 (self._server_url, self._rate, self._paused_until - now + self._state_version,
+                                  self._state_version))
+
+    def acquire(self):
+        """Block until a request can be sent, and return when it was allowed (``time.monotonic()``)."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._shared and now - self._synced_at >= self._sync_interval:
+                    self._sync_shared_state(now)
+                wait_time = self._paused_until - now
+                if wait_time <= 0 and self._rate is not None:
+                    # the bucket holds a second of requests
+                    self._tokens = min(max(1.0, self._rate), self._tokens + (now - self._refilled_at) * self._rate)
+                    self._refilled_at = now
+                    wait_time = (1.0 - self._tokens) / self._rate
+                if wait_time <= 0:
+                    if self._rate is not None:
+                        self._tokens -= 1.0
+                    self._sent_at.append(now)
+                    while now - self._sent_at[0] > 1.0:
+                        self._sent_at.popleft()
+                    return now
+            time.sleep(wait_time)
+
+    def succeeded(self):
+        with self._lock:
+            if self._rate is not None:
+                # as many successes as the rate in a second
+                self._rate += RATE_GROWTH
+
+    def throttled(self, retry_after=None, sent_at=None):
+        """Slow down after a 429, pausing all the requests for ``retry_after`` seconds when the server asked to.
+
+        A request ``sent_at`` (see ``acquire``) before the last slow down doesn't slow down again: it was sent at the
+        rate the server already complained about.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if sent_at is None or sent_at >= self._slowed_down_at:
+                if self._rate is None:
+                    # the rate the requests of the last second were sent at
+                    self._rate = len(self._sent_at) / max(now - self._sent_at[0], 0.1) if self._sent_at else MIN_RATE
+                self._rate = max(MIN_RATE, self._rate / 2)
+                self._slowed_down_at = now
+            self._pause(now, retry_after)
+
+    def pause(self, seconds):
+        """Pause all the requests for ``seconds``, without slowing down (e.g. the Retry-After of a 503)."""
+        with self._lock:
+            self._pause(time.monotonic(), seconds)
+
+    def _pause(self, now, seconds):
+        # (called with the lock held)
+        if seconds is not None:
+            self._paused_until = max(self._paused_until, now + seconds)
+        # no burst when the requests resume
+        self._tokens = 0.0
+        self._refilled_at = max(now, self._paused_until)
+        # the shared state has a rate: the pauses of an unlimited governor stay in the process
+        if self._shared and self._rate is not None:
+            self._save_shared_state(now)
+
+    def call(self, func, *args, idempotent=True, **kwargs):
+        """Call ``func`` (which sends a single request) within the rate, retrying it while the server is busy.
+
+        A request that isn't ``idempotent`` (e.g. a bulk create) is only retried when the server answered that it
+        didn't process it: after a gateway error or a lost connection, sending it again could apply it twice.
+        A ``func`` returning a response (``status_code`` and ``headers``) instead of raising is governed the same: the
+        response of the last attempt is returned when it still has a retryable status.
+        """
+        attempt = 0
+        while True:
+            sent_at = self.acquire()
+            error = None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error, response = e, getattr(e, 'response', None)
+                status_code = getattr(e, 'status_code', None)
+            else:
+                # the session of the jira 1.x client checks the status above the request (jira 3.x raises within it)
+                response, status_code = result, getattr(result, 'status_code', None)
+                if status_code not in RETRYABLE_STATUS_CODES + IDEMPOTENT_RETRYABLE_STATUS_CODES:
+                    self.succeeded()
+                    return result
+            retryable = status_code in RETRYABLE_STATUS_CODES or idempotent and (
+                status_code in IDEMPOTENT_RETRYABLE_STATUS_CODES
+                or status_code is None and _is_connection_error(error))
+            if not retryable or attempt >= MAX_RETRIES:
+                if error is not None:
+                    raise error
+                return result
+            retry_after = _parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+            if status_code == 429:
+                self.throttled(retry_after, sent_at)
+            elif retry_after is not None:
+                # a server under maintenance tells when to come back (the retry waits for the pause in acquire)
+                self.pause(retry_after)
+            if retry_after is None:
+                # full jitter, so that requests failing together aren't retried together
+                time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+            attempt += 1
+
+
+def _is_connection_error(error):
+    # connection errors and timeouts of requests (only imported by runs talking to a server) or of the socket
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    requests_exceptions = sys.modules.get('requests.exceptions')
+    return requests_exceptions is not None and isinstance(error, (requests_exceptions.ConnectionError,
+                                                                  requests_exceptions.Timeout))
+
+
+def _govern(jira, governor):
+    # every request of the client goes through the governor, which retries instead of the session: with jira 3.x, the
+    # request raises on error statuses; with jira 1.x (the pinned version), it returns them to the session's verb
+    # methods, which check them after the governor did
+    session = jira._session
+    session.max_retries = 0
+    request = session.request
+
+    def _request(method, url, **kwargs):
+        return governor.call(request, method, url, idempotent=method.upper() in IDEMPOTENT_METHODS, **kwargs)
+
+    session.request = _request
+
+
+def _connect(server_url, basic_auth, pool_size=None):
+    # the jira client (and its HTTP stack) is only imported when a run actually talks to a server
+    from jira import JIRA
+    jira = JIRA(server=server_url, basic_auth=basic_auth)
+    _govern(jira, RateGovernor.for_server(server_url))
+    if pool_size is not None:
+        # keep a connection per concurrent request instead of reopening the ones beyond the default pool size
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        jira._session.mount('http://', adapter)
+        jira._session.mount('https://', adapter)
+    return jira
+
+
+def _update_issue(jira, key, fields):
+    # a single PUT: Issue.update() would need the issue to be fetched first, and fetches it again afterwards
+    jira._session.put(jira._get_url('issue/{}'.format(key)), data=json.dumps(dict(fields=fields)))
+
+
+def _is_not_found(e):
+    return getattr(e, 'status_code', None) == 404
+
+
+def _iter_pages(fetch, page_size=PAGE_SIZE, max_results=None):
+    """Iterate over the results of a paged ``fetch(startAt=..., maxResults=...)``, one page at a time."""
+    start_at = 0
+    while max_results is None or start_at < max_results:
+        page = fetch(startAt=start_at, maxResults=page_size)
+        yield from page
+        if len(page) < page_size or getattr(page, 'isLast', False):
+            return
+        start_at += len(page)
 
-        def get_component(component_name):
-            for component_obj in component_objs:
-                if component_obj.name == component_name:
-                    return component_obj
-            return None
 
+def _fetch_project(jira, project_name):
+    # project keys are accepted directly
+    if _PROJECT_KEY_MATCHER.match(project_name):
+        try:
+            project = jira.project(project_name)
+            return dict(id=project.id, key=project.key)
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+    try:
+        projects = _iter_pages(lambda **page: jira._get_json('project/search',
+                                                             params=dict(query=project_name, **page))['values'])
+        for project in projects:
+            if project['name'] == project_name:
+                return dict(id=project['id'], key=project['key'])
+        return None
+    except Exception as e:
+        # servers older than Jira 8 can't search projects
+        if not _is_not_found(e):
+            raise
+    for project in jira.projects():
+        if project.name == project_name:
+            return dict(id=project.id, key=project.key)
+    return None
+
+
+def _fetch_board(jira, board_name):
+    for board in _iter_pages(lambda **page: jira.boards(name=board_name, **page)):
+        if board.name == board_name:
+            return dict(id=board.id)
+    return None
+
+
+def _fetch_component(jira, project_key, component_name, component_objs):
+    # the components of the project are only listed once, for the first component that isn't cached
+    if not component_objs:
+        component_objs.extend(jira.project_components(project_key))
+    for component_obj in component_objs:
+        if component_obj.name == component_name:
+            return dict(id=component_obj.id)
+    return None
+
+
+def _fetch_epic(jira, epic_link):
+    # two results are enough to tell a unique epic from an ambiguous name
+    search_result = jira.search_issues('summary ~ "{}"'.format(f'\\"{epic_link}\\"'), maxResults=2,
+                                       fields='summary')
+    if len(search_result) == 0:
+        raise Exception('epic not found: \'{}\''.format(epic_link))
+    elif len(search_result) > 1:
+        raise Exception('more than one epic found for name \'{}\''.format(epic_link))
+    return dict(id=search_result[0].id, key=search_result[0].key)
+
+
+def _check_resolved(kind, name, value):
+    if not value:
+        raise Exception('{} not found: \'{}\''.format(kind, name))
+    return value
+
+
+def _fetch_user(jira, name):
+    try:
+        jira.user(name)
+    except Exception as e:
+        if not _is_not_found(e):
+            raise
+        return None
+    return dict(name=name)
+
+
+def _normalize_summary(summary):
+    return ' '.join(summary.casefold().split())
+
+
+def _search_summaries(jira, project_key, start_at):
+    """A page of the tasks and sub-tasks of the project, as ``(key, summary, parent_key)`` rows, and their total."""
+    search_result = jira.search_issues('project = "{}" AND issuetype != Epic ORDER BY key ASC'.format(project_key),
+                                       startAt=start_at, maxResults=SUMMARY_INDEX_PAGE_SIZE, fields='summary,parent')
+    rows = [(issue.key, issue.fields.summary, getattr(getattr(issue.fields, 'parent', None), 'key', None))
+            for issue in search_result]
+    return rows, getattr(search_result, 'total', start_at + len(rows))
+
+
+async def _preflight(call, jira, cache, *, project_name, board_name, components, epic_link, metadata=None,
+                     assignees=(), sprint=False, summaries=False, max_results=MAX_RESULTS):
+    """Resolve everything a run depends on, concurrently, before anything is written to the server.
+
+    The project (then its components, and the summaries of its issues when ``summaries``), the board (then its
+    current sprint, when ``sprint``), the epic and every user of ``assignees`` are looked up at the same time; the
+    resolutions of ``metadata`` are reused instead of being looked up again. Returns the metadata of the run (see
+    ``create_issues_in_jira``), with the ``sprint`` (``None`` when it wasn't looked up), the ``unknown_assignees`` and
+    the ``summary_index`` (``None`` when it wasn't looked up): the keys of the tasks of the project by normalized
+    summary, and of the sub-tasks by ``(parent_key, normalized summary)``. The first page of summaries tells how many
+    there are; the other pages are then fetched concurrently.
+    ``call(func, *args)`` runs a blocking lookup (see ``_run_async``); the cache is only used from the event loop.
+    """
+    import asyncio
+    cached_kinds = set(metadata['cached_kinds']) if metadata is not None else set()
+
+    async def _resolve(kind, name, fetch, *args):
+        value = cache.get(kind, name)
+        if value is not None:
+            cached_kinds.add(kind)
+            return value
+        value = await call(fetch, jira, *args)
+        if value is not None:
+            cache.put(kind, name, value)
+        return value
+
+    async def _resolve_project_and_component_ids():
+        if metadata is not None:
+            return metadata['project'], metadata['component_ids']
+        project = _check_resolved('project', project_name, await _resolve('project', project_name, _fetch_project,
+                                                                          project_name))
+        if components is None:
+            return project, None
+        component_objs = []
         component_ids = []
         for component in components:
-            component_obj = get_component(component)
-            if component_obj is None:
-                raise Exception('component not found: \'{}\''.format(component))
-            component_ids.append(component_obj.id)
-
-    if epic_link:
-        search_result = jira.search_issues('summary ~ "{}"'.format(f'\\"{epic_link}\\"'))
-        if len(search_result) == 0:
-            raise Exception('epic not found: \'{}\''.format(epic_link))
-        elif len(search_result) > 1:
-            raise Exception('more than one epic found for name \'{}\''.format(epic_link))
-        epic = search_result[0]
-    else:
-        epic = None
-
-    create_issues_results = []
-
-    def _create_issue(issue_dict, parent=None):
-        fields_list = [
-            {
-                'project': {'key': project.key},
-                'summary': issue_dict['summary'],
-                'description': issue_dict['description'],
-                'issuetype': {'name': 'Task' if parent is None else 'Sub Task'},
-            }
-        ]
-        if parent is None:
-            fields_list[0]['assignee'] = {'name': issue_dict['assignee'] if issue_dict['assignee'] else assignee_key}
-        if component_ids is not None:
-            fields_list[0]['components'] = [{'id': component_id} for component_id in component_ids]
-        if parent is not None:
-            fields_list[0]['parent'] = {'key': parent.key}
-        results = jira.create_issues(fields_list)
-        assert len(results) == 1
-        result = results[0]
-        issue_obj = result['issue']
-        for sub_issue_dict in issue_dict['sub_issues']:
-            _create_issue(sub_issue_dict, issue_obj)
-        create_issues_results.append(dict(issue_dict=issue_dict, issue_obj=issue_obj))
+            component_obj = await _resolve('component', '{}/{}'.format(project['key'], component), _fetch_component,
+                                           project['key'], component, component_objs)
+            component_ids.append(_check_resolved('component', component, component_obj)['id'])
+        return project, component_ids
+
+    async def _resolve_board():
+        if metadata is not None:
+            return metadata['board']
+        return _check_resolved('board', board_name, await _resolve('board', board_name, _fetch_board, board_name))
+
+    async def _resolve_board_and_sprint():
+        board = await _resolve_board()
+        if not sprint:
+            return board, None
+        try:
+            current_sprint = await call(_get_current_sprint, jira, board['id'], max_results)
+        except Exception:
+            # the cached board may be gone
+            if 'board' not in cached_kinds:
+                raise
+            cache.invalidate('board')
+            cached_kinds.discard('board')
+            board = _check_resolved('board', board_name, await _resolve('board', board_name, _fetch_board,
+                                                                        board_name))
+            current_sprint = await call(_get_current_sprint, jira, board['id'], max_results)
+        if current_sprint is None:
+            raise Exception('There\'s no open sprint')
+        return board, current_sprint
 
-    for issue_dict in issue_dicts:
-        _create_issue(issue_dict)
-
-    if epic is not None:
-        jira.add_issues_to_epic(epic.id, [create_issues_result['issue_obj'].key
-                                          for create_issues_result in create_issues_results
-                                          if create_issues_result['issue_obj'].fields.issuetype.name == 'Task'])
-
-    issues_to_add_to_sprint = [create_issues_result['issue_obj'].key
-                               for create_issues_result in create_issues_results
-                               if create_issues_result['issue_dict'].get('add_to_sprint', False)]
-    if issues_to_add_to_sprint:
-        sprints = jira.sprints(board.id, extended=['startDate', 'endDate'], maxResults=max_results)
-        if len(sprints) == 0:
+    async def _resolve_epic():
+        if metadata is not None:
+            return metadata['epic']
+        return await _resolve('epic', epic_link, _fetch_epic, epic_link) if epic_link else None
+
+    async def _resolve_users():
+        users = await asyncio.gather(*(_resolve('user', name, _fetch_user, name) for name in assignees))
+        return [name for name, user in zip(assignees, users) if user is None]
+
+    async def _index_summaries(project_task):
+        if not summaries:
+            return None
+        project, _ = await project_task
+        rows, total = await call(_search_summaries, jira, project['key'], 0)
+        # the server may return less than asked for
+        page_size = len(rows)
+        if page_size:
+            for page_rows, _ in await asyncio.gather(*(call(_search_summaries, jira, project['key'], start_at)
+                                                       for start_at in range(page_size, total, page_size))):
+                rows.extend(page_rows)
+        summary_index = {}
+        for key, summary, parent_key in rows:
+            normalized_summary = _normalize_summary(summary)
+            # the oldest issue wins
+            summary_index.setdefault(normalized_summary if parent_key is None else (parent_key, normalized_summary),
+                                     key)
+        return summary_index
+
+    project_task = asyncio.ensure_future(_resolve_project_and_component_ids())
+    (project, component_ids), (board, current_sprint), epic, unknown_assignees, summary_index = await asyncio.gather(
+        project_task, _resolve_board_and_sprint(), _resolve_epic(), _resolve_users(), _index_summaries(project_task))
+    return dict(project=project, board=board, component_ids=component_ids, epic=epic, cached_kinds=cached_kinds,
+                sprint=current_sprint, unknown_assignees=unknown_assignees, summary_index=summary_index)
+
+
+def _resolve_metadata(jira, cache, **lookups):
+    """Resolve the project, board, components and epic of a run (see ``_preflight``)."""
+    return _run_async(PREFLIGHT_MAX_LOOKUPS, _preflight, jira, cache, **lookups)
+
+
+def _get_current_sprint(jira, board_id, max_results):
+    """Return the last active sprint of the board or, when none is active, the next future one."""
+    future_sprint = None
+    active_sprint = None
+    sprints = _iter_pages(lambda **page: jira.sprints(board_id, state='active,future', **page), max_results=max_results)
+    for sprint in sprints:
+        if sprint.state == 'active':
+            active_sprint = sprint
+        elif future_sprint is None:
+            future_sprint = sprint
+    return active_sprint or future_sprint
+
+
+class _AttachmentStage:
+    """Adds tasks to the epic and to the current sprint of the board while the creation of the others goes on.
+
+    Keys are sent in chunks of at most ``chunk_size`` as soon as a chunk is full, from a pool of ``workers`` threads of
+    the stage. The current sprint is looked up there too, with the first sprint chunk, unless a ``sprint`` is given.
+    The epic and board ids are read from ``metadata`` when a chunk is sent, so that a refresh applies to later chunks.
+    ``on_attached(kind, keys)`` is called on the thread of ``finish`` with every chunk that was sent successfully.
+    """
+
+    def __init__(self, jira, metadata, *, max_results, workers=1, chunk_size=ATTACH_MAX_ISSUES, sprint=None,
+                 on_attached=None):
+        self._jira = jira
+        self._metadata = metadata
+        self._on_attached = on_attached
+        self._max_results = max_results
+        self._chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = dict(epic=[], sprint=[])
+        self._sent = []
+        self._sprint = None
+        if sprint is not None:
+            self._sprint = Future()
+            self._sprint.set_result(sprint)
+
+    def _lookup_sprint(self):
+        with self._lock:
+            if self._sprint is None:
+                self._sprint = self._executor.submit(_get_current_sprint, self._jira, self._metadata['board']['id'],
+                                                     self._max_results)
+            return self._sprint
+
+    def _send(self, kind, keys):
+        if kind == 'epic':
+            self._jira.add_issues_to_epic(self._metadata['epic']['id'], keys)
+            return
+        sprint = self._lookup_sprint().result()
+        if sprint is None:
             raise Exception('There\'s no open sprint')
-        last_sprint = sprints[-1]
-        jira.add_issues_to_sprint(last_sprint.id, issues_to_add_to_sprint)
+        self._jira.add_issues_to_sprint(sprint.id, keys)
+
+    def _submit(self, kind, keys):
+        self._sent.append((kind, keys, self._executor.submit(self._send, kind, keys)))
 
+    def add(self, kind, keys):
+        """Queue the ``keys`` of issues to add to the ``'epic'`` or the ``'sprint'``."""
+        if not keys:
+            return
+        if kind == 'sprint':
+            self._lookup_sprint()
+        pending = self._pending[kind]
+        pending.extend(keys)
+        while len(pending) >= self._chunk_size:
+            self._submit(kind, pending[:self._chunk_size])
+            del pending[:self._chunk_size]
+
+    def finish(self, refresh):
+        """Send the last chunks and wait for all of them.
+
+        Chunks that failed are sent once more if ``refresh(kind)`` (called on the calling thread, with ``'epic'`` or
+        ``'board'``) resolved the epic or the board again; otherwise the first error is raised.
+        """
+        for kind, pending in self._pending.items():
+            if pending:
+                self._submit(kind, list(pending))
+                del pending[:]
+        failed = []
+        for kind, keys, future in self._sent:
+            try:
+                future.result()
+            except Exception as e:
+                failed.append((kind, keys, e))
+                continue
+            self._attached(kind, keys)
+        del self._sent[:]
+        refreshed = {}
+        for kind, keys, error in failed:
+            if kind not in refreshed:
+                refreshed[kind] = refresh('epic' if kind == 'epic' else 'board')
+                if refreshed[kind] and kind == 'sprint':
+                    self._sprint = None
+            if not refreshed[kind]:
+                raise error
+            self._send(kind, keys)
+            self._attached(kind, keys)
+
+    def _attached(self, kind, keys):
+        if self._on_attached is not None:
+            self._on_attached(kind, keys)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _make_issue_fields(metadata, assignee_key, issue_dict, sub_task):
+    """REST fields of an issue as the bulk create resource takes them, but for the parent of a sub-task."""
+    fields = {
+        'project': {'key': metadata['project']['key']},
+        'summary': issue_dict['summary'],
+        'description': issue_dict['description'],
+        'issuetype': {'name': 'Sub Task' if sub_task else 'Task'},
+    }
+    if not sub_task:
+        fields['assignee'] = {'name': issue_dict['assignee'] if issue_dict['assignee'] else assignee_key}
+    if metadata['component_ids'] is not None:
+        fields['components'] = [{'id': component_id} for component_id in metadata['component_ids']]
+    return fields
+
+
+def _check_assignees(metadata, tasks):
+    if metadata['unknown_assignees']:
+        raise Exception('\n'.join(['Unknown assignee(s):'] + [
+            '\'{}\' ({})'.format(name, ', '.join('line {}'.format(issue_dict.get('line', '?')) for issue_dict in tasks
+                                                if issue_dict['assignee'] == name) or 'default assignee')
+            for name in metadata['unknown_assignees']]))
+
+
+def _is_metadata_error(error):
+    # errors the server reports against fields whose values come from the metadata resolution
+    return isinstance(error, dict) and any(field in error for field in ('project', 'pid', 'components'))
+
+
+class _CreationPipeline:
+    """The creation of the issues of a run and the stages around it, shared by ``create_issues_in_jira`` and
+    ``replay_payload``.
+
+    Issues are created by the ``engine`` (see ``_creation_loop``), journaled for ``source`` (when given, see
+    ``CreationJournal``) and created tasks are added to the epic of ``metadata``, and to its sprint when marked with
+    ``(X)``, by an ``_AttachmentStage``. ``existing_key`` is the hook of the plan finding the issues that aren't
+    created (the journal's by default): those are left where they are, unless the journal still has them pending.
+    ``progress(done, failures)`` gets the ``(issue_dict, key)`` of the created and reused issues of every batch, and
+    ``done_count`` counts them. Without ``keep_results``, no issue is kept once done (see ``_CreationPlan``).
+    """
+
+    def __init__(self, jira, metadata, *, server_url, source, issue_fields, bulk_size, workers, engine, max_results,
+                 progress=None, cancel_event=None, keep_results=True):
+        self._jira = jira
+        self._metadata = metadata
+        self._issue_fields = issue_fields
+        self._bulk_size = bulk_size
+        self._workers = workers
+        self._engine = engine
+        self._progress = progress
+        self._cancel_event = cancel_event
+        self._keep_results = keep_results
+        self.done_count = 0
+        self.journal = CreationJournal(server_url, metadata['project']['key'], source,
+                                       attachments=self._attachments_of) if source is not None else None
+        self.existing_key = self.journal.existing_key if self.journal is not None else None
+        self._reused_ids = set()
+        self.attachments = _AttachmentStage(jira, metadata, max_results=max_results, workers=workers,
+                                            sprint=metadata['sprint'],
+                                            on_attached=self.journal.attached if self.journal is not None else None)
+
+    def _attachments_of(self, issue_dict, parent_key):
+        # what a created issue is added to
+        if parent_key is not None:
+            return []
+        return (['epic'] if self._metadata['epic'] is not None else []) + \
+            (['sprint'] if issue_dict.get('add_to_sprint', False) else [])
+
+    def _reused_key(self, issue_dict, parent_key):
+        key = self.existing_key(issue_dict, parent_key)
+        if key is not None:
+            self._reused_ids.add(id(issue_dict))
+        return key
+
+    def _due_attachments(self, issue_dict, parent_key, key):
+        # tasks are attached as soon as they're created; reused ones are left where they are, unless a previous run
+        # created them without attaching them
+        if id(issue_dict) not in self._reused_ids:
+            return self._attachments_of(issue_dict, parent_key)
+        # (a journal of a run with an epic may be resumed without one)
+        return [kind for kind in (self.journal.pending_attachments(key) if self.journal is not None else [])
+                if kind != 'epic' or self._metadata['epic'] is not None]
+
+    def _on_progress(self, done, failures):
+        due = [(key, self._due_attachments(issue_dict, parent_key, key)) for issue_dict, parent_key, key in done]
+        for kind in ('epic', 'sprint'):
+            self.attachments.add(kind, [key for key, kinds in due if kind in kinds])
+        # done issues are never asked about again: what's kept by their id is dropped (ids of released issues are
+        # reused by the next ones)
+        for issue_dict, _, _ in done:
+            self._reused_ids.discard(id(issue_dict))
+        if self.journal is not None:
+            self.journal.forget(issue_dict for issue_dict, _, _ in done)
+        self.done_count += len(done)
+        if self._progress is not None:
+            self._progress([(issue_dict, key) for issue_dict, _, key in done], failures)
+
+    def create(self, issue_dicts, sub_issues=()):
+        """Create ``issue_dicts`` (and the ``sub_issues`` of existing parents); see ``_schedule_issue_creation``."""
+        options = dict(jira=self._jira, issue_dicts=issue_dicts, sub_issues=sub_issues,
+                       issue_fields=self._issue_fields, bulk_size=self._bulk_size, workers=self._workers,
+                       progress=self._on_progress, cancel_event=self._cancel_event, keep_results=self._keep_results)
+        if self.existing_key is not None:
+            options['existing_key'] = self._reused_key
+        if self.journal is not None:
+            options['on_created'] = self.journal.record
+        if self._engine == 'async':
+            return _run_async(self._workers, _schedule_issue_creation_async, **options)
+        return _schedule_issue_creation(**options)
+
+    def finish(self, refresh):
+        """Wait for the attachments (see ``_AttachmentStage.finish``)."""
+        self.attachments.finish(refresh)
+
+    def close(self):
+        self.attachments.close()
+
+
+def _created_issues(issue_dicts, created_keys, issue_type='Task'):
+    """Results of the created (or reused) issues, in the order of a depth-first creation (sub-tasks first)."""
+    results = []
+    for issue_dict in issue_dicts:
+        results.extend(_created_issues(issue_dict['sub_issues'], created_keys, 'Sub Task'))
+        key = created_keys.get(id(issue_dict))
+        if key is not None:
+            results.append(CreatedIssue(issue_dict, key, issue_type))
+    return results
 
-def parse_issues(src):
+
+def _raise_for_outcome(cancelled, created_count, failures, update_failures=()):
+    if cancelled:
+        raise Exception('Cancelled after creating {} issue(s)'.format(created_count))
+    if failures or update_failures:
+        raise Exception('\n'.join(([_format_failures(failures)] if failures else []) +
+                                  ([_format_failures(update_failures, 'update')] if update_failures else [])))
+
+
+def create_issues_in_jira(*, issue_dicts, server_url, basic_auth, project_name, board_name, assignee_key, components,
+                          epic_link, max_results, bulk_size=BULK_CREATE_MAX_ISSUES, workers=1,
+                          cache_ttl=METADATA_CACHE_TTL, refresh_cache=False, source=None, profiler=None, jira=None,
+                          progress=None, cancel_event=None, metadata=None, engine='sync', sync=False, dedupe=None):
+    """Create the issues of ``issue_dicts`` and return a result per created issue.
+
+    When ``source`` (the plan file the issues were parsed from) is given, created issues are journaled and issues
+    journaled by a previous run of the same source are reused instead of being created again.
+    A ``profiler`` records every call made to the server.
+    ``progress(done, failures)`` is called as batches of issues complete. Setting ``cancel_event`` stops the creation
+    of new batches: the issues created so far are still added to the epic and sprint (and journaled), then the run
+    fails; re-running the same source creates the rest.
+    ``metadata`` is a resolution shared by several runs (see ``text2jira_batch``); it is copied, not resolved again.
+    Before anything is written, a preflight (see ``_preflight``) resolves the metadata, the current sprint (when a task
+    is marked with ``(X)``) and every assignee of the tasks; unknown assignees fail the run at once. The assignees of
+    a stream of issues can't be known in advance, so only ``assignee_key`` is checked then. The issues of a stream
+    (``issue_dicts`` that isn't a list) are released once created, so that the memory of the run doesn't grow with
+    the stream: ``progress`` is then the only report of the created issues, and the run returns their number.
+    The ``'async'`` ``engine`` schedules batches from an event loop, with up to ``workers`` requests in flight; the
+    default ``'sync'`` engine uses a pool of ``workers`` threads. Both run the same loop (see ``_creation_loop``) and,
+    the jira client being blocking, both send every request from a thread.
+    With ``sync``, ``issue_dicts`` is diffed against the snapshot of the last sync of ``source`` (see ``SyncSnapshot``):
+    only new issues are created, changed summaries, descriptions and assignees are updated and issues whose ``(X)``
+    changed are added to the current sprint or moved to the backlog. Issues removed from the source are left as is.
+    With ``dedupe``, the summaries of all the issues of the project are indexed before creating anything, and a task
+    whose (case and whitespace insensitive) summary matches a task of the project is either not created, nor its
+    sub-tasks (``'skip'``), or stands for that task (``'link'``): the existing task keeps its epic and sprint, and
+    only the sub-tasks it doesn't have yet are created under it. Issues of the journal of ``source`` aren't
+    duplicates.
+    Only the tasks created by the run are added to the epic and sprint, but for the ones of the journal that a previous
+    run created without adding them (it failed in between).
+    """
+    if engine not in ENGINES:
+        raise Exception('unknown engine: \'{}\''.format(engine))
+    if dedupe is not None and dedupe not in DEDUPE_MODES:
+        raise Exception('unknown dedupe mode: \'{}\''.format(dedupe))
+    if jira is None:
+        with _span(profiler, 'connect'):
+            jira = _connect(server_url, basic_auth, pool_size=workers if engine == 'async' else None)
+    if profiler is not None:
+        jira = _ProfiledJira(jira, profiler)
+
+    cache = MetadataCache(server_url, ttl=cache_ttl, refresh=refresh_cache)
+
+    lookups = dict(project_name=project_name, board_name=board_name, components=components, epic_link=epic_link)
+
+    if sync:
+        if source is None:
+            raise Exception('sync needs the source of the issues')
+        issue_dicts = list(issue_dicts)
+    stream = not isinstance(issue_dicts, list)
+    tasks = issue_dicts if not stream else []
+    assignees = list(dict.fromkeys([assignee_key] + [issue_dict['assignee'] for issue_dict in tasks
+                                                     if issue_dict['assignee']]))
+    # a sync only needs the sprint for new or changed (X) markers, so it's looked up later, if at all
+    need_sprint = not sync and any(issue_dict.get('add_to_sprint', False) for issue_dict in tasks)
+    with _span(profiler, 'preflight'):
+        metadata = _run_async(PREFLIGHT_MAX_LOOKUPS, _preflight, jira, cache, metadata=metadata, assignees=assignees,
+                              sprint=need_sprint, summaries=dedupe is not None, max_results=max_results, **lookups)
+    summary_index = metadata.pop('summary_index')
+    _check_assignees(metadata, tasks)
+
+    def _refresh_metadata(kinds):
+        # only resolutions served from the cache can be stale
+        stale_kinds = kinds & metadata['cached_kinds']
+        if not stale_kinds:
+            return False
+        for kind in stale_kinds:
+            cache.invalidate(kind)
+        metadata.update(_resolve_metadata(jira, cache, **lookups))
+        return True
+
+    def _issue_fields(issue_dict, parent_key):
+        fields = _make_issue_fields(metadata, assignee_key, issue_dict, parent_key is not None)
+        if parent_key is not None:
+            fields['parent'] = {'key': parent_key}
+        return fields
+
+    pipeline = _CreationPipeline(jira, metadata, server_url=server_url, source=source, issue_fields=_issue_fields,
+                                 bulk_size=bulk_size, workers=workers, engine=engine, max_results=max_results,
+                                 progress=progress, cancel_event=cancel_event, keep_results=not stream)
+    journal = pipeline.journal
+
+    if sync:
+        snapshot = SyncSnapshot(server_url, metadata['project']['key'], source)
+        matches = snapshot.match(issue_dicts)
+
+        def _existing_key(issue_dict, parent_key):
+            # the journal is always asked, as it registers the path of every task
+            key = journal.existing_key(issue_dict, parent_key)
+            if id(issue_dict) in matches:
+                key = matches[id(issue_dict)]['key']
+            return key
+
+        pipeline.existing_key = _existing_key
+
+    if dedupe is not None:
+        known_key = pipeline.existing_key
+
+        def _known_key(issue_dict, parent_key):
+            return known_key(issue_dict, parent_key) if known_key is not None else None
+
+        def _duplicate_key(issue_dict, parent_key):
+            normalized_summary = _normalize_summary(issue_dict['summary'])
+            return summary_index.get(normalized_summary if parent_key is None else (parent_key, normalized_summary))
+
+        # issues already created from the source aren't duplicates
+        if dedupe == 'skip':
+            issue_dicts = (issue_dict for issue_dict in issue_dicts
+                           if _known_key(issue_dict, None) is not None or _duplicate_key(issue_dict, None) is None)
+        else:
+            def _existing_or_duplicate_key(issue_dict, parent_key):
+                key = _known_key(issue_dict, parent_key)
+                return key if key is not None else _duplicate_key(issue_dict, parent_key)
+
+            pipeline.existing_key = _existing_or_duplicate_key
+
+    def _assignee(issue_dict, issue_type):
+        # the assignee is only sent for tasks (sub-tasks get the assignee of their task from the server)
+        return (issue_dict['assignee'] or assignee_key) if issue_type == 'Task' else None
+
+    def _update(update):
+        create_issues_result, old_node, fields = update
+        try:
+            with _span(profiler, 'update_issue'):
+                _update_issue(jira, old_node['key'], fields)
+        except Exception as e:
+            return create_issues_result, old_node, getattr(e, 'text', None) or str(e)
+        return None
+
+    update_failures = []
+    stale_nodes = {}
+    try:
+        created_keys, failures, top_level_issue_dicts = pipeline.create(issue_dicts)
+        cancelled = cancel_event is not None and cancel_event.is_set()
+
+        if not cancelled and any(_is_metadata_error(error) for _, _, error in failures) \
+                and _refresh_metadata({'project', 'component'}):
+            # retry everything that failed with the freshly resolved metadata
+            retry_created_keys, failures, _ = pipeline.create(
+                [issue_dict for issue_dict, parent_key, _ in failures if parent_key is None],
+                sub_issues=[(issue_dict, parent_key) for issue_dict, parent_key, _ in failures
+                            if parent_key is not None])
+            created_keys.update(retry_created_keys)
+
+        create_issues_results = _created_issues(top_level_issue_dicts, created_keys)
+
+        if sync:
+            updates = []
+            issues_to_move_to_backlog = []
+            for create_issues_result in create_issues_results:
+                issue_dict = create_issues_result['issue_dict']
+                old_node = matches.get(id(issue_dict))
+                if old_node is None:
+                    continue
+                new_node = SyncSnapshot.node(issue_dict, old_node['key'],
+                                             _assignee(issue_dict, create_issues_result['issue_type']))
+                fields = {field: new_node[field] for field in ('summary', 'description', 'assignee')
+                          if new_node[field] != old_node[field]}
+                if 'assignee' in fields:
+                    fields['assignee'] = {'name': fields['assignee']}
+                if fields:
+                    updates.append((create_issues_result, old_node, fields))
+                if new_node['add_to_sprint'] and not old_node['add_to_sprint']:
+                    pipeline.attachments.add('sprint', [old_node['key']])
+                elif old_node['add_to_sprint'] and not new_node['add_to_sprint']:
+                    issues_to_move_to_backlog.append(old_node['key'])
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for update_failure in executor.map(_update, updates):
+                    if update_failure is not None:
+                        create_issues_result, old_node, error = update_failure
+                        # the next sync sends the update again
+                        stale_nodes[id(create_issues_result['issue_dict'])] = old_node
+                        update_failures.append((create_issues_result['issue_dict'], None, error))
+            for i in range(0, len(issues_to_move_to_backlog), ATTACH_MAX_ISSUES):
+                jira.move_to_backlog(issues_to_move_to_backlog[i:i + ATTACH_MAX_ISSUES])
+
+        pipeline.finish(lambda kind: _refresh_metadata({kind}))
+    finally:
+        pipeline.close()
+
+    if sync and not cancelled:
+        def _snapshot_nodes(issue_dicts, issue_type):
+            nodes = []
+            for issue_dict in issue_dicts:
+                key = created_keys.get(id(issue_dict))
+                if key is None:
+                    continue
+                if id(issue_dict) in stale_nodes:
+                    node = dict(stale_nodes[id(issue_dict)], add_to_sprint=issue_dict.get('add_to_sprint', False))
+                else:
+                    node = SyncSnapshot.node(issue_dict, key, _assignee(issue_dict, issue_type))
+                node['sub_issues'] = _snapshot_nodes(issue_dict['sub_issues'], 'Sub Task')
+                nodes.append(node)
+            return nodes
+
+        snapshot.save(_snapshot_nodes(top_level_issue_dicts, 'Task'))
+
+    if stream:
+        _raise_for_outcome(cancelled, pipeline.done_count, failures)
+        return pipeline.done_count
+    _raise_for_outcome(cancelled, len(create_issues_results), failures, update_failures)
+    return create_issues_results
+
+
+class Profiler:
+    """Latency, payload sizes, retries and counts of the Jira calls (and parsing) of a run.
+
+    Spans are recorded from any thread. HTTP payloads are attributed to the span open on the thread that sent them,
+    through a response hook installed on the jira client's session.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._spans = []
+
+    @contextmanager
+    def span(self, name):
+        span = dict(name=name, requests=0, bytes_sent=0, bytes_received=0, error=None)
+        parent_span = getattr(self._local, 'span', None)
+        self._local.span = span
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = type(e).__name__
+            raise
+        finally:
+            span['start'] = start - self._origin
+            span['duration'] = time.perf_counter() - start
+            span['thread'] = threading.get_ident()
+            self._local.span = parent_span
+            with self._lock:
+                self._spans.append(span)
+
+    def iter(self, name, iterable):
+        """Iterate over ``iterable``, recording every step as a span (e.g. the parsing of a streamed task)."""
+        iterator = iter(iterable)
+        while True:
+            with self.span(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def on_response(self, response, *args, **kwargs):
+        span = getattr(self._local, 'span', None)
+        if span is None:
+            return
+        body = response.request.body
+        span['requests'] += 1
+        span['bytes_sent'] += len(body) if body else 0
+        span['bytes_received'] += len(response.content or b'')
+
+    def summary(self):
+        """One row per span name, in order of total time."""
+        spans_by_name = {}
+        with self._lock:
+            for span in self._spans:
+                spans_by_name.setdefault(span['name'], []).append(span)
+        rows = []
+        for name, spans in spans_by_name.items():
+            durations = sorted(span['duration'] for span in spans)
+            rows.append(dict(name=name,
+                             count=len(spans),
+                             total=sum(durations),
+                             mean=sum(durations) / len(durations),
+                             p95=durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                             max=durations[-1],
+                             requests=sum(span['requests'] for span in spans),
+                             retries=sum(max(span['requests'] - 1, 0) for span in spans),
+                             errors=sum(1 for span in spans if span['error'] is not None),
+                             bytes_sent=sum(span['bytes_sent'] for span in spans),
+                             bytes_received=sum(span['bytes_received'] for span in spans)))
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def format_summary(self):
+        row_format = '{:<24} {:>7} {:>9.3f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8} {:>7} {:>6} {:>10.1f} {:>10.1f}'
+        lines = ['{:<24} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7} {:>6} {:>10} {:>10}'.format(
+            'call', 'count', 'total [s]', 'mean [ms]', 'p95 [ms]', 'max [ms]', 'requests', 'retries', 'errors',
+            'sent [KB]', 'recv [KB]')]
+        for row in self.summary():
+            lines.append(row_format.format(
+                row['name'], row['count'], row['total'], row['mean'] * 1000, row['p95'] * 1000, row['max'] * 1000,
+                row['requests'], row['retries'], row['errors'], row['bytes_sent'] / 1024,
+                row['bytes_received'] / 1024))
+        return '\n'.join(lines)
+
+    def write_trace(self, path):
+        """Write the spans in the Chrome trace event format (chrome://tracing, Perfetto), with the summary."""
+        pid = os.getpid()
+        with self._lock:
+            events = [dict(name=span['name'], cat='text2jira', ph='X', pid=pid, tid=span['thread'],
+                           ts=round(span['start'] * 1e6), dur=round(span['duration'] * 1e6),
+                           args=dict(requests=span['requests'], bytes_sent=span['bytes_sent'],
+                                     bytes_received=span['bytes_received'], error=span['error']))
+                      for span in self._spans]
+        with open(path, 'wt') as trace_file:
+            json.dump(dict(traceEvents=events, displayTimeUnit='ms', otherData=dict(summary=self.summary())),
+                      trace_file)
+
+
+# helpers of the jira client that don't talk to the server
+_UNPROFILED_HELPERS = ('_get_url',)
+
+
+class _ProfiledJira:
+    """Proxy of a jira client that records a span for every call."""
+
+    def __init__(self, jira, profiler):
+        self._jira = jira
+        self._profiler = profiler
+        session = getattr(jira, '_session', None)
+        if session is not None:
+            session.hooks['response'].append(profiler.on_response)
+
+    def __getattr__(self, name):
+        attr = getattr(self._jira, name)
+        if not callable(attr) or name in _UNPROFILED_HELPERS:
+            return attr
+
+        def _call(*args, **kwargs):
+            # private REST helpers are named after the resource they get
+            span_name = '{} {}'.format(name, args[0]) if name.startswith('_') and args else name
+            with self._profiler.span(span_name):
+                return attr(*args, **kwargs)
+
+        return _call
+
+
+def _span(profiler, name):
+    return profiler.span(name) if profiler is not None else nullcontext()
+
+
+def parse_issues(src, fast=False, processes=1):
+    """Parse ``src`` into tasks; ``processes`` other than 1 parse it across a pool of processes (see
+    ``parse_lines_parallel``)."""
+    if fast:
+        buffer = _read_buffer(src)
+        return parse_buffer(buffer) if processes == 1 else parse_buffer_parallel(buffer, processes)
     with open(src, 'rt') as src_file:
         lines = list(src_file.readlines())
-    return parse_lines(lines)
+    return parse_lines(lines) if processes == 1 else parse_lines_parallel(lines, processes)
+
+
+def iter_parse_issues(src, fast=False):
+    """Stream the tasks of ``src``, reading the file lazily (see ``iter_parse_lines``); the fast parser reads it in
+    blocks of ``PARSE_BLOCK_SIZE`` characters."""
+    with open(src, 'rt') as src_file:
+        if fast:
+            yield from _iter_issues(_tokenize_blocks(_iter_blocks(src_file, PARSE_BLOCK_SIZE)))
+        else:
+            yield from iter_parse_lines(src_file)
+
+
+def _iter_blocks(src_file, size):
+    # blocks of whole lines
+    rest = ''
+    while True:
+        data = src_file.read(size)
+        if not data:
+            if rest:
+                yield rest
+            return
+        data = rest + data
+        end = data.rfind('\n') + 1
+        rest = data[end:]
+        if end:
+            yield data[:end]
+
+
+def _tokenize_blocks(blocks):
+    line_no = 1
+    for block in blocks:
+        yield from _tokenize_buffer(block, line_no)
+        line_no += block.count('\n')
+
+
+def _read_buffer(src):
+    """Read ``src`` as a whole, in a single string (the buffer of the fast parser)."""
+    with open(src, 'rt') as src_file:
+        return src_file.read()
 
 
 def parse_lines(lines):
-    assignee_matcher = re.compile(r"""(.*)\[([a-zA-z0-9]+)\]$""")
+    return list(iter_parse_lines(lines))
+
+
+def iter_parse_lines(lines):
+    """Yield each task (with its sub-tasks and descriptions) as soon as the next task line closes it."""
+    return _iter_issues(_tokenize_lines(lines))
 
+
+def parse_buffer(buffer):
+    """Parse a whole plan at once; same results as ``parse_lines(buffer.split('\\n'))``, only faster."""
+    return list(iter_parse_buffer(buffer))
+
+
+def iter_parse_buffer(buffer):
+    return _iter_issues(_tokenize_buffer(buffer))
+
+
+def _is_task_token(code, text):
+    # a task the parser doesn't skip as empty: sub-tasks and descriptions that follow it belong to it
+    if code != '-':
+        return False
+    text = text.strip()
+    match_obj = _ASSIGNEE_MATCHER.search(text)
+    if match_obj:
+        text = match_obj.group(1).strip()
+    return len(text) > 0
+
+
+def _parse_chunk(chunk):
+    # runs in the processes of the pool of a parallel parse
+    tokens, first_line_no, fast = chunk
+    tokenize = _tokenize_buffer if fast else _tokenize_lines
+    return list(_iter_issues(tokenize(tokens, first_line_no)))
+
+
+def _parse_chunks(chunks, processes):
+    from concurrent.futures import ProcessPoolExecutor
     issue_dicts = []
-    curr_issue = None
-    curr_description_holder = None
-    for line in lines:
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        # (the assignees of a chunk still share their strings: pickle keeps them as references)
+        for chunk_issue_dicts in executor.map(_parse_chunk, chunks):
+            issue_dicts.extend(chunk_issue_dicts)
+    return issue_dicts
+
+
+def parse_lines_parallel(lines, processes=None):
+    """``parse_lines`` across a pool of ``processes`` (as many as cores by default), with the same results.
+
+    The lines are split in ``PARSE_CHUNKS_PER_PROCESS`` chunks per process, each starting with a task, so that chunks
+    are parsed independently; the tasks of the chunks are then concatenated in order.
+    """
+    lines = lines if isinstance(lines, list) else list(lines)
+    processes = processes or os.cpu_count()
+    chunk_size = max(1, len(lines) // (processes * PARSE_CHUNKS_PER_PROCESS))
+    starts = [0]
+    for start in range(chunk_size, len(lines), chunk_size):
+        start = max(start, starts[-1] + 1)
+        # the first task from there
+        while start < len(lines):
+            line = lines[start].strip()
+            if line and _is_task_token(line[0], line[1:]):
+                starts.append(start)
+                break
+            start += 1
+        else:
+            break
+    ends = starts[1:] + [len(lines)]
+    return _parse_chunks([(lines[start:end], start + 1, False) for start, end in zip(starts, ends)], processes)
+
+
+def parse_buffer_parallel(buffer, processes=None):
+    """``parse_buffer`` across a pool of ``processes``, split like ``parse_lines_parallel``."""
+    processes = processes or os.cpu_count()
+    chunk_size = max(1, len(buffer) // (processes * PARSE_CHUNKS_PER_PROCESS))
+    starts = [0]
+    for start in range(chunk_size, len(buffer), chunk_size):
+        if start <= starts[-1]:
+            continue
+        # the first task from the next line on
+        start = buffer.find('\n', start) + 1
+        if start == 0:
+            break
+        for match_obj in _LINE_MATCHER.finditer(buffer, start):
+            if _is_task_token(*match_obj.groups()):
+                starts.append(match_obj.start())
+                break
+        else:
+            break
+    chunks = []
+    line_no = 1
+    for start, end in zip(starts, starts[1:] + [len(buffer)]):
+        chunks.append((buffer[start:end], line_no, True))
+        line_no += buffer.count('\n', start, end)
+    return _parse_chunks(chunks, processes)
+
+
+def _tokenize_lines(lines, first_line_no=1):
+    for line_no, line in enumerate(lines, first_line_no):
         line = line.strip()
         if len(line) == 0:
             continue
@@ -127,13 +1454,136 @@ def parse_lines(lines):
         text = line[1:].strip()
 
         # search for optional assignee
-        match_obj = assignee_matcher.search(text)
+        match_obj = _ASSIGNEE_MATCHER.search(text)
         if match_obj:
             text = match_obj.group(1).strip()
             assignee = match_obj.group(2)
         else:
             assignee = None
 
+        yield line_no, code, text, assignee
+
+
+def _tokenize_buffer(buffer, first_line_no=1):
+    # lines are only counted between two matches, with str.count
+    line_no = first_line_no
+    pos = 0
+    for match_obj in _LINE_MATCHER.finditer(buffer):
+        start = match_obj.start()
+        line_no += buffer.count('\n', pos, start)
+        pos = start
+        code, text = match_obj.groups()
+        text = text.strip()
+        # only lines ending with a bracket can have an assignee
+        assignee = None
+        if text.endswith(']'):
+            match_obj = _ASSIGNEE_MATCHER.search(text)
+            if match_obj:
+                text = match_obj.group(1).strip()
+                assignee = match_obj.group(2)
+        yield line_no, code, text, assignee
+
+
+class _Record(Mapping):
+    """Fixed set of attributes (``__slots__``) that can also be read and written like the keys of a dict.
+
+    Keys that aren't slots (computed ones) are read-only.
+    """
+    __slots__ = ()
+    _keys = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            if key in self._keys:
+                raise TypeError('\'{}\' of a {} is read-only'.format(key, type(self).__name__))
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(key, self[key]) for key in self._keys))
+
+    def __reduce__(self):
+        # pickled as a call to the constructor, which takes the slots in order: smaller and faster to load than the
+        # state of the slots (records of parallel parses are sent back from other processes)
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+
+class Issue(_Record):
+    """Task of a plan (a ``-`` line), with its ``SubIssue``s."""
+    __slots__ = ('summary', 'description', 'add_to_sprint', 'assignee', 'line', 'sub_issues')
+    _keys = __slots__
+
+    def __init__(self, summary, description, add_to_sprint, assignee, line, sub_issues=None):
+        self.summary = summary
+        self.description = description
+        self.add_to_sprint = add_to_sprint
+        self.assignee = assignee
+        self.line = line
+        self.sub_issues = sub_issues if sub_issues is not None else []
+
+
+class SubIssue(_Record):
+    """Sub-task of a plan (a ``+`` line)."""
+    __slots__ = ('summary', 'description', 'assignee', 'line')
+    _keys = __slots__ + ('sub_issues',)
+
+    def __init__(self, summary, description, assignee, line):
+        self.summary = summary
+        self.description = description
+        self.assignee = assignee
+        self.line = line
+
+    @property
+    def sub_issues(self):
+        # sub-tasks have no children: no list is kept per sub-task, and the empty tuple can't be appended to
+        return ()
+
+
+class CreatedIssue(_Record):
+    """Issue created (or found in the journal) by a run, with its key and its type (``'Task'`` or ``'Sub Task'``).
+
+    Only the key of the issue resource returned by the server is kept: ``result['issue_obj']`` is the record itself,
+    so ``result['issue_obj'].key`` still works but the ``fields`` of the resource are gone (fetch the issue for them).
+    """
+    __slots__ = ('issue_dict', 'key', 'issue_type')
+    _keys = ('issue_dict', 'issue_obj', 'issue_type')
+
+    def __init__(self, issue_dict, key, issue_type):
+        self.issue_dict = issue_dict
+        self.key = key
+        self.issue_type = issue_type
+
+    @property
+    def issue_obj(self):
+        return self
+
+
+def _join_descriptions(issue_dict):
+    # descriptions are collected as lists while parsing, to avoid quadratic string concatenations
+    issue_dict.description = ''.join(issue_dict.description)
+    for sub_issue_dict in issue_dict.sub_issues:
+        sub_issue_dict.description = ''.join(sub_issue_dict.description)
+    return issue_dict
+
+
+def _iter_issues(tokens):
+    curr_issue = None
+    curr_description_holder = None
+    for line_no, code, text, assignee in tokens:
+        if assignee is not None:
+            # a plan has few assignees, shared by many issues
+            assignee = sys.intern(assignee)
         if code == '-':
             if len(text) == 0:
                 print('skipping empty task')
@@ -143,19 +1593,19 @@ def parse_lines(lines):
                 add_to_sprint = True
             else:
                 add_to_sprint = False
-            curr_issue = dict(summary=text, sub_issues=[], description='', add_to_sprint=add_to_sprint,
-                              assignee=assignee)
+            if curr_issue is not None:
+                yield _join_descriptions(curr_issue)
+            curr_issue = Issue(text, [], add_to_sprint, assignee, line_no)
             curr_description_holder = curr_issue
-            issue_dicts.append(curr_issue)
         elif code == '+':
             if len(text) == 0:
                 print('skipping empty sub-task')
                 continue
-            sub_issue = dict(summary=text, sub_issues=[], description='', assignee=assignee)
+            sub_issue = SubIssue(text, [], assignee, line_no)
             curr_description_holder = sub_issue
             if curr_issue is None:
                 raise Exception(f"Sub-task '{text}' has no parent task.")
-            curr_issue['sub_issues'].append(sub_issue)
+            curr_issue.sub_issues.append(sub_issue)
         elif code == '*':
             if curr_description_holder is None:
                 print('no description holder to accept the description \'{}\''.format(text))
@@ -163,258 +1613,472 @@ def parse_lines(lines):
             if len(text) == 0:
                 print('skipping empty description')
                 continue
-            curr_description_holder["description"] += '* {}\n'.format(text)
-    return issue_dicts
+            curr_description_holder.description.append('* ' + text + '\n')
+    if curr_issue is not None:
+        yield _join_descriptions(curr_issue)
 
 
-def text2jira(*, src, server_url, basic_auth, project_name, board_name, assignee_key, components, epic_link, max_results=MAX_RESULTS):
-    issue_dicts = parse_issues(src)
-    create_issues_in_jira(issue_dicts=issue_dicts,
-                          server_url=server_url,
-                          basic_auth=basic_auth,
-                          project_name=project_name,
-                          board_name=board_name,
-                          assignee_key=assignee_key,
-                          components=components,
-                          epic_link=epic_link,
+def _parse_and_create(*, src, stream, journal, fast_parser, profiler, sync, parse_processes=1, **options):
+    if stream:
+        issue_dicts = iter_parse_issues(src, fast=fast_parser)
+        if profiler is not None:
+            issue_dicts = profiler.iter('parse_issues', issue_dicts)
+    else:
+        with _span(profiler, 'parse_issues'):
+            issue_dicts = parse_issues(src, fast=fast_parser, processes=parse_processes)
+    return create_issues_in_jira(issue_dicts=issue_dicts,
+                                 source=os.path.abspath(src) if journal or sync else None,
+                                 profiler=profiler,
+                                 sync=sync,
+                                 **options)
+
+
+def text2jira(*, src, server_url, basic_auth, project_name, board_name, assignee_key, components, epic_link, max_results=MAX_RESULTS,
+              workers=1, cache_ttl=METADATA_CACHE_TTL, refresh_cache=False, stream=False, journal=True,
+              fast_parser=False, profile=None, engine='sync', sync=False, dedupe=None, parse_processes=1):
+    """Parse ``src`` and create its issues; returns their results, or only their number with ``stream``.
+
+    :param profile: path of a Chrome trace file to write a profile of the run to
+    :param parse_processes: processes parsing ``src`` (``None``: one per core), ignored when streaming
+    """
+    profiler = Profiler() if profile else None
+    try:
+        return _parse_and_create(src=src,
+                                 stream=stream,
+                                 journal=journal,
+                                 fast_parser=fast_parser,
+                                 parse_processes=parse_processes,
+                                 profiler=profiler,
+                                 server_url=server_url,
+                                 basic_auth=basic_auth,
+                                 project_name=project_name,
+                                 board_name=board_name,
+                                 assignee_key=assignee_key,
+                                 components=components,
+                                 epic_link=epic_link,
+                                 max_results=max_results,
+                                 workers=workers,
+                                 cache_ttl=cache_ttl,
+                                 refresh_cache=refresh_cache,
+                                 engine=engine,
+                                 sync=sync,
+                                 dedupe=dedupe)
+    finally:
+        if profiler is not None:
+            print(profiler.format_summary())
+            profiler.write_trace(profile)
+
+
+def expand_sources(srcs, pattern='*.txt'):
+    """Plan files of ``srcs``: files as given, the files of directories matching ``pattern`` and glob matches."""
+    expanded = []
+    for src in srcs:
+        if os.path.isdir(src):
+            expanded.extend(sorted(glob.glob(os.path.join(src, pattern))))
+        elif glob.has_magic(src):
+            expanded.extend(sorted(glob.glob(src)))
+        else:
+            expanded.append(src)
+    # a file given twice (e.g. directly and through its directory) is only run once
+    return list(dict.fromkeys(os.path.abspath(src) for src in expanded))
+
+
+def text2jira_batch(*, srcs, server_url, basic_auth, project_name, board_name, assignee_key, components, epic_link,
+                    max_results=MAX_RESULTS, workers=1, file_workers=4, cache_ttl=METADATA_CACHE_TTL,
+                    refresh_cache=False, stream=False, journal=True, fast_parser=False, profile=None, engine='sync',
+                    sync=False, dedupe=None, parse_processes=1):
+    """Parse and create the issues of many plan files (see ``expand_sources``) with one client and one resolution.
+
+    Project, board, components and epic are resolved once for all files, and the files are run by a pool of
+    ``file_workers`` threads over a single HTTP session. A file failing doesn't stop the others.
+    Returns a result per file: ``dict(src, issues, seconds, error)``, in the order of ``srcs``.
+    """
+    srcs = expand_sources(srcs)
+    if not srcs:
+        raise Exception('No plan file found')
+    file_workers = max(1, min(file_workers, len(srcs)))
+    profiler = Profiler() if profile else None
+    try:
+        with _span(profiler, 'connect'):
+            jira = _connect(server_url, basic_auth, pool_size=file_workers * workers)
+        if profiler is not None:
+            jira = _ProfiledJira(jira, profiler)
+        cache = MetadataCache(server_url, ttl=cache_ttl, refresh=refresh_cache)
+        lookups = dict(project_name=project_name, board_name=board_name, components=components, epic_link=epic_link)
+        metadata = _resolve_metadata(jira, cache, **lookups)
+
+        def _run(src):
+            start = time.perf_counter()
+            try:
+                results = _parse_and_create(src=src,
+                                            stream=stream,
+                                            journal=journal,
+                                            fast_parser=fast_parser,
+                                            parse_processes=parse_processes,
+                                            profiler=None,
+                                            server_url=server_url,
+                                            basic_auth=basic_auth,
+                                            project_name=project_name,
+                                            board_name=board_name,
+                                            assignee_key=assignee_key,
+                                            components=components,
+                                            epic_link=epic_link,
+                                            max_results=max_results,
+                                            workers=workers,
+                                            cache_ttl=cache_ttl,
+                                            jira=jira,
+                                            metadata=metadata,
+                                            engine=engine,
+                                            sync=sync,
+                                            dedupe=dedupe)
+                # (a stream only returns the number of its issues)
+                return dict(src=src, issues=results if isinstance(results, int) else len(results),
+                            seconds=time.perf_counter() - start, error=None)
+            except Exception as e:
+                return dict(src=src, issues=0, seconds=time.perf_counter() - start, error=str(e))
+
+        file_results = {}
+        pending = deque(srcs)
+        with ThreadPoolExecutor(max_workers=file_workers) as executor:
+            # at most file_workers files are parsed (and held in memory) at a time
+            in_flight = set()
+            while pending or in_flight:
+                while pending and len(in_flight) < file_workers:
+                    in_flight.add(executor.submit(_run, pending.popleft()))
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_result = future.result()
+                    file_results[file_result['src']] = file_result
+        return [file_results[src] for src in srcs]
+    finally:
+        if profiler is not None:
+            print(profiler.format_summary())
+            profiler.write_trace(profile)
+
+
+def format_batch_summary(file_results):
+    lines = ['{:<40} {:>7} {:>9}  {}'.format('file', 'issues', 'time [s]', 'status')]
+    for file_result in file_results:
+        src = os.path.relpath(file_result['src'])
+        status = 'ok' if file_result['error'] is None else file_result['error'].splitlines()[0]
+        lines.append('{:<40} {:>7} {:>9.2f}  {}'.format(src, file_result['issues'], file_result['seconds'], status))
+    failed = sum(1 for file_result in file_results if file_result['error'] is not None)
+    lines.append('{} file(s), {} failed, {} issue(s) created'.format(
+        len(file_results), failed, sum(file_result['issues'] for file_result in file_results)))
+    return '\n'.join(lines)
+
+
+def compile_payload(*, src, dst, server_url, basic_auth, project_name, board_name, assignee_key, components, epic_link,
+                    max_results=MAX_RESULTS, cache_ttl=METADATA_CACHE_TTL, refresh_cache=False, fast_parser=False,
+                    parse_processes=1, jira=None):
+    """Parse ``src``, resolve everything its issues depend on and write the payload of their creation to ``dst``.
+
+    The payload is a JSON lines file: a header (server, project, epic and sprint the issues are attached to), then an
+    entry per issue, each sub-task right after its task, with the REST fields of the issue (see ``replay_payload``).
+    Nothing is written to the server. Returns the number of issues of the payload.
+    """
+    issue_dicts = parse_issues(src, fast=fast_parser, processes=parse_processes)
+    if jira is None:
+        jira = _connect(server_url, basic_auth)
+    cache = MetadataCache(server_url, ttl=cache_ttl, refresh=refresh_cache)
+    metadata = _run_async(PREFLIGHT_MAX_LOOKUPS, _preflight, jira, cache, project_name=project_name,
+                          board_name=board_name, components=components, epic_link=epic_link,
+                          assignees=list(dict.fromkeys([assignee_key] + [issue_dict['assignee']
+                                                                         for issue_dict in issue_dicts
+                                                                         if issue_dict['assignee']])),
+                          sprint=any(issue_dict['add_to_sprint'] for issue_dict in issue_dicts),
                           max_results=max_results)
+    _check_assignees(metadata, issue_dicts)
+
+    sprint = metadata['sprint']
+    header = dict(format=PAYLOAD_FORMAT, version=PAYLOAD_VERSION, server_url=server_url,
+                  project_key=metadata['project']['key'], epic=metadata['epic'],
+                  sprint=dict(id=sprint.id, name=sprint.name) if sprint is not None else None,
+                  source=os.path.abspath(src))
+    count = 0
+    with open(dst, 'wt', encoding='utf-8') as payload_file:
+        payload_file.write(json.dumps(header) + '\n')
+        for issue_dict in issue_dicts:
+            task_index = count
+            payload_file.write(json.dumps(dict(line=issue_dict.line, parent=None,
+                                               add_to_sprint=issue_dict.add_to_sprint,
+                                               fields=_make_issue_fields(metadata, assignee_key, issue_dict,
+                                                                         False))) + '\n')
+            count += 1
+            for sub_issue_dict in issue_dict.sub_issues:
+                payload_file.write(json.dumps(dict(line=sub_issue_dict.line, parent=task_index,
+                                                   fields=_make_issue_fields(metadata, assignee_key, sub_issue_dict,
+                                                                             True))) + '\n')
+                count += 1
+    return count
+
+
+def _read_payload_header(payload_file):
+    try:
+        header = json.loads(payload_file.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != PAYLOAD_FORMAT:
+        raise Exception('not a text2jira payload: \'{}\''.format(payload_file.name))
+    if header.get('version') != PAYLOAD_VERSION:
+        raise Exception('unsupported payload version: {}'.format(header.get('version')))
+    return header
+
+
+def _iter_payload_tasks(payload_file):
+    # streams the tasks of a payload, each with its sub-tasks (the entries of the issues are the issue dicts of a
+    # replay: they have a summary and sub-issues, like the parsed ones, and their fields)
+    task = None
+    for index, line in enumerate(payload_file):
+        entry = json.loads(line)
+        entry['summary'] = entry['fields']['summary']
+        entry['sub_issues'] = []
+        parent = entry.pop('parent')
+        if parent is None:
+            if task is not None:
+                yield task
+            task, task_index = entry, index
+        elif task is None or parent != task_index:
+            raise Exception('malformed payload: issue {} doesn\'t follow its task'.format(index))
+        else:
+            task['sub_issues'].append(entry)
+    if task is not None:
+        yield task
+
+
+def replay_payload(*, src, basic_auth, bulk_size=BULK_CREATE_MAX_ISSUES, workers=1, engine='sync', journal=True,
+                   jira=None, progress=None, cancel_event=None):
+    """Create the issues of the payload ``src`` (see ``compile_payload``) and return a result per created issue.
+
+    The payload is streamed to the server as is: the fields of an issue only get the key of its parent, epic and
+    sprint are the ones of the payload. With ``journal``, a replay that failed is resumed by replaying it again.
+    ``progress`` and ``cancel_event`` are the ones of ``create_issues_in_jira``.
+    """
+    if engine not in ENGINES:
+        raise Exception('unknown engine: \'{}\''.format(engine))
+    with open(src, 'rt', encoding='utf-8') as payload_file:
+        header = _read_payload_header(payload_file)
+        if jira is None:
+            jira = _connect(header['server_url'], basic_auth, pool_size=workers if engine == 'async' else None)
+
+        def _issue_fields(issue_dict, parent_key):
+            if parent_key is None:
+                return issue_dict['fields']
+            return dict(issue_dict['fields'], parent={'key': parent_key})
+
+        sprint = header['sprint']
+        metadata = dict(project=dict(key=header['project_key']), epic=header['epic'],
+                        sprint=SimpleNamespace(**sprint) if sprint is not None else None)
+        pipeline = _CreationPipeline(jira, metadata, server_url=header['server_url'],
+                                     source=os.path.abspath(src) if journal else None, issue_fields=_issue_fields,
+                                     bulk_size=bulk_size, workers=workers, engine=engine, max_results=MAX_RESULTS,
+                                     progress=progress, cancel_event=cancel_event)
+        try:
+            created_keys, failures, top_level_issue_dicts = pipeline.create(_iter_payload_tasks(payload_file))
+            # there's nothing to refresh: the epic and the sprint are the ones that were reviewed
+            pipeline.finish(lambda kind: False)
+        finally:
+            pipeline.close()
 
+    results = _created_issues(top_level_issue_dicts, created_keys)
+    _raise_for_outcome(cancel_event is not None and cancel_event.is_set(), len(results), failures)
+    return results
 
-_DB = 'text2jira.db'
-
-
-def _get_db_connection():
-    conn = sqlite3.connect(_DB, isolation_level=None)
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='server_conns'")
-    results = cur.fetchall()
-    if not results:
-        conn.execute('''CREATE TABLE server_conns
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        url VARCHAR(100) NOT NULL,
-                        user VARCHAR(100) NOT NULL,
-                        password VARCHAR(100) NOT NULL)''')
-    return conn
-
-
-class AddServerConnDialog:
-    def __init__(self, parent):
-        self._top = tk.Toplevel(parent)
-        self._top.resizable(width=False, height=False)
-        self._top.geometry('{}x{}'.format(220, 155))
-        tk.Label(self._top, text='URL').pack()
-        self._url = tk.StringVar()
-        tk.Entry(self._top, textvariable=self._url).pack(padx=5)
-        tk.Label(self._top, text='User').pack()
-        self._user = tk.StringVar()
-        tk.Entry(self._top, textvariable=self._user).pack(padx=5)
-        tk.Label(self._top, text='Password').pack()
-        self._password = tk.StringVar()
-        tk.Entry(self._top, show='*', textvariable=self._password).pack(padx=5)
-        self._ok_button = tk.Button(self._top, text='OK', command=self.on_ok)
-        self._ok_button.pack(pady=5)
-
-    def on_init(self):
-        pass
-
-    @property
-    def url(self):
-        return self._url.get()
-
-    @property
-    def user(self):
-        return self._user.get()
-
-    @property
-    def password(self):
-        return self._password.get()
-
-    def on_ok(self):
-        self._top.destroy()
-
-    @classmethod
-    def show_modal(cls, parent, *args, **kwargs):
-        obj = cls(parent, *args, **kwargs)
-        parent.wait_window(obj._top)
-        return obj
-
-
-class RemoveServerConnDialog:
-    def __init__(self, parent):
-        self._top = tk.Toplevel(parent)
-        self._top.resizable(width=False, height=False)
-        self._top.geometry('{}x{}'.format(220, 160))
-        self._servers_listbox = tk.Listbox(self._top, selectmode='single', width=200, height=5)
-        self._servers_listbox.pack(padx=5, pady=5)
-        self._servers_listbox.bind('<<ListboxSelect>>', self.on_select_server_from_listbox)
-        self._ok_button = tk.Button(self._top, text='Find', command=self.on_find_servers)
-        self._ok_button.pack(padx=5, pady=5)
-        self._remove_button = tk.Button(self._top, text='Remove', command=self.on_remove_server, state='disabled')
-        self._remove_button.pack()
-        self._servers_idxs = []
-        self.update_servers_listbox()
-
-    def update_servers_listbox(self):
-        del self._servers_idxs[:]
-        conn = _get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT id, url FROM server_conns')
-        for row in cur:
-            self._servers_idxs.append(row[0])
-            self._servers_listbox.insert('end', row[1])
-
-    def on_find_servers(self):
-        self.clear_controls()
-        self.update_servers_listbox()
-
-    def on_remove_server(self):
-        self._remove_button.config(state='disabled')
-        idx = int(self._servers_listbox.curselection()[0])
-        self._servers_listbox.delete(idx)
-        conn = _get_db_connection()
-        conn.execute('DELETE FROM server_conns WHERE id = ?', (self._servers_idxs[idx],))
-        del self._servers_idxs[idx]
-
-    def on_select_server_from_listbox(self, evt):
-        self._remove_button.config(state='active')
-
-    def clear_controls(self):
-        self._remove_button.config(state='disabled')
-        self._servers_listbox.delete(0, 'end')
 
-    @classmethod
-    def show_modal(cls, parent, *args, **kwargs):
-        obj = cls(parent, *args, **kwargs)
-        parent.wait_window(obj._top)
-        return obj
-
-
-class Text2JiraGUI(tk.Frame):
-    def __init__(self, master):
-        super().__init__(master)
-        self._master = master
-        self._master.wm_title('text2jira')
-        self._master.resizable(width=False, height=False)
-        self._master.geometry('{}x{}'.format(300, 425))
-        menu_bar = tk.Menu(self._master)
-        file_menu = tk.Menu(menu_bar, tearoff=0)
-        file_menu.add_command(label='Load', command=self.on_load)
-        file_menu.add_command(label='Run', command=self.on_run)
-        file_menu.add_separator()
-        file_menu.add_command(label='Exit', command=self._master.quit)
-        menu_bar.add_cascade(label='File', menu=file_menu)
-        server_conn_menu = tk.Menu(menu_bar, tearoff=0)
-        server_conn_menu.add_command(label='Add', command=self.on_add_server_conn)
-        server_conn_menu.add_command(label='Remove', command=self.on_remove_server_conn)
-        menu_bar.add_cascade(label='Server Connection', menu=server_conn_menu)
-        self._master.config(menu=menu_bar)
-        tk.Label(self, text='Server Connection').pack()
-        self._servers_combobox = ttk.Combobox(self, width=200)
-        self._servers_combobox.pack(padx=5, pady=5)
-        tk.Label(self, text='Project').pack()
-        self._project_name = tk.StringVar()
-        tk.Entry(self, textvariable=self._project_name, width=200).pack(padx=5, pady=5)
-        tk.Label(self, text='Board').pack()
-        self._board_name = tk.StringVar()
-        tk.Entry(self, textvariable=self._board_name, width=200).pack(padx=5, pady=5)
-        tk.Label(self, text='Assignee').pack()
-        self._assignee_key = tk.StringVar()
-        tk.Entry(self, textvariable=self._assignee_key, width=200).pack(padx=5, pady=5)
-        tk.Label(self, text='Components').pack()
-        self._components = tk.StringVar()
-        tk.Entry(self, textvariable=self._components, width=200).pack(padx=5, pady=5)
-        tk.Label(self, text='Epic Link').pack()
-        self._epic_link = tk.StringVar()
-        tk.Entry(self, textvariable=self._epic_link, width=200).pack(padx=5, pady=5)
-        tk.Label(self, text='Filename').pack()
-        self._filename = tk.StringVar()
-        tk.Entry(self, textvariable=self._filename, state='disabled', width=200).pack(padx=5, pady=5)
-        tk.Button(self, text='Load', command=self.on_load).pack(padx=5, pady=5)
-        tk.Button(self, text='Run', command=self.on_run).pack(padx=5, pady=5)
-        self._server_conns = []
-        self.update_servers_combobox()
-        self.pack()
-
-    def on_select_server_from_combobox(self, evt):
-        pass
+class MetadataCache:
+    """Project, board, component, epic and user resolutions of a server, persisted in text2jira.db.
 
-    def update_servers_combobox(self):
-        conn = _get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT url, user, password FROM server_conns')
-        servers = []
-        for row in cur:
-            self._server_conns.append(dict(url=row[0], user=row[1], password=row[2]))
-            servers.append(row[0])
-        self._servers_combobox['values'] = servers
-
-    def on_remove_server_conn(self):
-        RemoveServerConnDialog.show_modal(self._master)
-        self.update_servers_combobox()
-
-    def on_add_server_conn(self):
-        dialog = AddServerConnDialog.show_modal(self._master)
-        conn = _get_db_connection()
-        conn.execute('INSERT INTO server_conns (url, user, password) VALUES (?, ?, ?)', (dialog.url,
-                                                                                         dialog.user,
-                                                                                         dialog.password))
-        self.update_servers_combobox()
-
-    def on_load(self):
-        filename = askopenfilename(parent=self._master)
-        if filename:
-            self._filename.set(filename)
-
-    def on_run(self):
-        server_conn_idx = self._servers_combobox.current()
-        if server_conn_idx == -1:
-            showerror('Error', 'You need to select a server connection')
-            return
-        else:
-            server_dict = self._server_conns[server_conn_idx]
-            server_url = server_dict['url']
-            basic_auth = [server_dict['user'], server_dict['password']]
+    A ``ttl`` of 0 disables the cache, ``refresh`` ignores (and overwrites) the cached resolutions. Expired
+    resolutions (of every server) are purged when a cache is created.
+    """
 
-        project_name = self._project_name.get()
-        if not project_name:
-            showerror('Error', 'You need to inform a project')
-            return
+    def __init__(self, server_url, *, ttl=METADATA_CACHE_TTL, refresh=False):
+        self._server_url = server_url
+        self._ttl = ttl
+        self._refresh = refresh
+        if ttl:
+            get_connection().execute('DELETE FROM metadata_cache WHERE expires_at <= ?', (time.time(),))
 
-        board_name = self._board_name.get()
-        if not board_name:
-            showerror('Error', 'You need to inform a board')
+    def get(self, kind, name):
+        if not self._ttl or self._refresh:
+            return None
+        cur = get_connection().execute('''SELECT value FROM metadata_cache
+                                          WHERE server_url = ? AND kind = ? AND name = ? AND expires_at > ?''',
+                                       (self._server_url, kind, name, time.time()))
+        row = cur.fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, kind, name, value):
+        if not self._ttl:
             return
+        get_connection().execute('''INSERT OR REPLACE INTO metadata_cache (server_url, kind, name, value, expires_at)
+                                    VALUES (?, ?, ?, ?, ?)''',
+                                 (self._server_url, kind, name, json.dumps(value), time.time() + self._ttl))
 
-        assignee_key = self._assignee_key.get()
-        if not assignee_key:
-            showerror('Error', 'You need to inform an assignee')
+    def invalidate(self, kind=None):
+        if not self._ttl:
             return
-
-        if self._components.get():
-            components = [component.strip() for component in self._components.get().split(',')]
+        if kind is None:
+            get_connection().execute('DELETE FROM metadata_cache WHERE server_url = ?', (self._server_url,))
         else:
-            components = None
-
-        epic_link = self._epic_link.get()
-
-        src = self._filename.get()
-        if not src:
-            showerror('Error', 'You need to inform an filename')
-            return
-
-        try:
-            text2jira(src=src,
-                      server_url=server_url,
-                      basic_auth=basic_auth,
-                      project_name=project_name,
-                      board_name=board_name,
-                      assignee_key=assignee_key,
-                      components=components,
-                      epic_link=epic_link)
-            showinfo('Info', 'text2jira ran successfully')
-        except Exception as e:
-            traceback.print_exc()
-            showerror('Error', str(e))
+            get_connection().execute('DELETE FROM metadata_cache WHERE server_url = ? AND kind = ?',
+                                     (self._server_url, kind))
+
+    def resolve(self, kind, name, fetch):
+        """Return ``(value, cached)``, calling ``fetch()`` and caching its result when there's no valid entry."""
+        value = self.get(kind, name)
+        if value is not None:
+            return value, True
+        value = fetch()
+        if value is not None:
+            self.put(kind, name, value)
+        return value, False
+
+
+class CreationJournal:
+    """Keys of the issues created from a source file, persisted in text2jira.db so that re-runs only send what's left.
+
+    Issues are identified by a hash of the source file and of their path in the tree (the summaries of the issue and
+    of its parent, with the number of same-summary siblings before them), so edits elsewhere in the file don't change
+    the identity of an issue.
+    The journal also knows what the created tasks still have to be added to: ``attachments(issue_dict, parent_key)``
+    tells what a created issue is going to be added to (``'epic'`` and ``'sprint'``), and ``attached`` clears it once
+    done. A run failing in between leaves it to the next run (see ``pending_attachments``).
+    """
+
+    def __init__(self, server_url, project_key, source, attachments=None):
+        self._server_url = server_url
+        self._project_key = project_key
+        self._source = source
+        self._attachments = attachments
+        cur = get_connection().execute('''SELECT content_hash, issue_key, pending_attachments FROM journal
+                                          WHERE server_url = ? AND project_key = ? AND source = ?''',
+                                       (server_url, project_key, source))
+        self._issue_keys = {}
+        self._pending = {}
+        for content_hash, issue_key, pending_attachments in cur:
+            self._issue_keys[content_hash] = issue_key
+            if pending_attachments:
+                self._pending[issue_key] = (content_hash, set(pending_attachments.split(',')))
+        self._hashes = {}
+        self._task_occurrences = {}
+
+    def _register(self, issue_dict, parent_path, occurrences):
+        summary = issue_dict['summary']
+        occurrence = occurrences.get(summary, 0)
+        occurrences[summary] = occurrence + 1
+        path = parent_path + [summary, occurrence]
+        self._hashes[id(issue_dict)] = hashlib.sha1(json.dumps([self._source] + path).encode('utf-8')).hexdigest()
+        sub_occurrences = {}
+        for sub_issue_dict in issue_dict['sub_issues']:
+            self._register(sub_issue_dict, path, sub_occurrences)
+
+    def existing_key(self, issue_dict, parent_key):
+        if parent_key is None and id(issue_dict) not in self._hashes:
+            self._register(issue_dict, [], self._task_occurrences)
+        return self._issue_keys.get(self._hashes[id(issue_dict)])
+
+    def forget(self, issue_dicts):
+        """Drop the hashes of issues that won't be asked about nor recorded anymore (e.g. released by a stream)."""
+        for issue_dict in issue_dicts:
+            self._hashes.pop(id(issue_dict), None)
+
+    def record(self, created):
+        """Journal the ``(issue_dict, parent_key, key)`` of created issues."""
+        rows = []
+        for issue_dict, parent_key, key in created:
+            content_hash = self._hashes[id(issue_dict)]
+            self._issue_keys[content_hash] = key
+            kinds = self._attachments(issue_dict, parent_key) if self._attachments is not None else ()
+            if kinds:
+                self._pending[key] = (content_hash, set(kinds))
+            rows.append((self._server_url, self._project_key, self._source, content_hash, key, time.time(),
+                         ','.join(kinds)))
+        # one transaction per batch (batches may be recorded by the threads of the run, each with its connection)
+        with transaction() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO journal
+                                (server_url, project_key, source, content_hash, issue_key, created_at,
+                                pending_attachments)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+
+    def pending_attachments(self, key):
+        """What the journaled issue ``key`` still has to be added to (a previous run failed before adding it)."""
+        return sorted(self._pending[key][1]) if key in self._pending else []
+
+    def attached(self, kind, keys):
+        """Clear the pending ``kind`` attachment of the issues of ``keys``."""
+        rows = []
+        for key in keys:
+            if key not in self._pending:
+                continue
+            content_hash, kinds = self._pending[key]
+            kinds.discard(kind)
+            if not kinds:
+                del self._pending[key]
+            rows.append((','.join(sorted(kinds)), self._server_url, self._project_key, self._source, content_hash))
+        if rows:
+            with transaction() as conn:
+                conn.executemany('''UPDATE journal SET pending_attachments = ?
+                                    WHERE server_url = ? AND project_key = ? AND source = ? AND content_hash = ?''',
+                                 rows)
+
+
+class SyncSnapshot:
+    """Issue tree of a source file as of its last sync, with the key of every issue, persisted in text2jira.db.
+
+    A new parse of the source is matched against it level by level (tasks, then the sub-tasks of every matched task),
+    aligning the summaries of the two versions: unchanged lines match, and so do lines edited in place.
+    """
+
+    def __init__(self, server_url, project_key, source):
+        self._server_url = server_url
+        self._project_key = project_key
+        self._source = source
+        cur = get_connection().execute('''SELECT tree FROM sync_snapshot
+                                          WHERE server_url = ? AND project_key = ? AND source = ?''',
+                                       (server_url, project_key, source))
+        row = cur.fetchone()
+        self.nodes = json.loads(row[0]) if row is not None else []
+
+    @staticmethod
+    def node(issue_dict, key, assignee):
+        return dict(key=key, summary=issue_dict['summary'], description=issue_dict['description'], assignee=assignee,
+                    add_to_sprint=issue_dict.get('add_to_sprint', False), sub_issues=[])
+
+    def match(self, issue_dicts):
+        """Map the ``id()`` of every issue dict that matches an issue of the snapshot to that issue's node."""
+        matches = {}
+
+        def _match(nodes, issue_dicts):
+            matcher = difflib.SequenceMatcher(None, [node['summary'] for node in nodes],
+                                              [issue_dict['summary'] for issue_dict in issue_dicts], autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                # a replaced block is a run of lines edited in place (its extra lines were added or removed)
+                if tag in ('equal', 'replace'):
+                    for node, issue_dict in zip(nodes[i1:i2], issue_dicts[j1:j2]):
+                        matches[id(issue_dict)] = node
+                        _match(node['sub_issues'], issue_dict['sub_issues'])
+
+        _match(self.nodes, issue_dicts)
+        return matches
+
+    def save(self, nodes):
+        get_connection().execute('''INSERT OR REPLACE INTO sync_snapshot
+                                    (server_url, project_key, source, tree, synced_at)
+                                    VALUES (?, ?, ?, ?, ?)''',
+                                 (self._server_url, self._project_key, self._source, json.dumps(nodes), time.time()))
+        self.nodes = nodes
+
+
+# the GUI is only imported when one of its names is used, so that headless runs don't pay for tkinter
+_GUI_NAMES = ('AddServerConnDialog', 'RemoveServerConnDialog', 'Text2JiraGUI')
+
+
+def __getattr__(name):
+    if name in _GUI_NAMES:
+        import text2jira_gui
+        return getattr(text2jira_gui, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def main():
@@ -423,7 +2087,14 @@ def main():
         return {'true': True, '1': True}.get(value.lower(), False)
 
     parser = argparse.ArgumentParser()
-    parser.add_argument('--src', type=str, required=False, help='')
+    parser.add_argument('command', type=str, nargs='?', choices=COMMANDS, default='run',
+                        help='run (default): create the issues of src; compile: write the payload of their creation to '
+                             '--payload without writing to the server; replay: create the issues of --payload; '
+                             'serve: run the plans submitted to a local HTTP API with the stored server connections '
+                             '(compile, replay and serve don\'t need --no-gui)')
+    parser.add_argument('--payload', type=str, required=False, help='payload file to compile to or to replay')
+    parser.add_argument('--src', type=str, nargs='+', required=False,
+                        help='plan file(s); several files, directories (of *.txt files) or globs run as a batch')
     parser.add_argument('--server_url', type=str, required=False, help='server URL')
     parser.add_argument('--basic_auth', type=str, nargs=2, required=False, help='username and password')
     parser.add_argument('--project_name', type=str, required=False, help='project name')
@@ -431,9 +2102,62 @@ def main():
     parser.add_argument('--assignee_key', type=str, required=False, help='assignee key')
     parser.add_argument('--components', type=str, nargs='*', required=False, help='components')
     parser.add_argument('--epic_link', type=str, required=False, help='epic link')
+    parser.add_argument('--workers', type=int, required=False, default=1,
+                        help='number of issue batches created concurrently (requests in flight for the async engine)')
+    parser.add_argument('--engine', type=str, choices=ENGINES, required=False, default='sync',
+                        help='sync: a pool of threads; async: an event loop (still sending every request from a '
+                             'thread, as the jira client is blocking)')
+    parser.add_argument('--file_workers', type=int, required=False, default=4,
+                        help='number of plan files run concurrently in a batch')
+    parser.add_argument('--refresh-cache', type=_str_to_bool, nargs='?', const='true', required=False, default=False,
+                        help='ignore cached project, board, component and epic resolutions')
+    parser.add_argument('--cache_ttl', type=int, required=False, default=METADATA_CACHE_TTL,
+                        help='seconds a metadata resolution stays cached (0 disables the cache)')
+    parser.add_argument('--stream', type=_str_to_bool, nargs='?', const='true', required=False, default=False,
+                        help='start creating issues while src is still being parsed, releasing them once created, '
+                             'so that huge files run in a flat memory (a parsing error aborts the run after the '
+                             'issues before it were created)')
+    parser.add_argument('--fast_parser', type=_str_to_bool, nargs='?', const='true', required=False, default=False,
+                        help='parse src as a whole buffer (faster for huge files)')
+    parser.add_argument('--parse_processes', type=int, required=False, default=1,
+                        help='number of processes parsing src (0: one per core; worth it for huge files on '
+                             'multi-core machines, ignored with --stream)')
+    parser.add_argument('--journal', type=_str_to_bool, required=False, default=True,
+                        help='skip the issues of src created by a previous run (default: true)')
+    parser.add_argument('--sync', type=_str_to_bool, nargs='?', const='true', required=False, default=False,
+                        help='only send what changed in src since its last sync: create new issues, update edited '
+                             'ones and move the ones whose (X) changed in or out of the sprint')
+    parser.add_argument('--dedupe', type=str, choices=DEDUPE_MODES, required=False,
+                        help='don\'t create the tasks whose summary matches an issue of the project: skip them, or '
+                             'link them to the existing issue (which keeps its epic and sprint, and gets their '
+                             'missing sub-tasks)')
+    parser.add_argument('--profile', type=str, required=False,
+                        help='print a summary of the calls to the server and write their trace (Chrome trace '
+                             'format) to this file')
+    parser.add_argument('--host', type=str, required=False, default='127.0.0.1',
+                        help='address served by serve (an address other than loopback needs --token)')
+    parser.add_argument('--port', type=int, required=False, default=8347, help='port served by serve')
+    parser.add_argument('--token', type=str, required=False,
+                        help='token the requests to serve are authenticated with (Authorization: Bearer <token>); '
+                             'defaults to the TEXT2JIRA_TOKEN environment variable')
+    parser.add_argument('--job_workers', type=int, required=False, default=2,
+                        help='number of plans run concurrently by serve')
     parser.add_argument('--no-gui', type=_str_to_bool, required=False, default=False)
     args = parser.parse_args()
-    if args.no_gui:
+    if args.command == 'serve':
+        # the service (and its HTTP server) is only imported when serving
+        from text2jira_service import serve
+        serve(host=args.host, port=args.port, token=args.token or os.environ.get('TEXT2JIRA_TOKEN'),
+              job_workers=args.job_workers, workers=args.workers, engine=args.engine,
+              cache_ttl=args.cache_ttl)
+    elif args.command == 'replay':
+        if args.payload is None or args.basic_auth is None:
+            print('payload and basic_auth cannot be None')
+            exit(-1)
+        results = replay_payload(src=args.payload, basic_auth=args.basic_auth, workers=args.workers,
+                                 engine=args.engine, journal=args.journal)
+        print('{} issue(s) created'.format(len(results)))
+    elif args.no_gui or args.command == 'compile':
         if args.src is None:
             print('src cannot be None')
             exit(-1)
@@ -458,18 +2182,80 @@ def main():
             print('board_name cannot be None')
             exit(-1)
 
+        if args.command == 'compile':
+            if args.payload is None:
+                print('payload cannot be None')
+                exit(-1)
+            if len(args.src) > 1 or os.path.isdir(args.src[0]) or glob.has_magic(args.src[0]):
+                print('compile takes a single plan file')
+                exit(-1)
+            count = compile_payload(src=args.src[0],
+                                    dst=args.payload,
+                                    server_url=args.server_url,
+                                    basic_auth=args.basic_auth,
+                                    project_name=args.project_name,
+                                    board_name=args.board_name,
+                                    assignee_key=args.assignee_key,
+                                    components=args.components,
+                                    epic_link=args.epic_link,
+                                    cache_ttl=args.cache_ttl,
+                                    refresh_cache=args.refresh_cache,
+                                    fast_parser=args.fast_parser,
+                                    parse_processes=args.parse_processes or None)
+            print('{} issue(s) compiled to {}'.format(count, args.payload))
+            exit(0)
+
+        if len(args.src) > 1 or os.path.isdir(args.src[0]) or glob.has_magic(args.src[0]):
+            file_results = text2jira_batch(srcs=args.src,
+                                           server_url=args.server_url,
+                                           basic_auth=args.basic_auth,
+                                           project_name=args.project_name,
+                                           board_name=args.board_name,
+                                           assignee_key=args.assignee_key,
+                                           components=args.components,
+                                           epic_link=args.epic_link,
+                                           workers=args.workers,
+                                           file_workers=args.file_workers,
+                                           cache_ttl=args.cache_ttl,
+                                           refresh_cache=args.refresh_cache,
+                                           stream=args.stream,
+                                           journal=args.journal,
+                                           fast_parser=args.fast_parser,
+                                           profile=args.profile,
+                                           engine=args.engine,
+                                           sync=args.sync,
+                                           dedupe=args.dedupe,
+                                           parse_processes=args.parse_processes or None)
+            print(format_batch_summary(file_results))
+            if any(file_result['error'] is not None for file_result in file_results):
+                exit(-1)
+            return
+
         # try:
-        text2jira(src=args.src,
+        text2jira(src=args.src[0],
                   server_url=args.server_url,
                   basic_auth=args.basic_auth,
                   project_name=args.project_name,
                   board_name=args.board_name,
                   assignee_key=args.assignee_key,
                   components=args.components,
-                  epic_link=args.epic_link)
+                  epic_link=args.epic_link,
+                  workers=args.workers,
+                  cache_ttl=args.cache_ttl,
+                  refresh_cache=args.refresh_cache,
+                  stream=args.stream,
+                  journal=args.journal,
+                  fast_parser=args.fast_parser,
+                  profile=args.profile,
+                  engine=args.engine,
+                  sync=args.sync,
+                  dedupe=args.dedupe,
+                  parse_processes=args.parse_processes or None)
         # except Exception as e:
         #     print(str(e))
     else:
+        import tkinter as tk
+        from text2jira_gui import Text2JiraGUI
         root = tk.Tk()
         app = Text2JiraGUI(root)
         app.mainloop()
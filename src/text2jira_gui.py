@@ -0,0 +1,327 @@
+import os
+import queue
+import threading
+import time
+import tkinter as tk
+import tkinter.ttk as ttk
+import traceback
+from tkinter.filedialog import askopenfilename
+from tkinter.messagebox import showinfo, showerror
+
+from text2jira import MAX_RESULTS, _count_issues, create_issues_in_jira, parse_issues
+from text2jira_storage import add_server_conn, list_server_conns, remove_server_conn
+
+# milliseconds between two polls of the events of a running import
+_POLL_INTERVAL = 100
+
+
+class AddServerConnDialog:
+    def __init__(self, parent):
+        self._top = tk.Toplevel(parent)
+        self._top.resizable(width=False, height=False)
+        self._top.geometry('{}x{}'.format(220, 155))
+        tk.Label(self._top, text='URL').pack()
+        self._url = tk.StringVar()
+        tk.Entry(self._top, textvariable=self._url).pack(padx=5)
+        tk.Label(self._top, text='User').pack()
+        self._user = tk.StringVar()
+        tk.Entry(self._top, textvariable=self._user).pack(padx=5)
+        tk.Label(self._top, text='Password').pack()
+        self._password = tk.StringVar()
+        tk.Entry(self._top, show='*', textvariable=self._password).pack(padx=5)
+        self._ok_button = tk.Button(self._top, text='OK', command=self.on_ok)
+        self._ok_button.pack(pady=5)
+
+    def on_init(self):
+        pass
+
+    @property
+    def url(self):
+        return self._url.get()
+
+    @property
+    def user(self):
+        return self._user.get()
+
+    @property
+    def password(self):
+        return self._password.get()
+
+    def on_ok(self):
+        self._top.destroy()
+
+    @classmethod
+    def show_modal(cls, parent, *args, **kwargs):
+        obj = cls(parent, *args, **kwargs)
+        parent.wait_window(obj._top)
+        return obj
+
+
+class RemoveServerConnDialog:
+    def __init__(self, parent):
+        self._top = tk.Toplevel(parent)
+        self._top.resizable(width=False, height=False)
+        self._top.geometry('{}x{}'.format(220, 160))
+        self._servers_listbox = tk.Listbox(self._top, selectmode='single', width=200, height=5)
+        self._servers_listbox.pack(padx=5, pady=5)
+        self._servers_listbox.bind('<<ListboxSelect>>', self.on_select_server_from_listbox)
+        self._ok_button = tk.Button(self._top, text='Find', command=self.on_find_servers)
+        self._ok_button.pack(padx=5, pady=5)
+        self._remove_button = tk.Button(self._top, text='Remove', command=self.on_remove_server, state='disabled')
+        self._remove_button.pack()
+        self._servers_idxs = []
+        self.update_servers_listbox()
+
+    def update_servers_listbox(self):
+        del self._servers_idxs[:]
+        for server_conn in list_server_conns():
+            self._servers_idxs.append(server_conn['id'])
+            self._servers_listbox.insert('end', server_conn['url'])
+
+    def on_find_servers(self):
+        self.clear_controls()
+        self.update_servers_listbox()
+
+    def on_remove_server(self):
+        self._remove_button.config(state='disabled')
+        idx = int(self._servers_listbox.curselection()[0])
+        self._servers_listbox.delete(idx)
+        remove_server_conn(self._servers_idxs[idx])
+        del self._servers_idxs[idx]
+
+    def on_select_server_from_listbox(self, evt):
+        self._remove_button.config(state='active')
+
+    def clear_controls(self):
+        self._remove_button.config(state='disabled')
+        self._servers_listbox.delete(0, 'end')
+
+    @classmethod
+    def show_modal(cls, parent, *args, **kwargs):
+        obj = cls(parent, *args, **kwargs)
+        parent.wait_window(obj._top)
+        return obj
+
+
+class Text2JiraGUI(tk.Frame):
+    def __init__(self, master):
+        super().__init__(master)
+        self._master = master
+        self._master.wm_title('text2jira')
+        self._master.resizable(width=False, height=False)
+        self._master.geometry('{}x{}'.format(300, 640))
+        menu_bar = tk.Menu(self._master)
+        file_menu = tk.Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label='Load', command=self.on_load)
+        file_menu.add_command(label='Run', command=self.on_run)
+        file_menu.add_separator()
+        file_menu.add_command(label='Exit', command=self._master.quit)
+        menu_bar.add_cascade(label='File', menu=file_menu)
+        server_conn_menu = tk.Menu(menu_bar, tearoff=0)
+        server_conn_menu.add_command(label='Add', command=self.on_add_server_conn)
+        server_conn_menu.add_command(label='Remove', command=self.on_remove_server_conn)
+        menu_bar.add_cascade(label='Server Connection', menu=server_conn_menu)
+        self._master.config(menu=menu_bar)
+        tk.Label(self, text='Server Connection').pack()
+        self._servers_combobox = ttk.Combobox(self, width=200)
+        self._servers_combobox.pack(padx=5, pady=5)
+        tk.Label(self, text='Project').pack()
+        self._project_name = tk.StringVar()
+        tk.Entry(self, textvariable=self._project_name, width=200).pack(padx=5, pady=5)
+        tk.Label(self, text='Board').pack()
+        self._board_name = tk.StringVar()
+        tk.Entry(self, textvariable=self._board_name, width=200).pack(padx=5, pady=5)
+        tk.Label(self, text='Assignee').pack()
+        self._assignee_key = tk.StringVar()
+        tk.Entry(self, textvariable=self._assignee_key, width=200).pack(padx=5, pady=5)
+        tk.Label(self, text='Components').pack()
+        self._components = tk.StringVar()
+        tk.Entry(self, textvariable=self._components, width=200).pack(padx=5, pady=5)
+        tk.Label(self, text='Epic Link').pack()
+        self._epic_link = tk.StringVar()
+        tk.Entry(self, textvariable=self._epic_link, width=200).pack(padx=5, pady=5)
+        tk.Label(self, text='Filename').pack()
+        self._filename = tk.StringVar()
+        tk.Entry(self, textvariable=self._filename, state='disabled', width=200).pack(padx=5, pady=5)
+        tk.Button(self, text='Load', command=self.on_load).pack(padx=5, pady=5)
+        self._run_button = tk.Button(self, text='Run', command=self.on_run)
+        self._run_button.pack(padx=5, pady=5)
+        self._progress_bar = ttk.Progressbar(self, orient='horizontal', mode='determinate')
+        self._progress_bar.pack(fill='x', padx=5, pady=5)
+        self._status = tk.StringVar()
+        tk.Label(self, textvariable=self._status).pack()
+        self._log = tk.Text(self, width=200, height=8, state='disabled')
+        self._log.pack(padx=5, pady=5)
+        self._cancel_button = tk.Button(self, text='Cancel', command=self.on_cancel, state='disabled')
+        self._cancel_button.pack(padx=5, pady=5)
+        self._events = queue.Queue()
+        self._cancel_event = None
+        self._server_conns = []
+        self.update_servers_combobox()
+        self.pack()
+
+    def on_select_server_from_combobox(self, evt):
+        pass
+
+    def update_servers_combobox(self):
+        # the combobox lists the connections in the order of _server_conns
+        self._server_conns = list_server_conns()
+        self._servers_combobox['values'] = [server_conn['url'] for server_conn in self._server_conns]
+
+    def on_remove_server_conn(self):
+        RemoveServerConnDialog.show_modal(self._master)
+        self.update_servers_combobox()
+
+    def on_add_server_conn(self):
+        dialog = AddServerConnDialog.show_modal(self._master)
+        add_server_conn(dialog.url, dialog.user, dialog.password)
+        self.update_servers_combobox()
+
+    def on_load(self):
+        filename = askopenfilename(parent=self._master)
+        if filename:
+            self._filename.set(filename)
+
+    def on_run(self):
+        server_conn_idx = self._servers_combobox.current()
+        if server_conn_idx == -1:
+            showerror('Error', 'You need to select a server connection')
+            return
+        else:
+            server_dict = self._server_conns[server_conn_idx]
+            server_url = server_dict['url']
+            basic_auth = [server_dict['user'], server_dict['password']]
+
+        project_name = self._project_name.get()
+        if not project_name:
+            showerror('Error', 'You need to inform a project')
+            return
+
+        board_name = self._board_name.get()
+        if not board_name:
+            showerror('Error', 'You need to inform a board')
+            return
+
+        assignee_key = self._assignee_key.get()
+        if not assignee_key:
+            showerror('Error', 'You need to inform an assignee')
+            return
+
+        if self._components.get():
+            components = [component.strip() for component in self._components.get().split(',')]
+        else:
+            components = None
+
+        epic_link = self._epic_link.get()
+
+        src = self._filename.get()
+        if not src:
+            showerror('Error', 'You need to inform an filename')
+            return
+
+        if self._cancel_event is not None:
+            showerror('Error', 'text2jira is already running')
+            return
+
+        self._cancel_event = threading.Event()
+        self._run_button.config(state='disabled')
+        self._cancel_button.config(state='active')
+        self._progress_bar['value'] = 0
+        self._status.set('Parsing...')
+        self._log.config(state='normal')
+        self._log.delete('1.0', 'end')
+        self._log.config(state='disabled')
+        threading.Thread(target=self._run,
+                         kwargs=dict(src=src,
+                                     server_url=server_url,
+                                     basic_auth=basic_auth,
+                                     project_name=project_name,
+                                     board_name=board_name,
+                                     assignee_key=assignee_key,
+                                     components=components,
+                                     epic_link=epic_link,
+                                     cancel_event=self._cancel_event),
+                         daemon=True).start()
+        self.after(_POLL_INTERVAL, self._poll_events)
+
+    def on_cancel(self):
+        self._cancel_button.config(state='disabled')
+        self._status.set('Cancelling (waiting for the requests in flight)...')
+        self._cancel_event.set()
+
+    def _run(self, *, src, cancel_event, **kwargs):
+        # runs on a worker thread: the Tk widgets are only touched by _poll_events, on the main thread
+        try:
+            issue_dicts = parse_issues(src)
+            self._events.put(('start', _count_issues(issue_dicts)))
+
+            def _progress(done, failures):
+                self._events.put(('progress', done, failures))
+
+            create_issues_in_jira(issue_dicts=issue_dicts,
+                                  max_results=MAX_RESULTS,
+                                  source=os.path.abspath(src),
+                                  progress=_progress,
+                                  cancel_event=cancel_event,
+                                  **kwargs)
+            self._events.put(('done', None))
+        except Exception as e:
+            traceback.print_exc()
+            self._events.put(('done', e))
+
+    def _poll_events(self):
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'start':
+                self._total = event[1]
+                self._done = 0
+                self._started_at = time.monotonic()
+                self._progress_bar.config(maximum=max(self._total, 1))
+                self._status.set('0/{} issues'.format(self._total))
+            elif event[0] == 'progress':
+                self._on_progress(*event[1:])
+            else:
+                self._on_done(event[1])
+                return
+        self.after(_POLL_INTERVAL, self._poll_events)
+
+    def _on_progress(self, done, failures):
+        self._done += len(done) + len(failures)
+        self._progress_bar['value'] = self._done
+        elapsed = time.monotonic() - self._started_at
+        rate = self._done / elapsed if elapsed > 0 else 0
+        if rate > 0:
+            eta = int(max(self._total - self._done, 0) / rate)
+            self._status.set('{}/{} issues, {:.1f} issues/s, ETA {}:{:02d}'.format(self._done, self._total, rate,
+                                                                                   eta // 60, eta % 60))
+        lines = ['{} {}'.format(key, issue_dict['summary']) for issue_dict, key in done]
+        lines.extend('failed (line {}): {}'.format(issue_dict.get('line', '?'), issue_dict['summary'])
+                     for issue_dict, _, _ in failures)
+        self._append_log(lines)
+
+    def _append_log(self, lines):
+        self._log.config(state='normal')
+        for line in lines:
+            self._log.insert('end', line + '\n')
+        self._log.see('end')
+        self._log.config(state='disabled')
+
+    def _on_done(self, error):
+        cancelled = self._cancel_event.is_set()
+        self._cancel_event = None
+        self._run_button.config(state='active')
+        self._cancel_button.config(state='disabled')
+        if error is None:
+            self._status.set('Done')
+            showinfo('Info', 'text2jira ran successfully')
+        elif cancelled:
+            self._status.set('Cancelled')
+            self._append_log([str(error)])
+            showinfo('Info', str(error))
+        else:
+            self._status.set('Failed')
+            self._append_log(str(error).splitlines())
+            showerror('Error', str(error))
@@ -0,0 +1,348 @@
+"""Long-running text2jira: plans submitted over a local HTTP API are run with warm clients and resolutions.
+
+    text2jira serve --port 8347
+
+Every stored server connection (see ``server_conns``) keeps one authenticated client, and the project, board,
+components and epic of a run are only resolved by the first job needing them. Jobs are queued and run by a pool of
+``job_workers`` threads. The API speaks JSON:
+
+    GET    /servers     the stored server connections (``id`` and ``url``)
+    POST   /jobs        submit a plan: ``server`` (id or url of a stored connection), ``plan`` (the text of a plan
+                        file), ``project_name``, ``board_name``, ``assignee_key`` and optionally ``components``,
+                        ``epic_link``, ``dedupe``, ``source`` (name of the plan, to journal and sync it like a file)
+                        and ``sync``. Answers 202 with the job, or 200 once it's finished with ``wait``
+    GET    /jobs/<id>   the job: ``status`` (queued, running, done, failed or cancelled), ``progress``
+                        (``done`` and ``total`` issues), the created ``issues`` and the ``error``
+    DELETE /jobs/<id>   cancel the job (the issues created so far are kept)
+
+The API creates issues with the stored credentials: it's only served on a loopback address, unless requests are
+authenticated with a ``token`` (``Authorization: Bearer <token>``).
+"""
+import hmac
+import ipaddress
+import itertools
+import json
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from text2jira import (DEDUPE_MODES, MAX_RESULTS, METADATA_CACHE_TTL, MetadataCache, _connect, _count_issues,
+                       _resolve_metadata, create_issues_in_jira, parse_lines)
+from text2jira_storage import find_server_conn, list_server_conns
+
+SERVICE_PORT = 8347
+# finished jobs kept for their clients to read
+MAX_FINISHED_JOBS = 1000
+
+_JOB_PATH_MATCHER = re.compile(r'^/jobs/(\d+)$')
+# resolutions reused by the jobs are treated as cached ones: a stale one is resolved again on failure
+_REUSED_KINDS = frozenset(('project', 'component', 'board', 'epic'))
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class _Job:
+    def __init__(self, job_id, conn_id, lookups, options, issue_dicts):
+        self.id = job_id
+        self.conn_id = conn_id
+        self.lookups = lookups
+        self.options = options
+        self.issue_dicts = issue_dicts
+        self.status = 'queued'
+        self.done = 0
+        self.total = _count_issues(issue_dicts)
+        self.results = []
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+
+    def to_json(self):
+        return dict(id=self.id, status=self.status, progress=dict(done=self.done, total=self.total),
+                    issues=[dict(key=result.key, summary=result['issue_dict']['summary'],
+                                 issue_type=result['issue_type'], line=result['issue_dict']['line'])
+                            for result in self.results],
+                    error=self.error, submitted_at=self.submitted_at, finished_at=self.finished_at)
+
+
+class Text2JiraService:
+    """Queue of the plans to create, run with a client per stored server connection and reused resolutions.
+
+    ``workers`` and ``engine`` are the ones of ``create_issues_in_jira`` for every job. Resolutions are reused for
+    ``cache_ttl`` seconds (and persisted like the ones of the other runs), a job failing drops the ones it used.
+    """
+
+    def __init__(self, *, job_workers=2, workers=1, engine='sync', cache_ttl=METADATA_CACHE_TTL,
+                 max_results=MAX_RESULTS):
+        self._workers = workers
+        self._engine = engine
+        self._cache_ttl = cache_ttl
+        self._max_results = max_results
+        self._pool_size = job_workers * workers
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._client_locks = {}
+        self._metadata = {}
+        self._jobs = OrderedDict()
+        self._job_ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(job_workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def servers(self):
+        return [dict(id=server_conn['id'], url=server_conn['url']) for server_conn in list_server_conns()]
+
+    def _server_conn(self, server):
+        server_conn = find_server_conn(server)
+        if server_conn is None:
+            raise ServiceError(400, 'unknown server connection: \'{}\''.format(server))
+        return server_conn
+
+    def _client(self, conn_id):
+        # one client per connection, connected once even when its first jobs run concurrently
+        with self._lock:
+            client_lock = self._client_locks.setdefault(conn_id, threading.Lock())
+        with client_lock:
+            if conn_id not in self._clients:
+                server_conn = self._server_conn(conn_id)
+                basic_auth = [server_conn['user'], server_conn['password']]
+                self._clients[conn_id] = (server_conn['url'], basic_auth,
+                                          _connect(server_conn['url'], basic_auth, pool_size=self._pool_size))
+            return self._clients[conn_id]
+
+    def submit(self, request):
+        """Parse the plan of ``request`` (see the module) and queue its creation; returns the job."""
+        if not isinstance(request, dict):
+            raise ServiceError(400, 'a job is a JSON object')
+        for name in ('server', 'plan', 'project_name', 'board_name', 'assignee_key'):
+            if not request.get(name):
+                raise ServiceError(400, '\'{}\' is required'.format(name))
+        # bool is an int too, but not the id of a connection
+        if not isinstance(request['server'], (int, str)) or isinstance(request['server'], bool):
+            raise ServiceError(400, '\'server\' is the id or the url of a server connection')
+        for name in ('plan', 'project_name', 'board_name', 'assignee_key', 'epic_link', 'source'):
+            if request.get(name) is not None and not isinstance(request[name], str):
+                raise ServiceError(400, '\'{}\' is a string'.format(name))
+        components = request.get('components')
+        if components is not None and (not isinstance(components, list)
+                                       or not all(isinstance(component, str) for component in components)):
+            raise ServiceError(400, '\'components\' is a list of strings')
+        if request.get('dedupe') not in (None,) + DEDUPE_MODES:
+            raise ServiceError(400, 'unknown dedupe mode: \'{}\''.format(request['dedupe']))
+        if request.get('sync') and not request.get('source'):
+            raise ServiceError(400, 'sync needs the source of the plan')
+        conn_id = self._server_conn(request['server'])['id']
+        try:
+            issue_dicts = parse_lines(request['plan'].splitlines(True))
+        except Exception as e:
+            raise ServiceError(400, str(e))
+        lookups = dict(project_name=request['project_name'], board_name=request['board_name'],
+                       components=components or None,
+                       epic_link=request.get('epic_link') or None)
+        options = dict(assignee_key=request['assignee_key'], source=request.get('source'),
+                       sync=bool(request.get('sync')), dedupe=request.get('dedupe'))
+        with self._lock:
+            job = _Job(next(self._job_ids), conn_id, lookups, options, issue_dicts)
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        self._queue.put(job)
+        return job
+
+    def _forget_finished_jobs(self):
+        finished_ids = [job_id for job_id, job in self._jobs.items() if job.finished.is_set()]
+        for job_id in finished_ids[:max(0, len(finished_ids) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, 'unknown job: {}'.format(job_id))
+        return job
+
+    def cancel(self, job_id):
+        job = self.job(job_id)
+        job.cancel_event.set()
+        return job
+
+    def _resolve(self, job, jira, server_url):
+        key = (job.conn_id, json.dumps(job.lookups, sort_keys=True))
+        with self._lock:
+            metadata, resolved_at = self._metadata.get(key, (None, 0.0))
+        if metadata is not None and time.time() - resolved_at < self._cache_ttl:
+            return key, dict(metadata, cached_kinds=set(_REUSED_KINDS))
+        metadata = _resolve_metadata(jira, MetadataCache(server_url, ttl=self._cache_ttl), **job.lookups)
+        if self._cache_ttl:
+            with self._lock:
+                self._metadata[key] = (metadata, time.time())
+        return key, metadata
+
+    def _run(self, job):
+        server_url, basic_auth, jira = self._client(job.conn_id)
+        metadata_key, metadata = self._resolve(job, jira, server_url)
+
+        def _progress(done, failures):
+            job.done += len(done)
+
+        try:
+            job.results = create_issues_in_jira(issue_dicts=job.issue_dicts, server_url=server_url,
+                                                basic_auth=basic_auth, max_results=self._max_results,
+                                                workers=self._workers, cache_ttl=self._cache_ttl, jira=jira,
+                                                progress=_progress, cancel_event=job.cancel_event, metadata=metadata,
+                                                engine=self._engine, **job.lookups, **job.options)
+        except Exception:
+            with self._lock:
+                self._metadata.pop(metadata_key, None)
+            raise
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+            else:
+                job.status = 'running'
+                try:
+                    self._run(job)
+                    job.status = 'done'
+                except Exception as e:
+                    job.status = 'cancelled' if job.cancel_event.is_set() else 'failed'
+                    job.error = getattr(e, 'text', None) or str(e)
+            job.finished_at = time.time()
+            job.finished.set()
+
+    def close(self):
+        """Cancel the queued jobs and wait for the running ones."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.status == 'queued':
+                job.cancel_event.set()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _check_host(host, token):
+    if token is None and not _is_loopback(host):
+        raise Exception('serving on {} (not a loopback address) needs a token'.format(host))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    service = None
+    token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method, path):
+        if path == '/servers' and method == 'GET':
+            return 200, self.service.servers()
+        if path == '/jobs' and method == 'POST':
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                # the body can't be skipped: the connection is closed after the answer
+                self.close_connection = True
+                raise ServiceError(400, 'invalid Content-Length')
+            try:
+                request = json.loads(self.rfile.read(length) or b'null')
+            except ValueError:
+                raise ServiceError(400, 'a job is a JSON object')
+            job = self.service.submit(request)
+            if request.get('wait'):
+                job.finished.wait()
+                return 200, job.to_json()
+            return 202, job.to_json()
+        match = _JOB_PATH_MATCHER.match(path)
+        if match and method == 'GET':
+            return 200, self.service.job(int(match.group(1))).to_json()
+        if match and method == 'DELETE':
+            return 200, self.service.cancel(int(match.group(1))).to_json()
+        raise ServiceError(404, 'not found: {} {}'.format(method, path))
+
+    def _authorized(self):
+        if self.token is None:
+            return True
+        return hmac.compare_digest(self.headers.get('Authorization', ''), 'Bearer {}'.format(self.token))
+
+    def _dispatch(self, method):
+        try:
+            if not self._authorized():
+                # the body of the request isn't read: the connection can't be reused
+                self.close_connection = True
+                raise ServiceError(401, 'unauthorized')
+            status, payload = self._handle(method, urlparse(self.path).path)
+        except ServiceError as e:
+            status, payload = e.status, dict(error=str(e))
+        except Exception as e:
+            # a bug of the service: the client still gets an answer, and the connection isn't reused
+            self.close_connection = True
+            status, payload = 500, dict(error='{}: {}'.format(type(e).__name__, e))
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+def make_server(service, host='127.0.0.1', port=SERVICE_PORT, token=None):
+    """HTTP server of the API of ``service`` (call ``serve_forever()`` on it); see the module for the ``token``."""
+    _check_host(host, token)
+
+    class Handler(_Handler):
+        pass
+
+    Handler.service = service
+    Handler.token = token
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+def serve(*, host='127.0.0.1', port=SERVICE_PORT, token=None, **options):
+    """Serve a ``Text2JiraService`` (created with ``options``) until interrupted."""
+    _check_host(host, token)
+    service = Text2JiraService(**options)
+    httpd = make_server(service, host, port, token)
+    print('text2jira serving on http://{}:{}'.format(*httpd.server_address[:2]))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
@@ -0,0 +1,135 @@
+"""text2jira.db: server connections, metadata cache, creation journal, sync snapshots and rate governor state.
+
+Every thread keeps its own connection to the database (see ``get_connection``), opened once and reused by all the
+stores of text2jira. The database is in WAL mode, so that the readers of a thread don't block the writers of the
+others, and its schema is versioned (``PRAGMA user_version``): opening an older database applies the migrations it
+misses.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+_DB = 'text2jira.db'
+
+# seconds a connection waits for the write lock held by another one
+BUSY_TIMEOUT = 30.0
+
+# the statements of migration i bring the schema from version i to i + 1
+_MIGRATIONS = [
+    # the tables, as created before the schema was versioned (databases of that time have some of them already)
+    ['''CREATE TABLE IF NOT EXISTS server_conns
+        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url VARCHAR(100) NOT NULL,
+        user VARCHAR(100) NOT NULL,
+        password VARCHAR(100) NOT NULL)''',
+     '''CREATE TABLE IF NOT EXISTS journal
+        (server_url VARCHAR(100) NOT NULL,
+        project_key VARCHAR(20) NOT NULL,
+        source VARCHAR(255) NOT NULL,
+        content_hash CHAR(40) NOT NULL,
+        issue_key VARCHAR(20) NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (server_url, project_key, source, content_hash))''',
+     '''CREATE TABLE IF NOT EXISTS metadata_cache
+        (server_url VARCHAR(100) NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (server_url, kind, name))''',
+     '''CREATE TABLE IF NOT EXISTS sync_snapshot
+        (server_url VARCHAR(100) NOT NULL,
+        project_key VARCHAR(20) NOT NULL,
+        source VARCHAR(255) NOT NULL,
+        tree TEXT NOT NULL,
+        synced_at REAL NOT NULL,
+        PRIMARY KEY (server_url, project_key, source))''',
+     '''CREATE TABLE IF NOT EXISTS rate_governor
+        (server_url VARCHAR(100) NOT NULL PRIMARY KEY,
+        rate REAL NOT NULL,
+        paused_until REAL NOT NULL,
+        updated_at REAL NOT NULL)'''],
+    # connections are looked up by url (see find_server_conn), expired resolutions are purged
+    ['CREATE INDEX server_conns_url ON server_conns (url)',
+     'CREATE INDEX metadata_cache_expires_at ON metadata_cache (expires_at)'],
+    # what a created task still has to be added to (comma separated 'epic' and 'sprint'): the issues journaled before
+    # owe nothing
+    ["ALTER TABLE journal ADD COLUMN pending_attachments VARCHAR(20) NOT NULL DEFAULT ''"],
+]
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+_local = threading.local()
+
+
+def _migrate(conn):
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return
+    with transaction(conn):
+        # another connection may have migrated the database meanwhile: the version is read again with the lock held
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for statements in _MIGRATIONS[version:]:
+            for statement in statements:
+                conn.execute(statement)
+        conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+
+def _open(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    # the journal mode is persistent: only the first connection to a database actually switches it
+    conn.execute('PRAGMA journal_mode = WAL')
+    # durable enough in WAL mode (a power loss may only roll back the last transactions)
+    conn.execute('PRAGMA synchronous = NORMAL')
+    _migrate(conn)
+    return conn
+
+
+def get_connection():
+    """Connection of the calling thread to the database, opened (and migrated) on first use.
+
+    Connections are in autocommit mode: statements that must be applied together go in a ``transaction``.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != _DB:
+        if conn is not None:
+            conn.close()
+        conn = _open(_DB)
+        _local.conn = conn
+        _local.path = _DB
+    return conn
+
+
+@contextmanager
+def transaction(conn=None):
+    """Run the statements of the block in a single transaction, holding the write lock from its start."""
+    conn = conn if conn is not None else get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def list_server_conns():
+    """The stored server connections: ``dict(id, url, user, password)``, in the order they were added."""
+    cur = get_connection().execute('SELECT id, url, user, password FROM server_conns ORDER BY id')
+    return [dict(id=row[0], url=row[1], user=row[2], password=row[3]) for row in cur]
+
+
+def find_server_conn(id_or_url):
+    """The stored server connection of an id, or the first one of a url; ``None`` when there's none."""
+    row = get_connection().execute('''SELECT id, url, user, password FROM server_conns
+                                      WHERE id = ? OR url = ? ORDER BY id LIMIT 1''',
+                                   (id_or_url, str(id_or_url))).fetchone()
+    return dict(id=row[0], url=row[1], user=row[2], password=row[3]) if row is not None else None
+
+
+def add_server_conn(url, user, password):
+    """Store a server connection and return its id."""
+    return get_connection().execute('INSERT INTO server_conns (url, user, password) VALUES (?, ?, ?)',
+                                    (url, user, password)).lastrowid
+
+
+def remove_server_conn(conn_id):
+    get_connection().execute('DELETE FROM server_conns WHERE id = ?', (conn_id,))
@@ -0,0 +1,87 @@
+"""End-to-end throughput benchmark of issue creation against a local Jira stand-in.
+
+    python tests/bench_create.py --sizes 10 1000 50000 --latency 0.02 --workers 4 [--engine async]
+
+For every plan size, prints the wall time, the number of requests the server received and the requests per issue.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import text2jira  # noqa: E402
+import text2jira_storage  # noqa: E402
+from fake_jira_server import FakeJiraServer  # noqa: E402
+
+DEFAULT_SIZES = (10, 1000, 50000)
+
+
+def synthetic_plan(issue_count, sub_tasks_per_task=2, descriptions_per_issue=2):
+    """Lines of a plan with ``issue_count`` issues (tasks and sub-tasks)."""
+    lines = []
+    task_no = 0
+    issues = 0
+    while issues < issue_count:
+        task_no += 1
+        lines.append('- Task {}{}'.format(task_no, ' (X)' if task_no % 3 == 0 else ''))
+        lines.extend('    * task {} detail {}'.format(task_no, i) for i in range(descriptions_per_issue))
+        issues += 1
+        for sub_task_no in range(min(sub_tasks_per_task, issue_count - issues)):
+            lines.append('    + Sub-task {}.{}'.format(task_no, sub_task_no))
+            lines.extend('        * sub-task {}.{} detail {}'.format(task_no, sub_task_no, i)
+                         for i in range(descriptions_per_issue))
+            issues += 1
+    return lines
+
+
+def run(issue_count, *, latency=0.0, error_rate=0.0, rate_limit=None, burst=None, workers=1, **options):
+    """Create a synthetic plan of ``issue_count`` issues and return ``(wall time, requests, server)``."""
+    issue_dicts = text2jira.parse_lines(synthetic_plan(issue_count))
+    db = text2jira_storage._DB
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            FakeJiraServer(latency=latency, error_rate=error_rate, rate_limit=rate_limit, burst=burst) as server:
+        text2jira_storage._DB = os.path.join(tmp_dir, 'text2jira.db')
+        try:
+            start = time.perf_counter()
+            text2jira.create_issues_in_jira(issue_dicts=issue_dicts,
+                                            server_url=server.url,
+                                            basic_auth=['user', 'password'],
+                                            project_name='Project',
+                                            board_name='Board',
+                                            assignee_key='default',
+                                            components=['Backend'],
+                                            epic_link='Epic',
+                                            max_results=text2jira.MAX_RESULTS,
+                                            workers=workers,
+                                            **options)
+            wall_time = time.perf_counter() - start
+        finally:
+            text2jira_storage._DB = db
+    return wall_time, server.request_count, server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='issues per plan')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every request')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='fraction of requests failing with a 503')
+    parser.add_argument('--rate_limit', type=float, default=None, help='requests per second allowed by the server')
+    parser.add_argument('--burst', type=int, default=None, help='requests allowed in a burst by the server')
+    parser.add_argument('--workers', type=int, default=1, help='number of issue batches created concurrently')
+    parser.add_argument('--engine', choices=text2jira.ENGINES, default='sync', help='engine creating the issues')
+    args = parser.parse_args()
+
+    print('{:>8} {:>10} {:>9} {:>12} {:>10}'.format('issues', 'wall [s]', 'requests', 'req/issue', 'issues/s'))
+    for size in args.sizes:
+        wall_time, request_count, _ = run(size, latency=args.latency, error_rate=args.error_rate,
+                                          rate_limit=args.rate_limit, burst=args.burst, workers=args.workers,
+                                          engine=args.engine)
+        print('{:>8} {:>10.2f} {:>9} {:>12.3f} {:>10.1f}'.format(size, wall_time, request_count, request_count / size,
+                                                                 size / wall_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark of the line parser against the buffer parser on a huge synthetic plan file.
+
+    python tests/bench_parser.py --lines 2000000 --processes 2 4 8
+
+Checks that all the parsers return the same issues and prints their throughput, then the one of the parallel parsers
+on pools of ``--processes`` processes against the sequential line parser.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import text2jira  # noqa: E402
+
+
+def write_synthetic_plan(path, line_count, descriptions_per_issue=5, sub_tasks_per_task=3):
+    """Write a plan of about ``line_count`` lines, mixing assignees, sprint markers and blank lines."""
+    with open(path, 'wt') as plan_file:
+        written = 0
+        task_no = 0
+        while written < line_count:
+            task_no += 1
+            lines = ['- Task {}{}{}'.format(task_no, ' (X)' if task_no % 3 == 0 else '',
+                                            ' [user{}]'.format(task_no % 7) if task_no % 2 == 0 else '')]
+            lines.extend('    * task {} detail {} with some more words in it'.format(task_no, i)
+                         for i in range(descriptions_per_issue))
+            for sub_task_no in range(sub_tasks_per_task):
+                lines.append('    + Sub-task {}.{}{}'.format(task_no, sub_task_no,
+                                                            ' [user{}]'.format(sub_task_no) if sub_task_no else ''))
+                lines.extend('        * sub-task detail {}'.format(i) for i in range(descriptions_per_issue))
+            lines.append('')
+            plan_file.write('\n'.join(lines))
+            plan_file.write('\n')
+            written += len(lines)
+    return written
+
+
+def _time(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=2000000, help='lines of the synthetic plan')
+    parser.add_argument('--descriptions', type=int, default=5, help='description lines per issue')
+    parser.add_argument('--processes', type=int, nargs='*', default=[2, os.cpu_count() or 1],
+                        help='processes of the parallel parsers')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = os.path.join(tmp_dir, 'plan.txt')
+        line_count = write_synthetic_plan(src, args.lines, descriptions_per_issue=args.descriptions)
+        lines_time, lines_issues = _time(text2jira.parse_issues, src)
+        buffer_time, buffer_issues = _time(text2jira.parse_issues, src, True)
+        parallel_times = []
+        for processes in args.processes:
+            for fast in (False, True):
+                parse_time, issues = _time(text2jira.parse_issues, src, fast, processes)
+                if issues != lines_issues:
+                    print('the parallel parser returned different issues')
+                    sys.exit(1)
+                parallel_times.append((processes, 'buffer' if fast else 'lines', parse_time))
+
+    if lines_issues != buffer_issues:
+        print('the parsers returned different issues')
+        sys.exit(1)
+    print('{} lines, {} tasks'.format(line_count, len(lines_issues)))
+    print('{:>8} {:>10} {:>14}'.format('parser', 'time [s]', 'lines/s'))
+    for name, parse_time in (('lines', lines_time), ('buffer', buffer_time)):
+        print('{:>8} {:>10.2f} {:>14.0f}'.format(name, parse_time, line_count / parse_time))
+    print('speedup: {:.2f}x'.format(lines_time / buffer_time))
+    if parallel_times:
+        print('{} core(s)'.format(os.cpu_count()))
+        print('{:>9} {:>8} {:>10} {:>14} {:>9}'.format('processes', 'parser', 'time [s]', 'lines/s', 'speedup'))
+        for processes, name, parse_time in parallel_times:
+            print('{:>9} {:>8} {:>10.2f} {:>14.0f} {:>8.2f}x'.format(processes, name, parse_time,
+                                                                     line_count / parse_time,
+                                                                     lines_time / parse_time))
+
+
+if __name__ == '__main__':
+    main()
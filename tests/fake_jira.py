@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeJiraError(Exception):
+    def __init__(self, status_code, text):
+        super().__init__(text)
+        self.status_code = status_code
+
+
+def _page(items, startAt, maxResults):
+    return items[startAt:startAt + maxResults]
+
+
+class _ResultList(list):
+    def __init__(self, items, total):
+        super().__init__(items)
+        self.total = total
+
+
+class FakeJira:
+    """In-memory stand-in for the subset of ``jira.JIRA`` used by text2jira."""
+
+    def __init__(self, *, projects=(('PRJ', 'Project'),), boards=('Board',), components=('Backend', 'Frontend'),
+                 epics=('Epic',), sprints=(('Sprint 1', 'active'),), users=('userA', 'userB', 'default'), bulk_limit=50,
+                 latency=0.0):
+        self.projects_list = [SimpleNamespace(id=str(10000 + i), key=key, name=name)
+                              for i, (key, name) in enumerate(projects)]
+        self.boards_list = [SimpleNamespace(id=i + 1, name=name) for i, name in enumerate(boards)]
+        self.components_list = [SimpleNamespace(id=str(20000 + i), name=name) for i, name in enumerate(components)]
+        self.epics = [SimpleNamespace(id=str(30000 + i), key='PRJ-E{}'.format(i), fields=SimpleNamespace(summary=name))
+                      for i, name in enumerate(epics)]
+        self.sprints_list = [SimpleNamespace(id=i + 1, name=name, state=state)
+                             for i, (name, state) in enumerate(sprints)]
+        self.users = set(users)
+        # summaries a validator of the workflow rejects
+        self.rejected_summaries = set()
+        self.bulk_limit = bulk_limit
+        # most issues a page of search results holds
+        self.search_limit = 1000
+        self.latency = latency
+        self.max_concurrency = 0
+        self._concurrency = 0
+        self._lock = threading.RLock()
+        self.issues = {}
+        self.epic_issues = {}
+        self.sprint_issues = {}
+        self.calls = []
+        # the session is only used for the requests the jira client has no method for
+        self._session = SimpleNamespace(put=self._put)
+
+    def _record(self, name, *args):
+        with self._lock:
+            self.calls.append((name,) + args)
+
+    def call_count(self, name):
+        return sum(1 for call in self.calls if call[0] == name)
+
+    def projects(self):
+        self._record('projects')
+        return list(self.projects_list)
+
+    def project(self, id):
+        self._record('project', id)
+        for project in self.projects_list:
+            if id in (project.id, project.key):
+                return project
+        raise FakeJiraError(404, 'No project could be found with key \'{}\'.'.format(id))
+
+    def user(self, id):
+        self._record('user', id)
+        if id not in self.users:
+            raise FakeJiraError(404, 'The user named \'{}\' does not exist'.format(id))
+        return SimpleNamespace(key=id, name=id, displayName=id)
+
+    def _get_json(self, path, params=None):
+        self._record('_get_json', path)
+        if path == 'project/search':
+            projects = [dict(id=project.id, key=project.key, name=project.name) for project in self.projects_list
+                        if params['query'].lower() in project.name.lower()]
+            return dict(values=_page(projects, params['startAt'], params['maxResults']))
+        raise FakeJiraError(404, 'not found: {}'.format(path))
+
+    def boards(self, startAt=0, maxResults=50, type=None, name=None):
+        self._record('boards')
+        boards = [board for board in self.boards_list if name is None or name.lower() in board.name.lower()]
+        return _page(boards, startAt, maxResults)
+
+    def project_components(self, project):
+        self._record('project_components', getattr(project, 'key', project))
+        return list(self.components_list)
+
+    def search_issues(self, jql_str, startAt=0, maxResults=50, fields=None):
+        self._record('search_issues', jql_str)
+        if jql_str.startswith('project = '):
+            issues = [SimpleNamespace(key=key, fields=SimpleNamespace(summary=fields['summary'],
+                                                                      parent=SimpleNamespace(**fields['parent'])
+                                                                      if 'parent' in fields else None))
+                      for key, fields in self.issues.items()]
+            return _ResultList(_page(issues, startAt, min(maxResults, self.search_limit)), total=len(issues))
+        return [epic for epic in self.epics if '"{}"'.format(epic.fields.summary) in jql_str.replace('\\"', '"')]
+
+    def _validate(self, fields):
+        errors = {}
+        assignee = fields.get('assignee')
+        if assignee is not None and assignee['name'] not in self.users:
+            errors['assignee'] = 'User \'{}\' does not exist.'.format(assignee['name'])
+        parent = fields.get('parent')
+        if parent is not None and parent['key'] not in self.issues:
+            errors['parent'] = 'Could not find issue by id or key.'
+        component_ids = {component.id for component in self.components_list}
+        for component in fields.get('components', ()):
+            if component['id'] not in component_ids:
+                errors['components'] = 'Component with id \'{}\' does not exist.'.format(component['id'])
+        if not fields['summary']:
+            errors['summary'] = 'You must specify a summary of the issue.'
+        elif fields['summary'] in self.rejected_summaries:
+            errors['summary'] = 'The summary was rejected by a validator.'
+        return errors
+
+    def create_issues(self, field_list, prefetch=True):
+        self._record('create_issues', len(field_list))
+        if len(field_list) > self.bulk_limit:
+            raise Exception('too many issues in bulk request: {}'.format(len(field_list)))
+        with self._lock:
+            self._concurrency += 1
+            self.max_concurrency = max(self.max_concurrency, self._concurrency)
+        try:
+            time.sleep(self.latency)
+            with self._lock:
+                return self._create_issues(field_list)
+        finally:
+            with self._lock:
+                self._concurrency -= 1
+
+    def _create_issues(self, field_list):
+        results = []
+        for fields in field_list:
+            errors = self._validate(fields)
+            if errors:
+                results.append({'status': 'Error', 'error': errors, 'issue': None, 'input_fields': fields})
+                continue
+            key = '{}-{}'.format(fields['project']['key'], len(self.issues) + 1)
+            self.issues[key] = fields
+            issue = SimpleNamespace(id=str(len(self.issues)), key=key)
+            results.append({'status': 'Success', 'error': None, 'issue': issue, 'input_fields': fields})
+        return results
+
+    def add_issues_to_epic(self, epic_id, issue_keys, ignore_epics=True):
+        self._record('add_issues_to_epic', epic_id, list(issue_keys))
+        if epic_id not in {epic.id for epic in self.epics}:
+            raise Exception('epic does not exist: {}'.format(epic_id))
+        self.epic_issues.setdefault(epic_id, []).extend(issue_keys)
+
+    def sprints(self, board_id, extended=False, startAt=0, maxResults=50, state=None):
+        self._record('sprints', board_id)
+        sprints = [sprint for sprint in self.sprints_list if state is None or sprint.state in state.split(',')]
+        return _page(sprints, startAt, maxResults)
+
+    def add_issues_to_sprint(self, sprint_id, issue_keys):
+        self._record('add_issues_to_sprint', sprint_id, list(issue_keys))
+        for sprint_issues in self.sprint_issues.values():
+            sprint_issues[:] = [key for key in sprint_issues if key not in issue_keys]
+        self.sprint_issues.setdefault(sprint_id, []).extend(issue_keys)
+
+    def move_to_backlog(self, issue_keys):
+        self._record('move_to_backlog', list(issue_keys))
+        for sprint_issues in self.sprint_issues.values():
+            sprint_issues[:] = [key for key in sprint_issues if key not in issue_keys]
+
+    def _get_url(self, path):
+        return 'http://jira.local/rest/api/2/{}'.format(path)
+
+    def _put(self, url, data):
+        key = url.rsplit('/', 1)[-1]
+        self._record('update_issue', key)
+        fields = json.loads(data)['fields']
+        if key not in self.issues:
+            raise FakeJiraError(404, 'Issue does not exist or you do not have permission to see it.')
+        errors = self._validate(dict(self.issues[key], **fields))
+        if errors:
+            raise FakeJiraError(400, json.dumps(dict(errorMessages=[], errors=errors)))
+        self.issues[key].update(fields)
@@ -0,0 +1,349 @@
+"""Jira REST stand-in served on localhost, for end-to-end tests and benchmarks of text2jira.
+
+Only the resources text2jira uses are implemented. Latency, a rate of transient errors and a rate limit can be
+configured to reproduce the behaviour of a busy server.
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_ROUTES = []
+
+
+def _route(method, pattern):
+    def decorator(func):
+        _ROUTES.append((method, re.compile('^{}$'.format(pattern)), func))
+        return func
+    return decorator
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class FakeJiraServer:
+    def __init__(self, *, latency=0.0, error_rate=0.0, rate_limit=None, burst=None, projects=(('PRJ', 'Project'),),
+                 boards=('Board',), components=('Backend', 'Frontend'), epics=('Epic',),
+                 sprints=(('Sprint 1', 'active'),), users=('userA', 'userB', 'default'), bulk_limit=50, seed=0):
+        """Create the server (call ``start()`` or use it as a context manager to serve it).
+
+        :param latency: seconds added to every request
+        :param error_rate: fraction of requests failing with a 503
+        :param rate_limit: requests per second allowed before answering 429 with a Retry-After header
+        :param burst: requests allowed in a burst (defaults to ``rate_limit``)
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+        self.bulk_limit = bulk_limit
+        # most issues a page of search results holds
+        self.search_limit = 1000
+        self.projects = [dict(id=str(10000 + i), key=key, name=name) for i, (key, name) in enumerate(projects)]
+        self.boards = [dict(id=i + 1, name=name, type='scrum') for i, name in enumerate(boards)]
+        self.components = [dict(id=str(20000 + i), name=name) for i, name in enumerate(components)]
+        self.sprints = [dict(id=i + 1, name=name, state=state) for i, (name, state) in enumerate(sprints)]
+        self.users = set(users)
+        self.issues = {}
+        self._issue_keys_by_id = {}
+        self.epic_issues = {}
+        self.sprint_issues = {}
+        self.requests = Counter()
+        self.throttled_requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._tokens_updated_at = time.monotonic()
+        for epic in epics:
+            self._add_issue(dict(project={'key': self.projects[0]['key']}, summary=epic, issuetype={'name': 'Epic'}))
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    @property
+    def request_count(self):
+        return sum(self.requests.values())
+
+    def issues_of_type(self, issue_type):
+        return {key: fields for key, fields in self.issues.items() if fields['issuetype']['name'] == issue_type}
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _throttle(self):
+        if self.rate_limit is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._tokens_updated_at) * self.rate_limit)
+            self._tokens_updated_at = now
+            if self._tokens < 1:
+                retry_after = math.ceil((1 - self._tokens) / self.rate_limit)
+                self.throttled_requests += 1
+                raise _HttpError(429, 'Rate limit exceeded.', {'Retry-After': str(retry_after)})
+            self._tokens -= 1
+
+    def _add_issue(self, fields):
+        issue_id = str(len(self.issues) + 1)
+        key = '{}-{}'.format(fields['project']['key'], issue_id)
+        self.issues[key] = dict(fields, id=issue_id)
+        self._issue_keys_by_id[issue_id] = key
+        return key, self.issues[key]
+
+    def _find_issue(self, id_or_key):
+        key = self._issue_keys_by_id.get(id_or_key, id_or_key)
+        if key in self.issues:
+            return key, self.issues[key]
+        raise _HttpError(404, 'Issue does not exist or you do not have permission to see it.')
+
+    def _issue_json(self, key, fields):
+        issue_fields = dict(summary=fields['summary'], issuetype=fields['issuetype'])
+        if 'parent' in fields:
+            issue_fields['parent'] = fields['parent']
+        return dict(id=fields['id'], key=key, self='{}/rest/api/2/issue/{}'.format(self.url, fields['id']),
+                    fields=issue_fields)
+
+    def _validate(self, fields):
+        errors = {}
+        if not any(fields.get('project', {}).get('key') == project['key'] for project in self.projects):
+            errors['project'] = 'project is required'
+        if not fields.get('summary'):
+            errors['summary'] = 'You must specify a summary of the issue.'
+        assignee = fields.get('assignee')
+        if assignee is not None and assignee.get('name') not in self.users:
+            errors['assignee'] = 'User \'{}\' does not exist.'.format(assignee.get('name'))
+        component_ids = {component['id'] for component in self.components}
+        for component in fields.get('components', ()):
+            if component['id'] not in component_ids:
+                errors['components'] = 'Component with id \'{}\' does not exist.'.format(component['id'])
+        if fields['issuetype']['name'] == 'Sub Task':
+            parent_key = fields.get('parent', {}).get('key')
+            if parent_key not in self.issues:
+                errors['parent'] = 'Could not find issue by id or key.'
+        return errors
+
+    # resources
+
+    @_route('GET', '/rest/api/2/serverInfo')
+    def _server_info(self, params, body):
+        return 200, dict(baseUrl=self.url, version='8.20.0', versionNumbers=[8, 20, 0], deploymentType='Server')
+
+    @_route('GET', '/rest/api/2/field')
+    def _fields(self, params, body):
+        return 200, [dict(id='summary', name='Summary', custom=False, schema=dict(type='string'))]
+
+    @_route('GET', '/rest/api/2/project')
+    def _projects(self, params, body):
+        return 200, self.projects
+
+    @_route('GET', '/rest/api/2/project/search')
+    def _project_search(self, params, body):
+        query = params.get('query', '').lower()
+        return 200, self._page([project for project in self.projects if query in project['name'].lower()], params)
+
+    @_route('GET', '/rest/api/2/project/(?P<key>[^/]+)')
+    def _project(self, params, body, key):
+        for project in self.projects:
+            if key in (project['id'], project['key']):
+                return 200, project
+        raise _HttpError(404, 'No project could be found with key \'{}\'.'.format(key))
+
+    @_route('GET', '/rest/api/2/project/(?P<key>[^/]+)/components')
+    def _project_components(self, params, body, key):
+        self._project(params, body, key)
+        return 200, self.components
+
+    @_route('GET', '/rest/api/2/search')
+    def _search(self, params, body):
+        issues = []
+        jql = params.get('jql', '')
+        summary = re.search(r'summary ~ "\\"(.*)\\""', jql)
+        project = re.search(r'project = "([^"]+)"', jql)
+        for key, fields in self.issues.items():
+            if summary is not None and summary.group(1) not in fields['summary']:
+                continue
+            if project is not None and fields['project']['key'] != project.group(1):
+                continue
+            if 'issuetype != Epic' in jql and fields['issuetype']['name'] == 'Epic':
+                continue
+            issues.append(self._issue_json(key, fields))
+        start_at = int(params.get('startAt', 0))
+        max_results = min(int(params.get('maxResults', 50)), self.search_limit)
+        return 200, dict(startAt=start_at, maxResults=max_results, total=len(issues),
+                         issues=issues[start_at:start_at + max_results])
+
+    @_route('GET', '/rest/api/2/user')
+    def _user(self, params, body):
+        name = params.get('username')
+        if name not in self.users:
+            raise _HttpError(404, 'The user named \'{}\' does not exist'.format(name))
+        return 200, dict(self='{}/rest/api/2/user?username={}'.format(self.url, name), key=name, name=name,
+                         displayName=name, active=True)
+
+    @_route('GET', '/rest/api/2/issue/(?P<id_or_key>[^/]+)')
+    def _issue(self, params, body, id_or_key):
+        return 200, self._issue_json(*self._find_issue(id_or_key))
+
+    @_route('PUT', '/rest/api/2/issue/(?P<id_or_key>[^/]+)')
+    def _update_issue(self, params, body, id_or_key):
+        key, fields = self._find_issue(id_or_key)
+        errors = self._validate(dict(fields, **body['fields']))
+        if errors:
+            return 400, dict(errorMessages=[], errors=errors)
+        fields.update(body['fields'])
+        return 204, None
+
+    @_route('POST', '/rest/api/2/issue/bulk')
+    def _bulk_create(self, params, body):
+        issue_updates = body['issueUpdates']
+        if len(issue_updates) > self.bulk_limit:
+            raise _HttpError(400, 'Bulk creation is limited to {} issues.'.format(self.bulk_limit))
+        issues = []
+        errors = []
+        for i, issue_update in enumerate(issue_updates):
+            fields = issue_update['fields']
+            element_errors = self._validate(fields)
+            if element_errors:
+                errors.append(dict(status=400, failedElementNumber=i,
+                                   elementErrors=dict(errorMessages=[], errors=element_errors)))
+            else:
+                key, fields = self._add_issue(fields)
+                issues.append(dict(id=fields['id'], key=key,
+                                   self='{}/rest/api/2/issue/{}'.format(self.url, fields['id'])))
+        return (201 if issues else 400), dict(issues=issues, errors=errors)
+
+    @_route('GET', '/rest/agile/1.0/board')
+    def _boards(self, params, body):
+        name = params.get('name', '').lower()
+        return 200, self._page([board for board in self.boards if name in board['name'].lower()], params)
+
+    @_route('GET', '/rest/agile/1.0/board/(?P<board_id>[0-9]+)/sprint')
+    def _board_sprints(self, params, body, board_id):
+        if not any(board['id'] == int(board_id) for board in self.boards):
+            raise _HttpError(404, 'Board does not exist or you do not have permission to see it.')
+        states = params['state'].split(',') if 'state' in params else None
+        return 200, self._page([dict(sprint, originBoardId=int(board_id)) for sprint in self.sprints
+                                if states is None or sprint['state'] in states], params)
+
+    @_route('POST', '/rest/agile/1.0/sprint/(?P<sprint_id>[0-9]+)/issue')
+    def _add_to_sprint(self, params, body, sprint_id):
+        for key in body['issues']:
+            self._find_issue(key)
+        # an issue is in one open sprint at most
+        self._move_to_backlog(params, body)
+        self.sprint_issues.setdefault(int(sprint_id), []).extend(body['issues'])
+        return 204, None
+
+    @_route('POST', '/rest/agile/1.0/backlog/issue')
+    def _move_to_backlog(self, params, body):
+        for key in body['issues']:
+            self._find_issue(key)
+        for sprint_issues in self.sprint_issues.values():
+            sprint_issues[:] = [key for key in sprint_issues if key not in body['issues']]
+        return 204, None
+
+    @_route('POST', '/rest/agile/1.0/epic/(?P<epic_id>[^/]+)/issue')
+    def _add_to_epic(self, params, body, epic_id):
+        epic_key, fields = self._find_issue(epic_id)
+        if fields['issuetype']['name'] != 'Epic':
+            raise _HttpError(400, '{} is not an epic.'.format(epic_key))
+        for key in body['issues']:
+            self._find_issue(key)
+        self.epic_issues.setdefault(epic_key, []).extend(body['issues'])
+        return 204, None
+
+    @_route('PUT', '/rest/greenhopper/1.0/epics/(?P<epic_id>[^/]+)/add')
+    def _add_to_epic_greenhopper(self, params, body, epic_id):
+        return self._add_to_epic(params, dict(issues=body['issueKeys']), epic_id)
+
+    @staticmethod
+    def _page(values, params):
+        start_at = int(params.get('startAt', 0))
+        max_results = int(params.get('maxResults', 50))
+        page = values[start_at:start_at + max_results]
+        return dict(startAt=start_at, maxResults=max_results, total=len(values),
+                    isLast=start_at + len(page) >= len(values), values=page)
+
+    def _handle(self, method, path, params, body):
+        for route_method, pattern, func in _ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                with self._lock:
+                    self.requests[func.__name__.lstrip('_')] += 1
+                self._throttle()
+                if self.latency:
+                    time.sleep(self.latency)
+                if self.error_rate and self._random.random() < self.error_rate:
+                    raise _HttpError(503, 'Service temporarily unavailable.')
+                with self._lock:
+                    return func(self, params, body, **match.groupdict())
+        raise _HttpError(404, 'Not found: {} {}'.format(method, path))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        headers = {}
+        try:
+            status, payload = self.fake._handle(method, url.path, params, body)
+        except _HttpError as e:
+            status, payload, headers = e.status, dict(errorMessages=[str(e)], errors={}), e.headers
+        data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
@@ -0,0 +1,28 @@
+"""Base test case of the tests that use text2jira.db."""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import text2jira
+import text2jira_storage
+
+
+class TempDbTestCase(unittest.TestCase):
+    """Test case whose text2jira.db (``self.db``) is in a temporary directory (``self.tmp_dir``).
+
+    The rate governors of the servers are also fresh: ports of local servers get reused, and a server must not inherit
+    the rate learned from another one.
+    """
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.db = os.path.join(tmp_dir.name, 'text2jira.db')
+        db_patch = mock.patch.object(text2jira_storage, '_DB', self.db)
+        db_patch.start()
+        self.addCleanup(db_patch.stop)
+        governors_patch = mock.patch.dict(text2jira.RateGovernor._governors, clear=True)
+        governors_patch.start()
+        self.addCleanup(governors_patch.stop)
@@ -0,0 +1,615 @@
+import gc
+import json
+import os
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import text2jira
+from fake_jira import FakeJira, FakeJiraError
+from temp_db import TempDbTestCase
+from text2jira import ENGINES, Issue, create_issues_in_jira, iter_parse_lines, parse_lines
+
+
+def _create(jira, text, **kwargs):
+    options = dict(server_url='http://jira.local',
+                   basic_auth=['user', 'password'],
+                   project_name='Project',
+                   board_name='Board',
+                   assignee_key='default',
+                   components=None,
+                   epic_link=None,
+                   max_results=50,
+                   jira=jira)
+    options.update(kwargs)
+    return create_issues_in_jira(issue_dicts=parse_lines(text.split('\n')), **options)
+
+
+class TestCreateIssues(TempDbTestCase):
+    def test_bulk_chunks(self):
+        jira = FakeJira(bulk_limit=5)
+        text = '\n'.join('- Task {}\n    + Sub-task {}'.format(i, i) for i in range(12))
+        results = _create(jira, text, bulk_size=5)
+        self.assertEqual(len(jira.issues), 24)
+        self.assertEqual(len(results), 24)
+        # 12 tasks and 12 sub-tasks, in chunks of at most 5
+        self.assertEqual(jira.call_count('create_issues'), 6)
+        for fields in jira.issues.values():
+            if fields['issuetype']['name'] == 'Sub Task':
+                self.assertIn(fields['parent']['key'], jira.issues)
+
+    def test_results_order(self):
+        jira = FakeJira()
+        results = _create(jira, """
+- Task A
+    + Sub-task A1
+    + Sub-task A2
+- Task B
+""")
+        self.assertEqual([result['issue_dict']['summary'] for result in results],
+                         ['Sub-task A1', 'Sub-task A2', 'Task A', 'Task B'])
+        self.assertEqual([result['issue_type'] for result in results], ['Sub Task', 'Sub Task', 'Task', 'Task'])
+        self.assertEqual([result.key for result in results], [result['issue_obj'].key for result in results])
+        self.assertEqual(sorted(result.key for result in results), sorted(jira.issues))
+
+    def test_epic_and_sprint(self):
+        jira = FakeJira()
+        results = _create(jira, """
+- Task A (X)
+    + Sub-task A1
+- Task B
+""", epic_link='Epic')
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in results}
+        self.assertEqual(jira.epic_issues['30000'], [keys['Task A'], keys['Task B']])
+        self.assertEqual(jira.sprint_issues[1], [keys['Task A']])
+
+    def test_attachment_pipeline(self):
+        jira = FakeJira(bulk_limit=10, latency=0.005)
+        text = '\n'.join('- Task {}{}\n    + Sub-task {}'.format(i, ' (X)' if i % 2 else '', i) for i in range(120))
+        results = _create(jira, text, bulk_size=10, epic_link='Epic')
+        task_keys = [result.key for result in results if result['issue_type'] == 'Task']
+        self.assertEqual(sorted(jira.epic_issues['30000']), sorted(task_keys))
+        self.assertEqual(sorted(jira.sprint_issues[1]), sorted(task_keys[1::2]))
+        names = [call[0] for call in jira.calls]
+        # chunks of at most 50 issues, sent while issues are still being created
+        self.assertEqual([len(call[2]) for call in jira.calls if call[0] == 'add_issues_to_epic'], [50, 50, 20])
+        self.assertEqual([len(call[2]) for call in jira.calls if call[0] == 'add_issues_to_sprint'], [50, 10])
+        self.assertLess(names.index('add_issues_to_epic'), len(names) - names[::-1].index('create_issues') - 1)
+        self.assertLess(names.index('sprints'), names.index('add_issues_to_sprint'))
+        self.assertEqual(names.count('sprints'), 1)
+
+    def test_failures_reported_per_line(self):
+        jira = FakeJira()
+        jira.rejected_summaries.add('Task A')
+        with self.assertRaises(Exception) as context:
+            _create(jira, """
+- Task A
+    + Sub-task A1
+- Task B
+""")
+        message = str(context.exception)
+        self.assertIn('line 2', message)
+        self.assertIn('Task A', message)
+        self.assertIn('1 sub-task(s) skipped', message)
+        self.assertEqual(len(jira.issues), 1)
+
+    def test_concurrent_workers(self):
+        jira = FakeJira(bulk_limit=2, latency=0.01)
+        text = '\n'.join('- Task {}\n    + Sub-task {}a\n    + Sub-task {}b'.format(i, i, i) for i in range(10))
+        results = _create(jira, text, bulk_size=2, workers=4)
+        self.assertGreater(jira.max_concurrency, 1)
+        self.assertEqual(len(jira.issues), 30)
+        expected = []
+        for i in range(10):
+            expected += ['Sub-task {}a'.format(i), 'Sub-task {}b'.format(i), 'Task {}'.format(i)]
+        self.assertEqual([result['issue_dict']['summary'] for result in results], expected)
+        for result in results:
+            fields = jira.issues[result['issue_obj'].key]
+            self.assertEqual(fields['summary'], result['issue_dict']['summary'])
+
+    def test_stream(self):
+        jira = FakeJira()
+        issues_created_while_parsing = []
+
+        def lines():
+            for i in range(10):
+                issues_created_while_parsing.append(len(jira.issues))
+                yield '- Task {}'.format(i)
+                yield '    + Sub-task {}'.format(i)
+
+        summaries = []
+        count = create_issues_in_jira(issue_dicts=iter_parse_lines(lines()),
+                                      server_url='http://jira.local',
+                                      basic_auth=['user', 'password'],
+                                      project_name='Project',
+                                      board_name='Board',
+                                      assignee_key='default',
+                                      components=None,
+                                      epic_link=None,
+                                      max_results=50,
+                                      bulk_size=2,
+                                      jira=jira,
+                                      progress=lambda done, failures: summaries.extend(
+                                          issue_dict['summary'] for issue_dict, _ in done))
+        # a stream reports its issues through progress only
+        self.assertEqual(count, 20)
+        self.assertGreater(issues_created_while_parsing[-1], 0)
+        self.assertEqual(summaries[:3], ['Task 0', 'Task 1', 'Sub-task 0'])
+
+    def test_stream_releases_issues(self):
+        jira = FakeJira()
+        live_issues = []
+
+        def _progress(done, failures):
+            if len(live_issues) % 10 == 0:
+                gc.collect()
+                live_issues.append(sum(1 for obj in gc.get_objects() if isinstance(obj, Issue)))
+            else:
+                live_issues.append(live_issues[-1])
+
+        text = '\n'.join('- Task {} (X)\n    + Sub-task {}'.format(i, i) for i in range(1000))
+        count = create_issues_in_jira(issue_dicts=iter_parse_lines(text.split('\n')),
+                                      server_url='http://jira.local',
+                                      basic_auth=['user', 'password'],
+                                      project_name='Project',
+                                      board_name='Board',
+                                      assignee_key='default',
+                                      components=None,
+                                      epic_link='Epic',
+                                      max_results=50,
+                                      bulk_size=10,
+                                      jira=jira,
+                                      source='plan.txt',
+                                      progress=_progress)
+        self.assertEqual(count, 2000)
+        self.assertEqual(len(jira.sprint_issues[1]), 1000)
+        # only the tasks of the batches in progress are alive
+        self.assertLess(max(live_issues), 50)
+
+    def test_async_engine(self):
+        jira = FakeJira(bulk_limit=2, latency=0.01)
+        text = '\n'.join('- Task {} (X)\n    + Sub-task {}a\n    + Sub-task {}b'.format(i, i, i) for i in range(10))
+        results = _create(jira, text, bulk_size=2, workers=4, engine='async', components=['Backend'],
+                          epic_link='Epic')
+        self.assertGreater(jira.max_concurrency, 1)
+        self.assertEqual(len(jira.issues), 30)
+        expected = []
+        for i in range(10):
+            expected += ['Sub-task {}a'.format(i), 'Sub-task {}b'.format(i), 'Task {}'.format(i)]
+        self.assertEqual([result['issue_dict']['summary'] for result in results], expected)
+        self.assertEqual(len(jira.epic_issues['30000']), 10)
+        self.assertEqual(len(jira.sprint_issues[1]), 10)
+
+    def test_progress(self):
+        jira = FakeJira()
+        jira.rejected_summaries.add('Task X')
+        reports = []
+        text = '\n'.join('- Task {}\n    + Sub-task {}'.format(i, i) for i in range(5)) + '\n- Task X'
+        with self.assertRaises(Exception):
+            _create(jira, text, bulk_size=2,
+                    progress=lambda done, failures: reports.append((len(done), len(failures))))
+        self.assertEqual(sum(done for done, _ in reports), 10)
+        self.assertEqual(sum(failed for _, failed in reports), 1)
+
+    def test_cancel(self):
+        jira = FakeJira()
+        cancel_event = threading.Event()
+        text = '\n'.join('- Task {} (X)'.format(i) for i in range(10))
+        with self.assertRaises(Exception) as context:
+            _create(jira, text, bulk_size=2, cancel_event=cancel_event,
+                    progress=lambda done, failures: cancel_event.set())
+        self.assertIn('Cancelled after creating 2 issue(s)', str(context.exception))
+        self.assertEqual(len(jira.issues), 2)
+        # what was created before cancelling still lands in the sprint
+        self.assertEqual(sorted(jira.sprint_issues[1]), sorted(jira.issues))
+
+
+class TestMetadataCache(TempDbTestCase):
+    def test_resolutions_are_cached(self):
+        jira = FakeJira()
+        _create(jira, '- Task A', components=['Backend'], epic_link='Epic')
+        _create(jira, '- Task B', components=['Backend'], epic_link='Epic')
+        self.assertEqual(jira.call_count('_get_json'), 1)
+        self.assertEqual(jira.call_count('boards'), 1)
+        self.assertEqual(jira.call_count('project_components'), 1)
+        self.assertEqual(jira.call_count('search_issues'), 1)
+
+    def test_refresh_cache(self):
+        jira = FakeJira()
+        _create(jira, '- Task A')
+        _create(jira, '- Task B', refresh_cache=True)
+        self.assertEqual(jira.call_count('_get_json'), 2)
+
+    def test_disabled_cache(self):
+        jira = FakeJira()
+        _create(jira, '- Task A', cache_ttl=0)
+        _create(jira, '- Task B', cache_ttl=0)
+        self.assertEqual(jira.call_count('_get_json'), 2)
+        self.assertFalse(os.path.exists(self.db))
+
+    def test_expired_entries(self):
+        jira = FakeJira()
+        _create(jira, '- Task A', cache_ttl=60)
+        with mock.patch.object(text2jira.time, 'time', return_value=text2jira.time.time() + 120):
+            _create(jira, '- Task B', cache_ttl=60)
+        self.assertEqual(jira.call_count('_get_json'), 2)
+
+    def test_rejected_ids_are_invalidated(self):
+        jira = FakeJira()
+        _create(jira, '- Task A', components=['Backend'], epic_link='Epic')
+        # the component and the epic get recreated on the server with new ids
+        jira.components_list[0] = SimpleNamespace(id='29999', name='Backend')
+        jira.epics[0] = SimpleNamespace(id='39999', key='PRJ-E9', fields=SimpleNamespace(summary='Epic'))
+        results = _create(jira, """
+- Task B
+    + Sub-task B1
+""", components=['Backend'], epic_link='Epic')
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertEqual(jira.issues[result['issue_obj'].key]['components'], [{'id': '29999'}])
+        self.assertEqual(len(jira.epic_issues['39999']), 1)
+        # the fresh resolutions replaced the stale ones
+        _create(jira, '- Task C', components=['Backend'], epic_link='Epic')
+        self.assertEqual(jira.call_count('project_components'), 2)
+        self.assertEqual(jira.call_count('search_issues'), 2)
+
+
+class TestLookups(TempDbTestCase):
+    def test_project_key(self):
+        jira = FakeJira()
+        _create(jira, '- Task A', project_name='PRJ')
+        self.assertEqual(jira.call_count('project'), 1)
+        self.assertEqual(jira.call_count('_get_json'), 0)
+        self.assertEqual(jira.call_count('projects'), 0)
+
+    def test_unknown_project(self):
+        jira = FakeJira()
+        with self.assertRaises(Exception) as context:
+            _create(jira, '- Task A', project_name='Unknown')
+        self.assertIn('project not found', str(context.exception))
+
+    def test_board_pages(self):
+        jira = FakeJira(boards=['Board {}'.format(i) for i in range(120)] + ['Board'])
+        results = _create(jira, '- Task A (X)')
+        self.assertEqual(len(results), 1)
+        self.assertEqual(jira.call_count('boards'), 3)
+        self.assertIn(('sprints', 121), jira.calls)
+
+    def test_current_sprint(self):
+        jira = FakeJira(sprints=[('Sprint 1', 'closed'), ('Sprint 2', 'active'), ('Sprint 3', 'future')])
+        _create(jira, '- Task A (X)')
+        self.assertEqual(list(jira.sprint_issues), [2])
+
+    def test_future_sprint(self):
+        jira = FakeJira(sprints=[('Sprint 1', 'closed'), ('Sprint 2', 'future'), ('Sprint 3', 'future')])
+        _create(jira, '- Task A (X)')
+        self.assertEqual(list(jira.sprint_issues), [2])
+
+    def test_no_open_sprint(self):
+        jira = FakeJira(sprints=[('Sprint 1', 'closed')])
+        with self.assertRaises(Exception) as context:
+            _create(jira, '- Task A (X)')
+        self.assertIn('no open sprint', str(context.exception))
+        # found out before anything is created
+        self.assertEqual(len(jira.issues), 0)
+
+
+class TestPreflight(TempDbTestCase):
+    def test_unknown_assignees(self):
+        jira = FakeJira()
+        with self.assertRaises(Exception) as context:
+            _create(jira, """
+- Task A [nobody]
+    + Sub-task A1
+- Task B [userA]
+- Task C [nobody]
+- Task D [ghost]
+""")
+        message = str(context.exception)
+        self.assertIn('\'nobody\' (line 2, line 5)', message)
+        self.assertIn('\'ghost\' (line 6)', message)
+        self.assertNotIn('userA', message)
+        self.assertEqual(jira.call_count('create_issues'), 0)
+
+    def test_unknown_default_assignee(self):
+        jira = FakeJira()
+        with self.assertRaises(Exception) as context:
+            _create(jira, '- Task A [userA]', assignee_key='nobody')
+        self.assertIn('\'nobody\' (default assignee)', str(context.exception))
+        self.assertEqual(jira.call_count('create_issues'), 0)
+
+    def test_users_are_cached(self):
+        jira = FakeJira()
+        _create(jira, '- Task A [userA]\n- Task B [userA]\n- Task C [userB]')
+        _create(jira, '- Task D [userA]\n- Task E [userB]')
+        self.assertEqual(sorted(call[1] for call in jira.calls if call[0] == 'user'), ['default', 'userA', 'userB'])
+
+    def test_concurrent_lookups(self):
+        jira = FakeJira(users=('userA', 'userB', 'userC', 'default'))
+        # only returns once the 4 users are looked up at the same time
+        barrier = threading.Barrier(4, timeout=5)
+        user = jira.user
+
+        def _user(id):
+            barrier.wait()
+            return user(id)
+
+        jira.user = _user
+        results = _create(jira, '- Task A [userA]\n- Task B [userB]\n- Task C [userC]')
+        self.assertEqual(len(results), 3)
+
+
+class TestDedupe(TempDbTestCase):
+    def _existing_jira(self):
+        jira = FakeJira()
+        _create(jira, '- Task A\n    + Sub-task A1\n- Task B')
+        jira.calls.clear()
+        return jira
+
+    def test_skip(self):
+        jira = self._existing_jira()
+        results = _create(jira, '-  task   a\n    + Sub-task A2\n- Task C', dedupe='skip')
+        self.assertEqual([result['issue_dict']['summary'] for result in results], ['Task C'])
+        self.assertEqual(len(jira.issues), 4)
+
+    def test_link(self):
+        jira = self._existing_jira()
+        keys = {fields['summary']: key for key, fields in jira.issues.items()}
+        results = _create(jira, '- Task A (X)\n    + Sub-task A1\n    + Sub-task A2\n- Task C', dedupe='link',
+                          epic_link='Epic')
+        self.assertEqual(len(results), 4)
+        new_keys = {result['issue_dict']['summary']: result.key for result in results}
+        self.assertEqual(new_keys['Task A'], keys['Task A'])
+        self.assertEqual(new_keys['Sub-task A1'], keys['Sub-task A1'])
+        self.assertEqual(jira.issues[new_keys['Sub-task A2']]['parent'], {'key': keys['Task A']})
+        self.assertEqual(len(jira.issues), 5)
+        # the existing task keeps its epic and sprint
+        self.assertEqual(jira.epic_issues['30000'], [new_keys['Task C']])
+        self.assertNotIn(1, jira.sprint_issues)
+
+    def test_pages(self):
+        jira = FakeJira()
+        _create(jira, '\n'.join('- Task {}'.format(i) for i in range(45)))
+        jira.search_limit = 10
+        jira.calls.clear()
+        results = _create(jira, '- Task 44\n- Task 45', dedupe='skip')
+        self.assertEqual([result['issue_dict']['summary'] for result in results], ['Task 45'])
+        # a search per page of 10 issues, not per task
+        self.assertEqual(jira.call_count('search_issues'), 5)
+
+    def test_journaled_issues(self):
+        jira = FakeJira()
+        _create(jira, '- Task A\n    + Sub-task A1', source='plan.txt')
+        results = _create(jira, '- Task A\n    + Sub-task A1\n    + Sub-task A2', source='plan.txt', dedupe='skip')
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(jira.issues), 3)
+
+
+class TestPayload(TempDbTestCase):
+    PLAN = """
+- Task A (X) [userA]
+    * description of Task A
+    + Sub-task A1
+    + Sub-task A2
+- Task B
+"""
+
+    def _compile(self, jira, text=PLAN):
+        src = os.path.join(os.path.dirname(self.db), 'plan.txt')
+        dst = os.path.join(os.path.dirname(self.db), 'plan.payload')
+        with open(src, 'wt') as src_file:
+            src_file.write(text)
+        count = text2jira.compile_payload(src=src, dst=dst, server_url='http://jira.local',
+                                          basic_auth=['user', 'password'], project_name='Project', board_name='Board',
+                                          assignee_key='default', components=['Backend'], epic_link='Epic', jira=jira)
+        return dst, count
+
+    def test_compile(self):
+        jira = FakeJira()
+        dst, count = self._compile(jira)
+        self.assertEqual(count, 4)
+        # nothing is written to the server
+        self.assertEqual(jira.call_count('create_issues'), 0)
+        with open(dst) as payload_file:
+            header, *entries = [json.loads(line) for line in payload_file]
+        self.assertEqual(header['project_key'], 'PRJ')
+        self.assertEqual(header['sprint'], dict(id=1, name='Sprint 1'))
+        self.assertEqual([entry['parent'] for entry in entries], [None, 0, 0, None])
+        self.assertEqual(entries[0]['fields'], {
+            'project': {'key': 'PRJ'},
+            'summary': 'Task A',
+            'description': '* description of Task A\n',
+            'issuetype': {'name': 'Task'},
+            'assignee': {'name': 'userA'},
+            'components': [{'id': '20000'}],
+        })
+
+    def test_replay(self):
+        jira = FakeJira()
+        dst, _ = self._compile(jira)
+        jira.calls.clear()
+        results = text2jira.replay_payload(src=dst, basic_auth=['user', 'password'], jira=jira)
+        self.assertEqual([result['issue_dict']['summary'] for result in results],
+                         ['Sub-task A1', 'Sub-task A2', 'Task A', 'Task B'])
+        keys = {result['issue_dict']['summary']: result.key for result in results}
+        self.assertEqual(jira.issues[keys['Sub-task A2']]['parent'], {'key': keys['Task A']})
+        self.assertEqual(jira.epic_issues['30000'], [keys['Task A'], keys['Task B']])
+        self.assertEqual(jira.sprint_issues[1], [keys['Task A']])
+        # no lookup: only the writes
+        self.assertEqual({call[0] for call in jira.calls}, {'create_issues', 'add_issues_to_epic',
+                                                            'add_issues_to_sprint'})
+
+    def test_resume(self):
+        jira = FakeJira()
+        dst, _ = self._compile(jira)
+        jira.rejected_summaries.add('Task B')
+        with self.assertRaises(Exception) as context:
+            text2jira.replay_payload(src=dst, basic_auth=['user', 'password'], jira=jira)
+        self.assertIn('line 6', str(context.exception))
+        jira.rejected_summaries.clear()
+        results = text2jira.replay_payload(src=dst, basic_auth=['user', 'password'], jira=jira, engine='async')
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(jira.issues), 4)
+
+    def test_not_a_payload(self):
+        src = os.path.join(os.path.dirname(self.db), 'plan.txt')
+        with open(src, 'wt') as src_file:
+            src_file.write(self.PLAN)
+        with self.assertRaises(Exception) as context:
+            text2jira.replay_payload(src=src, basic_auth=['user', 'password'], jira=FakeJira())
+        self.assertIn('not a text2jira payload', str(context.exception))
+
+
+class TestJournal(TempDbTestCase):
+    def test_resume(self):
+        jira = FakeJira()
+        jira.rejected_summaries.add('Task B')
+        text = """
+- Task A
+    + Sub-task A1
+- Task B
+    + Sub-task B1
+- Task A
+"""
+        with self.assertRaises(Exception):
+            _create(jira, text, source='plan.txt')
+        self.assertEqual(len(jira.issues), 3)
+        jira.rejected_summaries.clear()
+        results = _create(jira, text, source='plan.txt')
+        self.assertEqual(len(jira.issues), 5)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(jira.call_count('create_issues'), 4)
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in results}
+        self.assertEqual(jira.issues[keys['Sub-task B1']]['parent']['key'], keys['Task B'])
+        # nothing left to create
+        _create(jira, text, source='plan.txt')
+        self.assertEqual(len(jira.issues), 5)
+
+    def test_reattach_sub_tasks(self):
+        jira = FakeJira()
+        _create(jira, '- Task A\n    + Sub-task A1', source='plan.txt')
+        results = _create(jira, '- Task A\n    + Sub-task A1\n    + Sub-task A2\n- Task B', source='plan.txt')
+        self.assertEqual(len(jira.issues), 4)
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in results}
+        self.assertEqual(jira.issues[keys['Sub-task A2']]['parent']['key'], keys['Task A'])
+
+    def test_failed_batch_with_batches_in_flight(self):
+        for engine in ENGINES:
+            jira = FakeJira(latency=0.05)
+            create_issues = jira.create_issues
+
+            def _create_issues(field_list, prefetch=True):
+                if field_list[0]['summary'] == 'Task 0':
+                    raise FakeJiraError(500, 'Internal server error')
+                return create_issues(field_list, prefetch)
+
+            text = '\n'.join('- Task {}'.format(i) for i in range(4))
+            source = 'plan-{}.txt'.format(engine)
+            with mock.patch.object(jira, 'create_issues', side_effect=_create_issues):
+                with self.assertRaises(FakeJiraError):
+                    _create(jira, text, source=source, bulk_size=1, workers=4, engine=engine)
+            # the batches in flight when Task 0 failed were journaled
+            self.assertEqual(len(jira.issues), 3)
+            results = _create(jira, text, source=source, bulk_size=1, workers=4, engine=engine)
+            self.assertEqual(len(results), 4)
+            self.assertEqual(len(jira.issues), 4)
+
+    def test_reused_tasks_stay_in_their_sprint(self):
+        jira = FakeJira()
+        key = _create(jira, '- Task A (X)', source='plan.txt', epic_link='Epic')[0]['issue_obj'].key
+        jira.sprints_list[0].state = 'closed'
+        jira.sprints_list.append(SimpleNamespace(id=2, name='Sprint 2', state='active'))
+        _create(jira, '- Task A (X)\n- Task B', source='plan.txt', epic_link='Epic')
+        self.assertEqual(jira.sprint_issues, {1: [key]})
+        self.assertEqual(jira.call_count('add_issues_to_sprint'), 1)
+        self.assertEqual(jira.call_count('add_issues_to_epic'), 2)
+
+    def test_resume_attachments(self):
+        jira = FakeJira()
+        with mock.patch.object(jira, 'add_issues_to_epic', side_effect=Exception('epic is gone')):
+            with self.assertRaises(Exception):
+                _create(jira, '- Task A (X)\n- Task B', source='plan.txt', epic_link='Epic')
+        self.assertEqual(jira.call_count('add_issues_to_sprint'), 1)
+        # the tasks are only added to the epic they're missing
+        _create(jira, '- Task A (X)\n- Task B', source='plan.txt', epic_link='Epic')
+        self.assertEqual(sorted(jira.epic_issues['30000']), sorted(jira.issues))
+        self.assertEqual(jira.call_count('add_issues_to_sprint'), 1)
+        _create(jira, '- Task A (X)\n- Task B', source='plan.txt', epic_link='Epic')
+        self.assertEqual(jira.call_count('add_issues_to_epic'), 1)
+
+    def test_sources_are_independent(self):
+        jira = FakeJira()
+        _create(jira, '- Task A', source='plan.txt')
+        _create(jira, '- Task A', source='other-plan.txt')
+        _create(jira, '- Task A')
+        self.assertEqual(len(jira.issues), 3)
+
+
+class TestSync(TempDbTestCase):
+    PLAN = """
+- Task A (X)
+    * description of Task A
+    + Sub-task A1
+- Task B [userA]
+- Task C
+"""
+
+    def _sync(self, jira, text, **kwargs):
+        jira.calls.clear()
+        return _create(jira, text, source='plan.txt', sync=True, epic_link='Epic', **kwargs)
+
+    def test_unchanged(self):
+        jira = FakeJira()
+        self._sync(jira, self.PLAN)
+        self.assertEqual(len(jira.issues), 4)
+        results = self._sync(jira, self.PLAN)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(jira.calls), 0)
+
+    def test_updates(self):
+        jira = FakeJira()
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in self._sync(jira, self.PLAN)}
+        self._sync(jira, self.PLAN.replace('description of Task A', 'new description of Task A')
+                                  .replace('Task B [userA]', 'Task B renamed [userB]'))
+        # userB is checked before the updates are sent
+        self.assertEqual(jira.calls, [('user', 'userB'), ('update_issue', keys['Task A']),
+                                      ('update_issue', keys['Task B'])])
+        self.assertEqual(jira.issues[keys['Task A']]['description'], '* new description of Task A\n')
+        self.assertEqual(jira.issues[keys['Task B']]['summary'], 'Task B renamed')
+        self.assertEqual(jira.issues[keys['Task B']]['assignee'], {'name': 'userB'})
+        self.assertEqual(len(jira.issues), 4)
+
+    def test_new_issues(self):
+        jira = FakeJira()
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in self._sync(jira, self.PLAN)}
+        results = self._sync(jira, self.PLAN.replace('- Task B', '    + Sub-task A2\n- Task D\n- Task B'))
+        self.assertEqual(jira.call_count('create_issues'), 2)
+        self.assertEqual(jira.call_count('update_issue'), 0)
+        new_keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in results}
+        self.assertEqual(jira.issues[new_keys['Sub-task A2']]['parent']['key'], keys['Task A'])
+        # only the new task is added to the epic
+        self.assertEqual(jira.calls[-1], ('add_issues_to_epic', '30000', [new_keys['Task D']]))
+
+    def test_sprint_toggle(self):
+        jira = FakeJira()
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in self._sync(jira, self.PLAN)}
+        self.assertEqual(jira.sprint_issues[1], [keys['Task A']])
+        self._sync(jira, self.PLAN.replace('Task A (X)', 'Task A').replace('Task C', 'Task C (X)'))
+        # the sprint is looked up while Task A is moved to the backlog
+        self.assertCountEqual(jira.calls, [('move_to_backlog', [keys['Task A']]),
+                                           ('sprints', 1),
+                                           ('add_issues_to_sprint', 1, [keys['Task C']])])
+        self.assertEqual(jira.sprint_issues[1], [keys['Task C']])
+
+    def test_failed_updates_are_retried(self):
+        jira = FakeJira()
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in self._sync(jira, self.PLAN)}
+        plan = self.PLAN.replace('Task B [userA]', 'Task B renamed [userA]')
+        jira.rejected_summaries.add('Task B renamed')
+        with self.assertRaises(Exception) as context:
+            self._sync(jira, plan)
+        self.assertIn('failed to update 1 issue(s)', str(context.exception))
+        jira.rejected_summaries.clear()
+        self._sync(jira, plan)
+        self.assertEqual(jira.calls, [('update_issue', keys['Task B'])])
+        self.assertEqual(jira.issues[keys['Task B']]['summary'], 'Task B renamed')
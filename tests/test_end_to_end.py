@@ -0,0 +1,161 @@
+import contextlib
+import io
+import json
+import os
+import unittest
+
+import bench_create
+import text2jira
+from fake_jira_server import FakeJiraServer
+from temp_db import TempDbTestCase
+
+
+class _ServerTestCase(TempDbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeJiraServer().start()
+        self.addCleanup(self.server.stop)
+
+
+class TestEndToEnd(_ServerTestCase):
+    def _text2jira(self, text, **kwargs):
+        src = os.path.join(self.tmp_dir, 'plan.txt')
+        with open(src, 'wt') as src_file:
+            src_file.write(text)
+        return text2jira.text2jira(src=src,
+                                   server_url=self.server.url,
+                                   basic_auth=['user', 'password'],
+                                   project_name='Project',
+                                   board_name='Board',
+                                   assignee_key='default',
+                                   components=['Backend'],
+                                   epic_link='Epic',
+                                   **kwargs)
+
+    def test_text2jira(self):
+        results = self._text2jira("""
+- Task A (X) [userA]
+    * description of Task A
+    + Sub-task A1
+- Task B
+""")
+        keys = {result['issue_dict']['summary']: result['issue_obj'].key for result in results}
+        self.assertEqual(self.server.issues[keys['Task A']]['assignee'], {'name': 'userA'})
+        self.assertEqual(self.server.issues[keys['Task A']]['description'], '* description of Task A\n')
+        self.assertEqual(self.server.issues[keys['Sub-task A1']]['parent'], {'key': keys['Task A']})
+        self.assertEqual(self.server.epic_issues['PRJ-1'], [keys['Task A'], keys['Task B']])
+        self.assertEqual(self.server.sprint_issues[1], [keys['Task A']])
+
+    def test_async_engine(self):
+        self.server.latency = 0.01
+        results = self._text2jira('\n'.join('- Task {}\n    + Sub-task {}'.format(i, i) for i in range(120)),
+                                  workers=8, engine='async')
+        self.assertEqual(len(results), 240)
+        self.assertEqual(len(self.server.epic_issues['PRJ-1']), 120)
+
+    def test_sync_one_edit(self):
+        plan = '\n'.join('- Task {}\n    * detail of task {}\n    + Sub-task {}'.format(i, i, i) for i in range(200))
+        self._text2jira(plan, sync=True)
+        self.assertEqual(len(self.server.issues_of_type('Task')), 200)
+        self.server.requests.clear()
+        self._text2jira(plan.replace('detail of task 42\n', 'new detail of task 42\n'), sync=True)
+        # connecting to the server, then a single update of the 400 issues
+        self.assertEqual(self.server.requests, {'server_info': 1, 'update_issue': 1})
+
+    def test_dedupe(self):
+        self._text2jira('- Task A\n    + Sub-task A1\n- Task B\n', journal=False)
+        results = self._text2jira('- Task A\n    + Sub-task A1\n    + Sub-task A2\n- Task C\n', journal=False,
+                                  dedupe='link')
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(self.server.issues_of_type('Task')), 3)
+        self.assertEqual(len(self.server.issues_of_type('Sub Task')), 2)
+
+    def test_compile_and_replay(self):
+        src = os.path.join(self.tmp_dir, 'plan.txt')
+        payload = os.path.join(self.tmp_dir, 'plan.payload')
+        with open(src, 'wt') as src_file:
+            src_file.write('- Task A (X)\n    + Sub-task A1\n- Task B\n')
+        count = text2jira.compile_payload(src=src, dst=payload, server_url=self.server.url,
+                                          basic_auth=['user', 'password'], project_name='Project', board_name='Board',
+                                          assignee_key='default', components=['Backend'], epic_link='Epic')
+        self.assertEqual(count, 3)
+        self.assertEqual(len(self.server.issues_of_type('Task')), 0)
+        self.server.requests.clear()
+        results = text2jira.replay_payload(src=payload, basic_auth=['user', 'password'])
+        keys = {result['issue_dict']['summary']: result.key for result in results}
+        self.assertEqual(self.server.epic_issues['PRJ-1'], [keys['Task A'], keys['Task B']])
+        self.assertEqual(self.server.sprint_issues[1], [keys['Task A']])
+        self.assertEqual(set(self.server.requests), {'server_info', 'bulk_create', 'add_to_epic', 'add_to_sprint'})
+
+    def test_failures(self):
+        with self.assertRaises(Exception) as context:
+            self._text2jira('- Task A\n- Task B [nobody]\n', workers=2)
+        self.assertIn('\'nobody\' (line 2)', str(context.exception))
+        # unknown assignees fail the run before anything is created
+        self.assertEqual(len(self.server.issues_of_type('Task')), 0)
+
+    def test_profile(self):
+        profile = os.path.join(self.tmp_dir, 'profile.json')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self._text2jira('- Task A (X)\n    + Sub-task A1\n- Task B\n', profile=profile)
+        self.assertIn('create_issues', output.getvalue())
+        with open(profile) as profile_file:
+            trace = json.load(profile_file)
+        events = {event['name']: event for event in trace['traceEvents']}
+        for name in ('parse_issues', 'connect', 'create_issues', 'boards', 'search_issues', 'add_issues_to_epic',
+                     'sprints', 'add_issues_to_sprint', '_get_json project/search'):
+            self.assertIn(name, events)
+        self.assertEqual(events['create_issues']['ph'], 'X')
+        self.assertGreater(events['create_issues']['args']['bytes_sent'], 0)
+        self.assertGreater(events['create_issues']['args']['bytes_received'], 0)
+        summary = {row['name']: row for row in trace['otherData']['summary']}
+        self.assertEqual(summary['create_issues']['count'], 2)
+        self.assertEqual(summary['create_issues']['requests'], 2)
+        self.assertEqual(summary['create_issues']['retries'], 0)
+
+
+class TestBatch(_ServerTestCase):
+    def _write(self, name, text):
+        with open(os.path.join(self.tmp_dir, name), 'wt') as src_file:
+            src_file.write(text)
+
+    def test_directory(self):
+        for i in range(5):
+            self._write('team{}.txt'.format(i), '- Task {} (X)\n    + Sub-task {}\n'.format(i, i))
+        self._write('team5.txt', '- Task 5 [nobody]\n')
+        self._write('notes.md', '- Not a plan\n')
+        file_results = text2jira.text2jira_batch(srcs=[self.tmp_dir],
+                                                 server_url=self.server.url,
+                                                 basic_auth=['user', 'password'],
+                                                 project_name='Project',
+                                                 board_name='Board',
+                                                 assignee_key='default',
+                                                 components=['Backend'],
+                                                 epic_link='Epic',
+                                                 file_workers=3)
+        self.assertEqual([os.path.basename(file_result['src']) for file_result in file_results],
+                         ['team{}.txt'.format(i) for i in range(6)])
+        self.assertEqual([file_result['issues'] for file_result in file_results], [2, 2, 2, 2, 2, 0])
+        self.assertIn('line 1', file_results[-1]['error'])
+        self.assertEqual(len(self.server.issues_of_type('Task')), 5)
+        self.assertEqual(len(self.server.sprint_issues[1]), 5)
+        # one client and one resolution for all the files
+        self.assertEqual(self.server.requests['server_info'], 1)
+        self.assertEqual(self.server.requests['project_search'], 1)
+        self.assertEqual(self.server.requests['boards'], 1)
+        self.assertIn('6 file(s), 1 failed, 10 issue(s) created', text2jira.format_batch_summary(file_results))
+
+
+class TestThroughput(unittest.TestCase):
+    def test_requests_per_issue(self):
+        # guards against regressions to per-issue requests: 1000 issues fit in about 20 bulk requests
+        wall_time, request_count, server = bench_create.run(1000, workers=4)
+        self.assertEqual(len(server.issues_of_type('Task')) + len(server.issues_of_type('Sub Task')), 1000)
+        self.assertLess(request_count / 1000, 0.05)
+
+    def test_rate_limited_server(self):
+        # a server allowing 20 requests per second, in bursts of 2: the run slows down instead of failing
+        _, _, server = bench_create.run(60, rate_limit=20, burst=2, workers=4, bulk_size=2)
+        self.assertEqual(len(server.issues_of_type('Task')) + len(server.issues_of_type('Sub Task')), 60)
+        self.assertGreater(server.throttled_requests, 0)
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import text2jira
+
+# cumulative import time of text2jira allowed for headless runs, in microseconds
+IMPORT_TIME_BUDGET_US = 150000
+# modules that only the GUI or a run talking to a server need (asyncio: the preflight of every run and the async engine)
+LAZY_MODULES = ('tkinter', 'jira', 'requests', 'asyncio')
+
+
+def _import_times(statement):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(text2jira.__file__), env.get('PYTHONPATH', '')])
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    import_times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        import_times[module.strip()] = int(cumulative)
+    return import_times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_headless_import(self):
+        import_times = _import_times('import text2jira')
+        for module in import_times:
+            self.assertNotIn(module.split('.')[0], LAZY_MODULES)
+        # best of a few runs, to be robust against a busy machine
+        best = min(_import_times('import text2jira')['text2jira'] for _ in range(3))
+        self.assertLess(best, IMPORT_TIME_BUDGET_US)
+
+    def test_gui_names(self):
+        import_times = _import_times('import text2jira; text2jira.Text2JiraGUI')
+        self.assertIn('text2jira_gui', import_times)
+        self.assertIn('tkinter', import_times)
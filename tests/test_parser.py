@@ -1,6 +1,13 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
 import unittest
+from unittest import mock
 
-from text2jira import parse_lines
+from text2jira import (Issue, SubIssue, iter_parse_issues, iter_parse_lines, parse_buffer, parse_buffer_parallel,
+                       parse_issues, parse_lines, parse_lines_parallel)
 
 
 class TestParseIssues(unittest.TestCase):
@@ -73,4 +80,130 @@ class TestParseIssues(unittest.TestCase):
         assignee = issues[1]["assignee"]
         self.assertEquals(assignee, None)
 
+    def test_stream(self):
+        input = """
+- Task A
+    + Sub-task A1
+- [userA]
+    * description of Sub-task A1
+- Task B
+"""
+        consumed = []
+
+        def lines():
+            for line in input.split("\n"):
+                consumed.append(line)
+                yield line
+
+        issues = iter_parse_lines(lines())
+        issue = next(issues)
+        self.assertEqual(issue["summary"], "Task A")
+        self.assertEqual(issue["sub_issues"][0]["description"], "* description of Sub-task A1\n")
+        # Task A is only closed by the line of Task B
+        self.assertEqual(consumed[-1], "- Task B")
+        issue = next(issues)
+        self.assertEqual(issue["summary"], "Task B")
+        self.assertEqual(list(issues), [])
+        self.assertEqual(parse_lines(input.split("\n")), [
+            dict(summary="Task A", description="", add_to_sprint=False, assignee=None, line=2, sub_issues=[
+                dict(summary="Sub-task A1", description="* description of Sub-task A1\n", assignee=None, line=3,
+                     sub_issues=())]),
+            dict(summary="Task B", description="", add_to_sprint=False, assignee=None, line=6, sub_issues=[]),
+        ])
+
+    def test_issue_records(self):
+        issues = parse_lines(['- Task A (X) [userA]', '    * description', '    + Sub-task A1 [userA]', '- Task B'])
+        self.assertIsInstance(issues[0], Issue)
+        self.assertIsInstance(issues[0]['sub_issues'][0], SubIssue)
+        self.assertEqual(dict(issues[0]['sub_issues'][0]), dict(summary='Sub-task A1', description='', assignee='userA',
+                                                                line=3, sub_issues=()))
+        self.assertNotIn('add_to_sprint', issues[0]['sub_issues'][0])
+        self.assertFalse(issues[0]['sub_issues'][0].get('add_to_sprint', False))
+        self.assertIs(issues[0].assignee, issues[0].sub_issues[0].assignee)
+        issues[1]['summary'] = 'Task C'
+        self.assertEqual(issues[1].summary, 'Task C')
+        with self.assertRaises(KeyError):
+            issues[1]['priority'] = 'High'
+        with self.assertRaises(AttributeError):
+            issues[1].priority = 'High'
+        with self.assertRaises(TypeError):
+            issues[0]['sub_issues'][0]['sub_issues'] = []
+        with self.assertRaises(AttributeError):
+            issues[0]['sub_issues'][0]['sub_issues'].append(issues[1])
+
+
+def _parse_quietly(parse, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            return parse(*args)
+        except Exception as e:
+            return str(e)
+
+
+class TestParseBuffer(unittest.TestCase):
+    def test_same_as_parse_lines(self):
+        fragments = ['-', '+', '*', ' ', '\t', '\x0c', '\xa0', '\u2003', '\r', '(X)', '[userA]', '[a_b]', '[a-b]', '[',
+                     ']', 'x', 'Task', '\n', '\n', '\n']
+        rng = random.Random(1)
+        for _ in range(2000):
+            text = ''.join(rng.choice(fragments) for _ in range(rng.randint(0, 40)))
+            text = text.replace('\r', '')
+            self.assertEqual(_parse_quietly(parse_buffer, text), _parse_quietly(parse_lines, text.split('\n')),
+                             repr(text))
+
+    def test_file(self):
+        text = """\r
+- Task A (X) [userA]\r
+    * first line\r
+    * second line\r
+    + Sub-task A1\t[userB]  \r
+- [userA]
+    + Sub-task A2
+\t* description of Sub-task A2
+"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, 'plan.txt')
+            with open(src, 'wt', newline='') as src_file:
+                src_file.write(text)
+            issues = _parse_quietly(parse_issues, src, True)
+            self.assertEqual(issues, _parse_quietly(parse_issues, src))
+            self.assertEqual(issues[0]["description"], "* first line\n* second line\n")
+            self.assertEqual(issues[0]["sub_issues"][0]["assignee"], "userB")
+            self.assertEqual(issues[0]["sub_issues"][1]["line"], 7)
+            # streamed in blocks smaller than a line
+            with mock.patch('text2jira.PARSE_BLOCK_SIZE', 7):
+                self.assertEqual(_parse_quietly(lambda: list(iter_parse_issues(src, True))), issues)
+            with open(src, 'wt'):
+                pass
+            self.assertEqual(parse_issues(src, True), [])
+
+
+class TestParseParallel(unittest.TestCase):
+    def test_same_as_sequential(self):
+        # empty tasks and tasks of an assignee only aren't chunk boundaries: what follows belongs to the task before
+        fragments = ['- Task', '-', '- [userA]', '- (X)', '+ Sub-task', '+', '* description', '*', '', '  ', 'x',
+                     '- Task [userB]', '    + Sub-task [userA]', '        * description']
+        rng = random.Random(1)
+        for _ in range(3):
+            lines = ['- First task'] + [rng.choice(fragments) for _ in range(2000)]
+            expected = _parse_quietly(parse_lines, lines)
+            self.assertEqual(_parse_quietly(parse_lines_parallel, lines, 3), expected)
+            self.assertEqual(_parse_quietly(parse_buffer_parallel, '\n'.join(lines), 3), expected)
+
+    def test_sub_task_without_parent(self):
+        lines = ['+ Sub-task'] + ['- Task {}'.format(i) for i in range(100)]
+        for parse, plan in ((parse_lines_parallel, lines), (parse_buffer_parallel, '\n'.join(lines))):
+            with self.assertRaises(Exception) as context:
+                parse(plan, 2)
+            self.assertEqual(str(context.exception), 'Sub-task \'Sub-task\' has no parent task.')
 
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, 'plan.txt')
+            with open(src, 'wt') as src_file:
+                src_file.write('\n'.join('- Task {} [user{}]\n    + Sub-task {}\n        * detail'.format(i, i % 3, i)
+                                         for i in range(500)))
+            for fast in (False, True):
+                issues = parse_issues(src, fast, processes=2)
+                self.assertEqual(issues, parse_issues(src, fast))
+                self.assertEqual(issues[499].sub_issues[0].line, 1499)
@@ -0,0 +1,179 @@
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import text2jira
+from fake_jira import FakeJiraError
+from temp_db import TempDbTestCase
+from text2jira import RateGovernor
+
+
+class _BusyServerError(FakeJiraError):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(status_code, 'busy')
+        self.response = SimpleNamespace(headers={'Retry-After': retry_after} if retry_after is not None else {})
+
+
+def _flaky(errors, result='done'):
+    calls = []
+
+    def _call():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return _call, calls
+
+
+class TestRateGovernor(TempDbTestCase):
+
+    def test_parse_retry_after(self):
+        self.assertEqual(text2jira._parse_retry_after('3'), 3.0)
+        self.assertIsNone(text2jira._parse_retry_after(None))
+        self.assertIsNone(text2jira._parse_retry_after('soon'))
+        http_date = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 60))
+        self.assertAlmostEqual(text2jira._parse_retry_after(http_date), 60, delta=2)
+
+    def test_backoff(self):
+        governor = RateGovernor('http://jira.local', shared=False)
+        call, calls = _flaky([_BusyServerError(503), _BusyServerError(502)])
+        with mock.patch.object(text2jira.time, 'sleep') as sleep:
+            self.assertEqual(governor.call(call), 'done')
+        self.assertEqual(len(calls), 3)
+        delays = [sleep_call.args[0] for sleep_call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertLessEqual(delays[0], text2jira.BACKOFF_BASE)
+        self.assertLessEqual(delays[1], text2jira.BACKOFF_BASE * 2)
+        # a busy server isn't throttling
+        self.assertIsNone(governor.rate)
+
+    def test_errors_not_retried(self):
+        governor = RateGovernor('http://jira.local', shared=False)
+        call, calls = _flaky([FakeJiraError(404, 'not found')])
+        with self.assertRaises(FakeJiraError):
+            governor.call(call)
+        self.assertEqual(len(calls), 1)
+        call, calls = _flaky([_BusyServerError(503)] * (text2jira.MAX_RETRIES + 1))
+        with mock.patch.object(text2jira.time, 'sleep'), self.assertRaises(FakeJiraError):
+            governor.call(call)
+        self.assertEqual(len(calls), text2jira.MAX_RETRIES + 1)
+
+    def test_non_idempotent_requests(self):
+        governor = RateGovernor('http://jira.local', shared=False)
+        for error in (_BusyServerError(502), _BusyServerError(504), ConnectionResetError('reset')):
+            call, calls = _flaky([error])
+            with mock.patch.object(text2jira.time, 'sleep'), self.assertRaises(type(error)):
+                governor.call(call, idempotent=False)
+            self.assertEqual(len(calls), 1)
+            # the same request sent again is harmless when idempotent
+            call, calls = _flaky([error])
+            with mock.patch.object(text2jira.time, 'sleep'):
+                self.assertEqual(governor.call(call), 'done')
+            self.assertEqual(len(calls), 2)
+        # the server didn't process a request answered with a 503
+        call, calls = _flaky([_BusyServerError(503)])
+        with mock.patch.object(text2jira.time, 'sleep'):
+            self.assertEqual(governor.call(call, idempotent=False), 'done')
+
+    def test_govern(self):
+        import requests
+        sent = []
+
+        def _request(method, url, **kwargs):
+            sent.append(method)
+            if len(sent) == 1:
+                raise requests.ConnectionError('reset')
+            return 'response'
+
+        jira = SimpleNamespace(_session=SimpleNamespace(request=_request, max_retries=3))
+        text2jira._govern(jira, RateGovernor('http://jira.local', shared=False))
+        self.assertEqual(jira._session.max_retries, 0)
+        with mock.patch.object(text2jira.time, 'sleep'):
+            self.assertEqual(jira._session.request('GET', 'http://jira.local/rest/api/2/project'), 'response')
+        self.assertEqual(sent, ['GET', 'GET'])
+        del sent[:]
+        with self.assertRaises(requests.ConnectionError):
+            jira._session.request('POST', 'http://jira.local/rest/api/2/issue/bulk')
+        self.assertEqual(sent, ['POST'])
+
+    def test_govern_responses(self):
+        # a session returning the error statuses instead of raising them (jira 1.x)
+        responses = [SimpleNamespace(status_code=429, headers={'Retry-After': '0'}),
+                     SimpleNamespace(status_code=502, headers={}), SimpleNamespace(status_code=201, headers={})]
+        sent = []
+
+        def _request(method, url, **kwargs):
+            sent.append(method)
+            return responses[len(sent) - 1]
+
+        governor = RateGovernor('http://jira.local', shared=False)
+        jira = SimpleNamespace(_session=SimpleNamespace(request=_request, max_retries=3))
+        text2jira._govern(jira, governor)
+        self.assertIs(jira._session.request('POST', 'http://jira.local/rest/api/2/issue/bulk'), responses[1])
+        self.assertEqual(sent, ['POST', 'POST'])
+        self.assertIsNotNone(governor.rate)
+        # the last answer is returned for the session to report it
+        responses[:] = [SimpleNamespace(status_code=503, headers={})] * (text2jira.MAX_RETRIES + 1)
+        del sent[:]
+        with mock.patch.object(text2jira.time, 'sleep'):
+            self.assertEqual(jira._session.request('GET', 'http://jira.local/rest/api/2/project').status_code, 503)
+        self.assertEqual(len(sent), text2jira.MAX_RETRIES + 1)
+
+    def test_retry_after(self):
+        governor = RateGovernor('http://jira.local', shared=False)
+        call, calls = _flaky([_BusyServerError(429, '0.2')])
+        start = time.monotonic()
+        self.assertEqual(governor.call(call), 'done')
+        self.assertGreaterEqual(calls[1] - start, 0.2)
+        self.assertIsNotNone(governor.rate)
+        # a server under maintenance: the retries wait without slowing down
+        governor = RateGovernor('http://jira.local', shared=False)
+        call, calls = _flaky([_BusyServerError(503, '0.2'), _BusyServerError(503, '0.2')])
+        start = time.monotonic()
+        self.assertEqual(governor.call(call), 'done')
+        self.assertGreaterEqual(calls[1] - start, 0.2)
+        self.assertGreaterEqual(calls[2] - calls[1], 0.2)
+        self.assertIsNone(governor.rate)
+
+    def test_throttling(self):
+        governor = RateGovernor('http://jira.local', shared=False)
+        sent_at = [governor.acquire() for _ in range(20)]
+        governor.throttled(sent_at=sent_at[-1])
+        rate = governor.rate
+        # requests sent before the slow down were sent too fast already
+        governor.throttled(sent_at=sent_at[-2])
+        self.assertEqual(governor.rate, rate)
+        governor.throttled(sent_at=governor.acquire())
+        self.assertEqual(governor.rate, max(text2jira.MIN_RATE, rate / 2))
+        rate = governor.rate
+        governor.succeeded()
+        self.assertGreater(governor.rate, rate)
+
+    def test_rate(self):
+        governor = RateGovernor('http://jira.local', shared=False)
+        governor.throttled()
+        governor._rate = 50.0
+        start = time.monotonic()
+        for _ in range(26):
+            governor.acquire()
+        self.assertAlmostEqual(time.monotonic() - start, 0.5, delta=0.1)
+
+    def test_shared_state(self):
+        governor = RateGovernor('http://jira.local')
+        for _ in range(20):
+            governor.acquire()
+        governor.throttled(retry_after=0.3)
+        # another process, or the next run
+        other_governor = RateGovernor('http://jira.local')
+        self.assertEqual(other_governor.rate, governor.rate)
+        start = time.monotonic()
+        other_governor.acquire()
+        self.assertGreater(time.monotonic() - start, 0.1)
+        self.assertIsNone(RateGovernor('http://other.local').rate)
+
+    def test_one_governor_per_server(self):
+        with mock.patch.dict(RateGovernor._governors, clear=True):
+            governor = RateGovernor.for_server('http://jira.local')
+            self.assertIs(RateGovernor.for_server('http://jira.local'), governor)
+            self.assertIsNot(RateGovernor.for_server('http://other.local'), governor)
@@ -0,0 +1,109 @@
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import text2jira_storage
+from fake_jira_server import FakeJiraServer
+from temp_db import TempDbTestCase
+from text2jira_service import Text2JiraService, make_server
+
+
+class TestService(TempDbTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakeJiraServer().start()
+        self.addCleanup(self.server.stop)
+        text2jira_storage.add_server_conn(self.server.url, 'user', 'password')
+        self.service = Text2JiraService(job_workers=1)
+        self.addCleanup(self.service.close)
+        httpd = make_server(self.service, port=0)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        self.url = 'http://{}:{}'.format(*httpd.server_address[:2])
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def _submit(self, plan, **options):
+        return self._request('POST', '/jobs', dict(dict(server=1, plan=plan, project_name='Project', board_name='Board',
+                                                        assignee_key='default', components=['Backend'],
+                                                        epic_link='Epic'), **options))
+
+    def test_jobs(self):
+        self.assertEqual(self._request('GET', '/servers'), (200, [dict(id=1, url=self.server.url)]))
+        status, job = self._submit('- Task A (X)\n    + Sub-task A1\n- Task B\n', wait=True)
+        self.assertEqual(status, 200)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['progress'], dict(done=3, total=3))
+        keys = {issue['summary']: issue['key'] for issue in job['issues']}
+        self.assertEqual(self.server.epic_issues['PRJ-1'], [keys['Task A'], keys['Task B']])
+        self.assertEqual(self.server.sprint_issues[1], [keys['Task A']])
+        self.assertEqual(self._request('GET', '/jobs/{}'.format(job['id'])), (200, job))
+
+        # the next jobs reuse the client and the resolutions of the first one
+        self.server.requests.clear()
+        status, job = self._submit('- Task C\n', server=self.server.url)
+        self.assertEqual(status, 202)
+        self.assertTrue(self.service.job(job['id']).finished.wait(10))
+        self.assertEqual(self._request('GET', '/jobs/{}'.format(job['id']))[1]['status'], 'done')
+        self.assertEqual(set(self.server.requests), {'bulk_create', 'add_to_epic'})
+
+    def test_failures(self):
+        self.assertEqual(self._submit('+ Sub-task\n'), (400, dict(error='Sub-task \'Sub-task\' has no parent task.')))
+        self.assertEqual(self._submit('- Task\n', server=2)[0], 400)
+        self.assertEqual(self._submit('- Task\n', project_name=None), (400, dict(error='\'project_name\' is required')))
+        self.assertEqual(self._request('GET', '/jobs/42'), (404, dict(error='unknown job: 42')))
+        self.assertEqual(self._submit('- Task\n', server={'id': 1})[0], 400)
+        self.assertEqual(self._submit('- Task\n', components='Backend'),
+                         (400, dict(error='\'components\' is a list of strings')))
+        self.assertEqual(self._submit(['- Task\n'])[0], 400)
+        self.assertEqual(self._request('POST', '/jobs', ['- Task\n'])[0], 400)
+        status, job = self._submit('- Task [nobody]\n', wait=True)
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('\'nobody\' (line 1)', job['error'])
+
+    def test_cancel(self):
+        self.server.latency = 0.2
+        self._submit('- Task A\n')
+        _, job = self._submit('- Task B\n')
+        self.assertEqual(self._request('DELETE', '/jobs/{}'.format(job['id']))[0], 200)
+        self.assertTrue(self.service.job(job['id']).finished.wait(10))
+        self.assertEqual(self._request('GET', '/jobs/{}'.format(job['id']))[1]['status'], 'cancelled')
+        self.assertEqual([fields['summary'] for fields in self.server.issues_of_type('Task').values()], ['Task A'])
+
+    def test_unexpected_errors(self):
+        connection = http.client.HTTPConnection(*self.url[len('http://'):].split(':'))
+        self.addCleanup(connection.close)
+        connection.putrequest('POST', '/jobs')
+        connection.putheader('Content-Length', 'many')
+        connection.endheaders()
+        response = connection.getresponse()
+        self.assertEqual((response.status, json.loads(response.read())), (400, dict(error='invalid Content-Length')))
+        with mock.patch.object(self.service, 'servers', side_effect=RuntimeError('boom')):
+            self.assertEqual(self._request('GET', '/servers'), (500, dict(error='RuntimeError: boom')))
+
+    def test_token(self):
+        with self.assertRaises(Exception):
+            make_server(self.service, host='0.0.0.0', port=0)
+        httpd = make_server(self.service, host='0.0.0.0', port=0, token='secret')
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        url = 'http://127.0.0.1:{}/servers'.format(httpd.server_address[1])
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            urllib.request.urlopen(url)
+        error = context.exception
+        self.assertEqual((error.code, json.loads(error.read())), (401, dict(error='unauthorized')))
+        request = urllib.request.Request(url, headers={'Authorization': 'Bearer secret'})
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(json.loads(response.read()), [dict(id=1, url=self.server.url)])
@@ -0,0 +1,61 @@
+import sqlite3
+import threading
+
+from temp_db import TempDbTestCase
+from text2jira_storage import (SCHEMA_VERSION, add_server_conn, find_server_conn, get_connection, list_server_conns,
+                               remove_server_conn, transaction)
+
+
+class TestStorage(TempDbTestCase):
+    def test_migrate_unversioned_database(self):
+        # a database of the first versions of text2jira
+        conn = sqlite3.connect(self.db)
+        conn.execute('''CREATE TABLE server_conns
+                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url VARCHAR(100) NOT NULL,
+                        user VARCHAR(100) NOT NULL,
+                        password VARCHAR(100) NOT NULL)''')
+        conn.execute('INSERT INTO server_conns (url, user, password) VALUES (?, ?, ?)', ('http://jira.local', 'u', 'p'))
+        conn.commit()
+        conn.close()
+        conn = get_connection()
+        self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], SCHEMA_VERSION)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('server_conns_url', indexes)
+        self.assertIn('metadata_cache_expires_at', indexes)
+        self.assertEqual(list_server_conns(), [dict(id=1, url='http://jira.local', user='u', password='p')])
+
+    def test_connection_per_thread(self):
+        conn = get_connection()
+        self.assertIs(get_connection(), conn)
+        other_conns = []
+        thread = threading.Thread(target=lambda: other_conns.append(get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_conns[0], conn)
+
+    def test_concurrent_writes(self):
+        def _write(thread_no):
+            for i in range(50):
+                with transaction() as conn:
+                    conn.execute('''INSERT INTO journal
+                                    (server_url, project_key, source, content_hash, issue_key, created_at)
+                                    VALUES (?, ?, ?, ?, ?, ?)''',
+                                 ('http://jira.local', 'PRJ', 'plan.txt', '{}-{}'.format(thread_no, i), 'PRJ-1', 0.0))
+
+        threads = [threading.Thread(target=_write, args=(thread_no,)) for thread_no in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(get_connection().execute('SELECT COUNT(*) FROM journal').fetchone()[0], 400)
+
+    def test_server_conns(self):
+        first_id = add_server_conn('http://jira.local', 'u', 'p')
+        second_id = add_server_conn('http://other.local', 'v', 'q')
+        self.assertEqual(find_server_conn(second_id)['url'], 'http://other.local')
+        self.assertEqual(find_server_conn('http://jira.local')['id'], first_id)
+        self.assertIsNone(find_server_conn('http://unknown.local'))
+        remove_server_conn(first_id)
+        self.assertEqual([server_conn['id'] for server_conn in list_server_conns()], [second_id])